@@ -0,0 +1,208 @@
+/**
+ * Replays a recording of the BlackBoxRecorder offline:
+ *  - lists the sources with the number of records and the recorded cycles
+ *  - prints the statistics of the recorded cycle timing
+ *  - feeds the recorded present values of the servos through the register decoding and the ServoConversion and the
+ *    recorded IMU data through the float decoding, measures the CPU time per record and prints a checksum of the
+ *    decoded values, which has to stay the same when the decoding is changed
+ *
+ * Usage: black_box_replay file [repetitions]
+ */
+#include <dynamixel_driver.h>
+
+#include <algorithm>
+#include <bitbots_ros_control/black_box_recorder.hpp>
+#include <bitbots_ros_control/servo_conversion.hpp>
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <vector>
+
+using Clock = std::chrono::steady_clock;
+using namespace bitbots_ros_control;
+
+struct SourceRecords {
+  std::vector<const uint8_t *> data;
+  std::vector<uint32_t> lengths;
+  uint64_t bytes = 0;
+  uint64_t first_cycle = 0;
+  uint64_t last_cycle = 0;
+};
+
+template <typename RecordFunction>
+double nanosecondsPerRecord(const SourceRecords &records, int repetitions, RecordFunction decode) {
+  auto start = Clock::now();
+  for (int repetition = 0; repetition < repetitions; repetition++) {
+    for (size_t i = 0; i < records.data.size(); i++) {
+      decode(records.data[i], records.lengths[i]);
+    }
+  }
+  return std::chrono::duration<double, std::nano>(Clock::now() - start).count() /
+         std::max<double>(1, double(records.data.size()) * repetitions);
+}
+
+static float decodeFloat(const uint8_t *data) {
+  uint32_t bits = uint32_t(data[0]) | uint32_t(data[1]) << 8 | uint32_t(data[2]) << 16 | uint32_t(data[3]) << 24;
+  float value;
+  memcpy(&value, &bits, sizeof(value));
+  return value;
+}
+
+static bool startsWith(const char *name, const char *prefix) { return strncmp(name, prefix, strlen(prefix)) == 0; }
+
+void replayServos(const black_box::Source &source, const SourceRecords &records, DynamixelDriver &driver,
+                  int repetitions) {
+  black_box::ServoInfo info;
+  memcpy(&info, source.info, std::min(sizeof(info), size_t(source.info_length)));
+  std::vector<uint8_t> ids(info.ids, info.ids + info.joint_count);
+  ServoConversion conversion;
+  conversion.init(driver, ids, std::vector<double>(ids.size(), 0.0));
+  std::vector<int32_t> values(ids.size());
+  std::vector<double> converted(ids.size());
+  double checksum = 0;
+  double ns = nanosecondsPerRecord(records, repetitions, [&](const uint8_t *data, uint32_t length) {
+    if (length < size_t(info.stride) * info.joint_count) {
+      return;
+    }
+    for (size_t i = 0; i < info.register_count; i++) {
+      decodeRegister(data, info.stride, info.registers[i][1], info.registers[i][2], ids.size(), values.data());
+      // see ServoBusInterface::PresentValue
+      switch (info.registers[i][0]) {
+        case 0:
+          for (size_t j = 0; j < ids.size(); j++) {
+            converted[j] = values[j] / 885.0;
+          }
+          break;
+        case 1:
+          conversion.valueToTorque(values.data(), converted.data());
+          break;
+        case 2:
+          conversion.valueToVelocity(values.data(), converted.data());
+          break;
+        case 3:
+          conversion.valueToPosition(values.data(), converted.data());
+          break;
+      }
+      for (double value : converted) {
+        checksum += value;
+      }
+    }
+  });
+  printf("  %-32s %9.1f ns per record, checksum %.6g\n", source.name, ns, checksum / repetitions);
+}
+
+void replayImu(const black_box::Source &source, const SourceRecords &records, int repetitions) {
+  double checksum = 0;
+  size_t valid = 0;
+  double ns = nanosecondsPerRecord(records, repetitions, [&](const uint8_t *data, uint32_t length) {
+    if (length < 40) {
+      return;
+    }
+    float values[10];
+    for (size_t i = 0; i < 10; i++) {
+      values[i] = decodeFloat(data + 4 * i);
+    }
+    // like the IMU interface, samples without orientation are not used
+    if (values[6] + values[7] + values[8] + values[9] != 0) {
+      valid++;
+      for (float value : values) {
+        checksum += value;
+      }
+    }
+  });
+  printf("  %-32s %9.1f ns per record, %zu valid samples, checksum %.6g\n", source.name, ns, valid / repetitions,
+         checksum / repetitions);
+}
+
+void printCycles(const SourceRecords &records) {
+  if (records.data.empty()) {
+    return;
+  }
+  std::vector<double> periods, reads, writes;
+  for (const uint8_t *data : records.data) {
+    black_box::CycleTiming timing;
+    memcpy(&timing, data, sizeof(timing));
+    periods.push_back(timing.period_ns / 1e6);
+    reads.push_back(timing.read_ns / 1e6);
+    writes.push_back(timing.write_ns / 1e6);
+  }
+  printf("cycle timing of %zu cycles [ms]:\n", periods.size());
+  for (std::pair<const char *, std::vector<double> *> values :
+       {std::make_pair("period", &periods), std::make_pair("read", &reads), std::make_pair("write", &writes)}) {
+    std::vector<double> &v = *values.second;
+    std::sort(v.begin(), v.end());
+    double mean = 0;
+    for (double value : v) {
+      mean += value / v.size();
+    }
+    printf("  %-8s mean %7.3f  p50 %7.3f  p99 %7.3f  max %7.3f\n", values.first, mean, v[v.size() / 2],
+           v[std::min(v.size() - 1, v.size() * 99 / 100)], v.back());
+  }
+}
+
+int main(int argc, char *argv[]) {
+  if (argc < 2) {
+    printf("Usage: black_box_replay file [repetitions]\n");
+    return 1;
+  }
+  int repetitions = argc > 2 ? std::max(1, atoi(argv[2])) : 100;
+  BlackBoxReader reader;
+  if (!reader.open(argv[1])) {
+    printf("%s is not a black box recording\n", argv[1]);
+    return 1;
+  }
+  const black_box::FileHeader &header = reader.header();
+  std::vector<SourceRecords> sources(header.source_count);
+  bool complete = reader.forEach([&](const black_box::RecordHeader &record, const uint8_t *data) {
+    SourceRecords &records = sources[record.source];
+    if (records.data.empty()) {
+      records.first_cycle = record.cycle;
+    }
+    records.data.push_back(data);
+    records.lengths.push_back(record.length);
+    records.bytes += record.length;
+    records.last_cycle = record.cycle;
+  });
+  if (!complete) {
+    printf("the recording is damaged, only the records before the damage are used\n");
+  }
+  printf("%lu records in %.1f MB, %u sources:\n", (unsigned long)header.record_count, header.capacity / 1e6,
+         header.source_count);
+  for (size_t i = 0; i < sources.size(); i++) {
+    printf("  %-32s %8zu records %10lu bytes  cycles %lu-%lu\n", header.sources[i].name, sources[i].data.size(),
+           (unsigned long)sources[i].bytes, (unsigned long)sources[i].first_cycle,
+           (unsigned long)sources[i].last_cycle);
+  }
+
+  // the servos have to be known to the driver for the conversion
+  DynamixelDriver driver;
+  for (size_t i = 0; i < sources.size(); i++) {
+    const black_box::Source &source = header.sources[i];
+    if (strcmp(source.name, "devices") == 0) {
+      for (size_t j = 0; j < source.info_length / sizeof(black_box::DeviceInfo); j++) {
+        black_box::DeviceInfo device;
+        memcpy(&device, source.info + j * sizeof(device), sizeof(device));
+        driver.setTools(device.model_number, device.id);
+      }
+    }
+  }
+
+  printf("decoding, %d repetitions:\n", repetitions);
+  for (size_t i = 0; i < sources.size(); i++) {
+    const black_box::Source &source = header.sources[i];
+    if (startsWith(source.name, "servo present")) {
+      replayServos(source, sources[i], driver, repetitions);
+    } else if (startsWith(source.name, "imu")) {
+      replayImu(source, sources[i], repetitions);
+    }
+  }
+  for (size_t i = 0; i < sources.size(); i++) {
+    if (strcmp(header.sources[i].name, "cycle") == 0) {
+      printCycles(sources[i]);
+    }
+  }
+  return complete ? 0 : 1;
+}
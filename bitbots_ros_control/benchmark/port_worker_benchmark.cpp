@@ -0,0 +1,180 @@
+/**
+ * Compares the timing of the control loop for different ways of accessing the buses:
+ *  - spawn per cycle: a new thread per port for every read and write (the old behavior of WolfgangHardwareInterface)
+ *  - worker pool: the persistent PortWorkerPool
+ *  - pipelined: the worker pool, but the next read starts directly after the write of each port
+ * The buses are simulated by blocking each port for the time that the transfer would take at the given baudrate.
+ * The ROS callbacks (spin_some) are simulated by busy waiting for the given time.
+ * For each mode the cycle period jitter and a breakdown of the time spent in each phase of the loop is printed.
+ *
+ * Usage: port_worker_benchmark [ports] [control_loop_hz] [cycles] [baudrate] [read_bytes] [write_bytes] [callback_us]
+ */
+#include <algorithm>
+#include <bitbots_ros_control/port_worker_pool.hpp>
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <numeric>
+#include <thread>
+#include <vector>
+
+using Clock = std::chrono::steady_clock;
+
+enum Phase { READ, WRITE, WRITE_READ };
+
+struct SimulatedBus {
+  int baudrate;
+  int read_bytes;
+  int write_bytes;
+
+  void transfer(int bytes) const {
+    // 10 bits per byte (start, 8 data, stop) plus a fixed latency for the USB to serial adapter
+    std::this_thread::sleep_for(std::chrono::nanoseconds(int64_t(bytes * 10 * 1e9 / baudrate) + 20000));
+  }
+  void read() const { transfer(read_bytes); }
+  void write() const { transfer(write_bytes); }
+};
+
+struct Statistics {
+  double mean, stddev, p50, p99, max;
+};
+
+Statistics computeStatistics(std::vector<double> values) {
+  Statistics stats{};
+  if (values.empty()) {
+    return stats;
+  }
+  std::sort(values.begin(), values.end());
+  stats.mean = std::accumulate(values.begin(), values.end(), 0.0) / values.size();
+  double sq_sum = 0;
+  for (double v : values) {
+    sq_sum += (v - stats.mean) * (v - stats.mean);
+  }
+  stats.stddev = std::sqrt(sq_sum / values.size());
+  stats.p50 = values[values.size() / 2];
+  stats.p99 = values[std::min(values.size() - 1, size_t(values.size() * 0.99))];
+  stats.max = values.back();
+  return stats;
+}
+
+double microseconds(Clock::time_point a, Clock::time_point b) {
+  return std::chrono::duration<double, std::micro>(b - a).count();
+}
+
+void busyWait(double us) {
+  auto end = Clock::now() + std::chrono::nanoseconds(int64_t(us * 1000));
+  while (Clock::now() < end) {
+  }
+}
+
+template <typename ReadFunction, typename WriteFunction>
+void runLoop(const char *name, double hz, int cycles, double callback_us, ReadFunction read, WriteFunction write) {
+  std::vector<double> periods, read_times, write_times, callback_times, sleep_times;
+  auto period = std::chrono::nanoseconds(int64_t(1e9 / hz));
+  auto next = Clock::now() + period;
+  auto last_start = Clock::now();
+  int missed_deadlines = 0;
+  for (int i = 0; i < cycles; i++) {
+    auto start = Clock::now();
+    read();
+    auto read_end = Clock::now();
+    write();
+    auto write_end = Clock::now();
+    busyWait(callback_us);
+    auto callback_end = Clock::now();
+    if (callback_end > next) {
+      missed_deadlines++;
+      // do not try to catch up, start the next cycle directly
+      next = callback_end;
+    }
+    std::this_thread::sleep_until(next);
+    auto sleep_end = Clock::now();
+    next += period;
+
+    if (i > 0) {
+      periods.push_back(microseconds(last_start, start));
+    }
+    read_times.push_back(microseconds(start, read_end));
+    write_times.push_back(microseconds(read_end, write_end));
+    callback_times.push_back(microseconds(write_end, callback_end));
+    sleep_times.push_back(microseconds(callback_end, sleep_end));
+    last_start = start;
+  }
+  // jitter is the absolute deviation of the measured period from the desired period
+  std::vector<double> jitter;
+  for (double p : periods) {
+    jitter.push_back(std::abs(p - 1e6 / hz));
+  }
+  printf("%s (%d of %d deadlines missed)\n", name, missed_deadlines, cycles);
+  printf("  %-10s %9s %9s %9s %9s\n", "[us]", "mean", "stddev", "p99", "max");
+  auto print = [](const char *phase, const std::vector<double> &values) {
+    Statistics s = computeStatistics(values);
+    printf("  %-10s %9.1f %9.1f %9.1f %9.1f\n", phase, s.mean, s.stddev, s.p99, s.max);
+  };
+  print("period", periods);
+  print("jitter", jitter);
+  print("read", read_times);
+  print("write", write_times);
+  print("callbacks", callback_times);
+  print("sleep", sleep_times);
+}
+
+int main(int argc, char *argv[]) {
+  size_t ports = argc > 1 ? atoi(argv[1]) : 4;
+  double hz = argc > 2 ? atof(argv[2]) : 500.0;
+  int cycles = argc > 3 ? atoi(argv[3]) : 5000;
+  SimulatedBus bus{argc > 4 ? atoi(argv[4]) : 1000000, argc > 5 ? atoi(argv[5]) : 120, argc > 6 ? atoi(argv[6]) : 70};
+  double callback_us = argc > 7 ? atof(argv[7]) : 300;
+  printf("%zu ports, %.0f Hz, %d cycles, %d baud, %d bytes read and %d bytes written per port, %.0f us callbacks\n",
+         ports, hz, cycles, bus.baudrate, bus.read_bytes, bus.write_bytes, callback_us);
+
+  // old behavior: a new thread per port for every read and every write
+  auto spawn = [&](bool reading) {
+    std::vector<std::thread> threads;
+    for (size_t port = 0; port < ports; port++) {
+      threads.emplace_back([&bus, reading]() { reading ? bus.read() : bus.write(); });
+    }
+    for (std::thread &thread : threads) {
+      thread.join();
+    }
+  };
+  runLoop(
+      "spawn per cycle", hz, cycles, callback_us, [&]() { spawn(true); }, [&]() { spawn(false); });
+
+  // persistent workers
+  bitbots_ros_control::PortWorkerPool pool;
+  pool.start(ports, [&bus, &pool](size_t port, int phase) {
+    if (phase == READ) {
+      bus.read();
+    } else if (phase == WRITE) {
+      bus.write();
+    } else if (phase == WRITE_READ) {
+      bus.write();
+      pool.signalHandoff(port);
+      bus.read();
+    }
+  });
+  runLoop(
+      "worker pool", hz, cycles, callback_us, [&]() { pool.run(READ); }, [&]() { pool.run(WRITE); });
+
+  // persistent workers which read the next cycle directly after writing
+  bool reads_in_flight = false;
+  runLoop(
+      "pipelined", hz, cycles, callback_us,
+      [&]() {
+        if (reads_in_flight) {
+          pool.wait();
+          reads_in_flight = false;
+        } else {
+          pool.run(READ);
+        }
+      },
+      [&]() {
+        pool.dispatch(WRITE_READ);
+        pool.waitHandoff();
+        reads_in_flight = true;
+      });
+  pool.wait();
+  return 0;
+}
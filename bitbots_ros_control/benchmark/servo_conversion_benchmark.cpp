@@ -0,0 +1,131 @@
+/**
+ * Compares the CPU time per control cycle that the unit conversions of the servos take:
+ *  - driver: calling the conversion functions of the driver for each joint, like ServoBusInterface did before
+ *  - tables: the per joint tables of ServoConversion
+ * One cycle converts the read positions, velocities and efforts and the goal positions, velocities and currents of all
+ * servos. The largest difference between both ways is printed as well.
+ *
+ * Usage: servo_conversion_benchmark [servos] [cycles]
+ */
+#include <dynamixel_driver.h>
+
+#include <algorithm>
+#include <bitbots_ros_control/servo_conversion.hpp>
+#include <chrono>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <random>
+#include <vector>
+
+using Clock = std::chrono::steady_clock;
+
+struct JointValues {
+  std::vector<int32_t> present_position, present_velocity, present_current;
+  std::vector<double> position, velocity, effort;
+  std::vector<int32_t> goal_position, goal_velocity, goal_current;
+};
+
+template <typename CycleFunction>
+double nanosecondsPerCycle(int cycles, CycleFunction cycle) {
+  // the first cycles warm up the caches
+  for (int i = 0; i < cycles / 10; i++) {
+    cycle();
+  }
+  auto start = Clock::now();
+  for (int i = 0; i < cycles; i++) {
+    cycle();
+  }
+  return std::chrono::duration<double, std::nano>(Clock::now() - start).count() / cycles;
+}
+
+int main(int argc, char *argv[]) {
+  size_t servos = argc > 1 ? atoi(argv[1]) : 20;
+  int cycles = argc > 2 ? atoi(argv[2]) : 100000;
+  printf("%zu servos, %d cycles\n", servos, cycles);
+
+  // mix of MX-64 and MX-106 like on Wolfgang, with random offsets
+  DynamixelDriver driver;
+  std::vector<uint8_t> ids;
+  std::vector<double> offsets;
+  std::mt19937 random(42);
+  std::uniform_real_distribution<double> offset_distribution(-0.2, 0.2);
+  for (size_t i = 0; i < servos; i++) {
+    ids.push_back(i + 1);
+    driver.setTools(i % 3 == 0 ? 321 : 311, i + 1);
+    offsets.push_back(offset_distribution(random));
+  }
+  bitbots_ros_control::ServoConversion conversion;
+  conversion.init(driver, ids, offsets);
+
+  JointValues driver_values, table_values;
+  std::uniform_int_distribution<int32_t> position_distribution(100, 4000), value_distribution(-500, 500);
+  std::uniform_real_distribution<double> goal_distribution(-2.5, 2.5);
+  for (JointValues *values : {&driver_values, &table_values}) {
+    values->position.resize(servos);
+    values->velocity.resize(servos);
+    values->effort.resize(servos);
+    values->goal_position.resize(servos);
+    values->goal_velocity.resize(servos);
+    values->goal_current.resize(servos);
+  }
+  for (size_t i = 0; i < servos; i++) {
+    driver_values.present_position.push_back(position_distribution(random));
+    driver_values.present_velocity.push_back(value_distribution(random));
+    driver_values.present_current.push_back(value_distribution(random));
+  }
+  table_values.present_position = driver_values.present_position;
+  table_values.present_velocity = driver_values.present_velocity;
+  table_values.present_current = driver_values.present_current;
+  std::vector<double> goal_position(servos), goal_velocity(servos), goal_effort(servos);
+  for (size_t i = 0; i < servos; i++) {
+    goal_position[i] = goal_distribution(random);
+    goal_velocity[i] = std::abs(goal_distribution(random));
+    goal_effort[i] = std::abs(goal_distribution(random));
+  }
+
+  double driver_ns = nanosecondsPerCycle(cycles, [&]() {
+    JointValues &v = driver_values;
+    for (size_t i = 0; i < servos; i++) {
+      double position = driver.convertValue2Radian(ids[i], v.present_position[i]);
+      if (v.present_position[i] != 0 && position < 3.15 && position > -3.15) {
+        v.position[i] = position + offsets[i];
+      }
+      v.velocity[i] = driver.convertValue2Velocity(ids[i], v.present_velocity[i]);
+      v.effort[i] = driver.convertValue2Torque(ids[i], int16_t(v.present_current[i]));
+    }
+    for (size_t i = 0; i < servos; i++) {
+      v.goal_position[i] = driver.convertRadian2Value(ids[i], goal_position[i] - offsets[i]);
+      v.goal_velocity[i] = driver.convertVelocity2Value(ids[i], goal_velocity[i]);
+      v.goal_current[i] = driver.convertTorque2Value(ids[i], goal_effort[i]);
+    }
+  });
+
+  double table_ns = nanosecondsPerCycle(cycles, [&]() {
+    JointValues &v = table_values;
+    conversion.valueToPosition(v.present_position.data(), v.position.data());
+    conversion.valueToVelocity(v.present_velocity.data(), v.velocity.data());
+    conversion.valueToTorque(v.present_current.data(), v.effort.data());
+    conversion.positionToValue(goal_position.data(), v.goal_position.data());
+    conversion.velocityToValue(goal_velocity.data(), v.goal_velocity.data());
+    conversion.torqueToValue(goal_effort.data(), v.goal_current.data());
+  });
+
+  printf("  %-8s %9.1f ns per cycle\n", "driver", driver_ns);
+  printf("  %-8s %9.1f ns per cycle (%.1fx)\n", "tables", table_ns, driver_ns / table_ns);
+
+  // the driver calculates with floats, so small differences are expected
+  double max_si_difference = 0;
+  int32_t max_value_difference = 0;
+  for (size_t i = 0; i < servos; i++) {
+    max_si_difference = std::max({max_si_difference, std::abs(driver_values.position[i] - table_values.position[i]),
+                                  std::abs(driver_values.velocity[i] - table_values.velocity[i]),
+                                  std::abs(driver_values.effort[i] - table_values.effort[i])});
+    max_value_difference =
+        std::max({max_value_difference, std::abs(driver_values.goal_position[i] - table_values.goal_position[i]),
+                  std::abs(driver_values.goal_velocity[i] - table_values.goal_velocity[i]),
+                  std::abs(driver_values.goal_current[i] - table_values.goal_current[i])});
+  }
+  printf("largest difference: %g in SI units, %d in register values\n", max_si_difference, max_value_difference);
+  return 0;
+}
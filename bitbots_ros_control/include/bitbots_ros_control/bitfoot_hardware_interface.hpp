@@ -3,6 +3,7 @@
 
 #include <dynamixel_driver.h>
 
+#include <array>
 #include <bitbots_msgs/msg/foot_pressure.hpp>
 #include <bitbots_ros_control/hardware_interface.hpp>
 #include <diagnostic_msgs/msg/diagnostic_array.hpp>
@@ -22,13 +23,22 @@ class BitFootHardwareInterface : public bitbots_ros_control::HardwareInterface {
   void read(const rclcpp::Time &t, const rclcpp::Duration &dt);
 
   void write(const rclcpp::Time &t, const rclcpp::Duration &dt);
+  void addDeviceReads(DeviceReadScheduler *scheduler);
+  void setDiagnostics(DiagnosticsPublisher *diagnostics);
+  void setParameters(const ControlParameterCache *parameters);
+  void addScheduledTasks(CycleScheduler *scheduler, size_t port);
 
  private:
   rclcpp::Node::SharedPtr nh_;
   std::shared_ptr<DynamixelDriver> driver_;
 
-  // always keep the lasts values to check if they different
-  std::vector<std::vector<double>> current_pressure_;
+  std::array<double, 4> current_pressure_;
+  // number of reads since the value of each strain gauge changed, it is broken if the value does not change anymore
+  std::array<int, 4> unchanged_reads_;
+  int max_unchanged_reads_;
+  // false if a read failed since the last diagnostics
+  bool reads_successful_;
+  ScheduledTask diag_task_;
 
   rclcpp::Publisher<bitbots_msgs::msg::FootPressure>::SharedPtr pressure_pub_;
 
@@ -36,8 +46,12 @@ class BitFootHardwareInterface : public bitbots_ros_control::HardwareInterface {
   std::string topic_name_;
   std::string name_;
   bitbots_msgs::msg::FootPressure msg_;
-  rclcpp::Publisher<diagnostic_msgs::msg::DiagnosticArray>::SharedPtr diagnostic_pub_;
+  DiagnosticsPublisher *diagnostics_;
+  const ControlParameterCache *parameters_;
+  int diagnostic_status_;
   uint8_t *data_;
+  DeviceReadScheduler *device_reads_;
+  int device_read_handle_;
 };
 }  // namespace bitbots_ros_control
 #endif
@@ -0,0 +1,160 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_BLACK_BOX_RECORDER_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_BLACK_BOX_RECORDER_H_
+
+#include <atomic>
+#include <cstddef>
+#include <cstdint>
+#include <functional>
+#include <string>
+
+namespace bitbots_ros_control {
+
+/**
+ * Layout of the recording file, shared by the recorder and the reader.
+ * The file starts with a header which contains the sources, followed by the data area that is used as ring buffer.
+ * Each record consists of a RecordHeader and the raw data, padded to a multiple of 8 bytes.
+ */
+namespace black_box {
+const char MAGIC[8] = {'B', 'B', 'B', 'O', 'X', 'R', 'E', 'C'};
+const uint32_t VERSION = 1;
+const size_t MAX_SOURCES = 32;
+const size_t MAX_SOURCE_INFO = 220;
+// source of the record that marks the end of the used part of the data area, the next record is at its start
+const uint16_t WRAP_SOURCE = 0xffff;
+
+// something that is recorded, e.g. the present values of one servo bus
+struct Source {
+  char name[32];
+  uint32_t info_length;
+  // static information which is needed to decode the records, e.g. the register layout
+  uint8_t info[MAX_SOURCE_INFO];
+};
+
+struct FileHeader {
+  char magic[8];
+  uint32_t version;
+  uint32_t source_count;
+  // size of the data area in bytes
+  uint64_t capacity;
+  // offsets in the data area of the next record and of the oldest record
+  uint64_t head;
+  uint64_t tail;
+  uint64_t record_count;
+  Source sources[MAX_SOURCES];
+};
+
+struct RecordHeader {
+  uint32_t length;
+  uint16_t source;
+  uint16_t reserved;
+  // control cycle in which the data was recorded
+  uint64_t cycle;
+  // steady clock in nanoseconds
+  int64_t stamp;
+};
+
+// info of the servo sources, the present records contain the sync read data of all joints
+struct ServoInfo {
+  // bytes per joint in the sync read data
+  uint16_t stride;
+  uint8_t joint_count;
+  uint8_t register_count;
+  // present value (see ServoBusInterface::PresentValue), address relative to the data of the joint and length of each
+  // register in the sync read data
+  uint8_t registers[4][3];
+  uint8_t ids[64];
+};
+
+// info of the devices source, the devices that were found with their model numbers
+struct DeviceInfo {
+  uint16_t model_number;
+  uint8_t id;
+  uint8_t reserved;
+};
+
+// data of the cycle records
+struct CycleTiming {
+  int64_t period_ns;
+  int64_t read_ns;
+  int64_t write_ns;
+};
+
+inline uint64_t recordSize(uint64_t length) { return (sizeof(RecordHeader) + length + 7) / 8 * 8; }
+}  // namespace black_box
+
+/**
+ * Records the raw data of the buses and the goals of each cycle into a memory mapped file which is used as ring
+ * buffer, so that the last cycles before a problem can be analysed and replayed offline.
+ * The file is allocated completely when it is opened, recording only copies the data without system calls or
+ * allocations. The data is in the page cache, so it is kept when the process crashes.
+ * Records can be added from multiple threads, e.g. by the port workers.
+ */
+class BlackBoxRecorder {
+ public:
+  BlackBoxRecorder() = default;
+  BlackBoxRecorder(const BlackBoxRecorder &) = delete;
+  BlackBoxRecorder &operator=(const BlackBoxRecorder &) = delete;
+  ~BlackBoxRecorder();
+
+  /**
+   * Creates the file, an existing one is overwritten
+   * @param capacity size of the ring buffer in bytes
+   */
+  bool open(const std::string &path, size_t capacity);
+
+  /**
+   * Adds a source of records. Has to be called before the control loop starts.
+   * @param info static information that is needed to decode the records, at most black_box::MAX_SOURCE_INFO bytes
+   * @return index of the source for record(), -1 if there are too many sources
+   */
+  int addSource(const std::string &name, const void *info = nullptr, size_t info_length = 0);
+
+  /**
+   * Starts the next control cycle, the following records get its number
+   */
+  void nextCycle() { cycle_.fetch_add(1, std::memory_order_relaxed); }
+
+  /**
+   * Adds a record, the oldest records are overwritten when the buffer is full
+   */
+  void record(int source, const void *data, size_t length);
+
+ private:
+  void dropOldest();
+
+  uint8_t *memory_ = nullptr;
+  size_t size_ = 0;
+  black_box::FileHeader *header_ = nullptr;
+  uint8_t *data_ = nullptr;
+  std::atomic<uint64_t> cycle_{0};
+  std::atomic_flag lock_ = ATOMIC_FLAG_INIT;
+};
+
+/**
+ * Reads the records of a file of the BlackBoxRecorder from the oldest to the newest
+ */
+class BlackBoxReader {
+ public:
+  BlackBoxReader() = default;
+  BlackBoxReader(const BlackBoxReader &) = delete;
+  BlackBoxReader &operator=(const BlackBoxReader &) = delete;
+  ~BlackBoxReader();
+
+  bool open(const std::string &path);
+
+  const black_box::FileHeader &header() const { return *header_; }
+
+  /**
+   * Calls the callback with the header and the data of each record
+   * @return false if the file is damaged
+   */
+  bool forEach(const std::function<void(const black_box::RecordHeader &, const uint8_t *)> &callback) const;
+
+ private:
+  uint8_t *memory_ = nullptr;
+  size_t size_ = 0;
+  const black_box::FileHeader *header_ = nullptr;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_BLACK_BOX_RECORDER_H_
@@ -0,0 +1,63 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_BULK_READER_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_BULK_READER_H_
+
+#include <dynamixel_sdk/dynamixel_sdk.h>
+
+#include <cstdint>
+#include <string>
+#include <vector>
+
+namespace bitbots_ros_control {
+
+/**
+ * Reads raw register windows of multiple devices on one port with a single protocol 2.0 bulk read instruction.
+ * The driver can only bulk read named control table items, therefore this class uses its own handle on the serial port
+ * of the driver. It must only be used by the port worker that also uses the driver, so that the two handles never
+ * access the bus at the same time.
+ */
+class BulkReader {
+ public:
+  BulkReader();
+  ~BulkReader();
+  BulkReader(const BulkReader &) = delete;
+  BulkReader &operator=(const BulkReader &) = delete;
+
+  /**
+   * Opens the serial port with the given baudrate.
+   * @return false if the port could not be opened
+   */
+  bool open(const std::string &device_file, int baudrate);
+
+  /**
+   * Removes all windows of the last bulk read.
+   */
+  void clear();
+
+  /**
+   * Adds a window to the next bulk read. Each device may only occur once per bulk read.
+   * @param data buffer of at least length bytes in which the reply is stored
+   */
+  void addWindow(uint8_t id, uint16_t address, uint16_t length, uint8_t *data);
+
+  /**
+   * Sends the bulk read for all added windows and receives the replies in the order in which the windows were added.
+   * The devices answer one after another, so receiving stops at the first device that does not answer.
+   * @return number of windows which were received successfully
+   */
+  size_t read();
+
+ private:
+  struct Window {
+    uint8_t id;
+    uint16_t length;
+    uint8_t *data;
+  };
+
+  dynamixel::PortHandler *port_handler_;
+  dynamixel::PacketHandler *packet_handler_;
+  std::vector<Window> windows_;
+  std::vector<uint8_t> param_;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_BULK_READER_H_
@@ -22,6 +22,8 @@ class ButtonHardwareInterface : public bitbots_ros_control::HardwareInterface {
   bool init();
   void read(const rclcpp::Time &t, const rclcpp::Duration &dt);
   void write(const rclcpp::Time &t, const rclcpp::Duration &dt);
+  void addDeviceReads(DeviceReadScheduler *scheduler);
+  void setDiagnostics(DiagnosticsPublisher *diagnostics);
 
  private:
   rclcpp::Node::SharedPtr nh_;
@@ -32,8 +34,11 @@ class ButtonHardwareInterface : public bitbots_ros_control::HardwareInterface {
   std::string topic_;
   rclcpp::Publisher<bitbots_msgs::msg::Buttons>::SharedPtr button_pub_;
   int read_rate_;
-  rclcpp::Publisher<diagnostic_msgs::msg::DiagnosticArray>::SharedPtr diagnostic_pub_;
+  DiagnosticsPublisher *diagnostics_;
+  int diagnostic_status_;
   uint8_t *data_;
+  DeviceReadScheduler *device_reads_;
+  int device_read_handle_;
 };
 }  // namespace bitbots_ros_control
 
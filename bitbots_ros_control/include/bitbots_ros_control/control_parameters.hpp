@@ -0,0 +1,52 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_CONTROL_PARAMETERS_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_CONTROL_PARAMETERS_H_
+
+#include <bitbots_ros_control/triple_buffer.hpp>
+#include <rcl_interfaces/msg/set_parameters_result.hpp>
+#include <rclcpp/rclcpp.hpp>
+#include <vector>
+
+namespace bitbots_ros_control {
+
+// parameters that are used in every cycle of the control loop and can be changed while the node is running
+struct ControlParameters {
+  // write the ROM and RAM values of the servos again when the power is switched on
+  bool set_rom_ram = true;
+  // servos.write_deadband, in register units
+  int write_deadband = 0;
+  // bitfoot.max_unchanged_reads
+  int max_unchanged_reads = 10;
+};
+
+/**
+ * Snapshot of the ControlParameters, so the control loop does not have to query the parameters of the node, which
+ * locks them and looks them up by name. Changes of the parameters are handed to the control loop through a triple
+ * buffer by the on set parameters callback, the control loop takes them with update() at the start of a cycle.
+ */
+class ControlParameterCache {
+ public:
+  explicit ControlParameterCache(rclcpp::Node::SharedPtr nh);
+
+  /**
+   * Takes the latest parameters. Only called by the control loop while no port worker is running.
+   * @return true if the parameters changed
+   */
+  bool update() { return buffer_.update(); }
+
+  /**
+   * Parameters of the current cycle, they do not change until the next update()
+   */
+  const ControlParameters &get() const { return buffer_.readBuffer(); }
+
+ private:
+  rcl_interfaces::msg::SetParametersResult onSetParameters(const std::vector<rclcpp::Parameter> &parameters);
+
+  rclcpp::Node::SharedPtr nh_;
+  // latest parameters, only used by the callback
+  ControlParameters parameters_;
+  TripleBuffer<ControlParameters> buffer_;
+  rclcpp::node_interfaces::OnSetParametersCallbackHandle::SharedPtr callback_handle_;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_CONTROL_PARAMETERS_H_
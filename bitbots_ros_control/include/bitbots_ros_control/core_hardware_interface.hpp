@@ -3,6 +3,7 @@
 
 #include <dynamixel_driver.h>
 
+#include <atomic>
 #include <bitbots_ros_control/hardware_interface.hpp>
 #include <bitbots_ros_control/utils.hpp>
 #include <diagnostic_msgs/msg/diagnostic_array.hpp>
@@ -18,6 +19,9 @@ namespace bitbots_ros_control {
 
 class CoreHardwareInterface : public bitbots_ros_control::HardwareInterface {
  public:
+  // order of the values in the packed power state, followed by the voltages of the battery cells
+  enum PowerStateValue { POWER_SWITCH_STATUS, VCC, VBAT, VEXT, VDXL, CURRENT, VBAT_CELLS };
+
   explicit CoreHardwareInterface(rclcpp::Node::SharedPtr nh, std::shared_ptr<DynamixelDriver> &driver, int id,
                                  int read_rate);
 
@@ -28,6 +32,9 @@ class CoreHardwareInterface : public bitbots_ros_control::HardwareInterface {
   void read(const rclcpp::Time &t, const rclcpp::Duration &dt);
 
   void write(const rclcpp::Time &t, const rclcpp::Duration &dt);
+  void addScheduledTasks(CycleScheduler *scheduler, size_t port);
+  void setDiagnostics(DiagnosticsPublisher *diagnostics);
+  void setRecorder(BlackBoxRecorder *recorder);
 
  private:
   rclcpp::Node::SharedPtr nh_;
@@ -37,11 +44,11 @@ class CoreHardwareInterface : public bitbots_ros_control::HardwareInterface {
   std::shared_ptr<DynamixelDriver> driver_;
 
   int id_;
-  int read_rate_;
-  int read_counter_;
+  ScheduledTask read_task_;
   uint8_t *data_;
 
-  bool requested_power_status_;
+  // set by the service, which may run in another thread than the control loop
+  std::atomic<bool> requested_power_status_;
   bool last_read_successful_;
   std_msgs::msg::Bool power_switch_status_;
   std_msgs::msg::Bool power_control_status_;
@@ -52,7 +59,15 @@ class CoreHardwareInterface : public bitbots_ros_control::HardwareInterface {
   std_msgs::msg::Float64 VDXL_;
   std_msgs::msg::Float64 current_;
 
-  rclcpp::Publisher<diagnostic_msgs::msg::DiagnosticArray>::SharedPtr diagnostic_pub_;
+  // all values in one message on /core/power_state instead of one topic per value
+  bool packed_power_state_;
+  std_msgs::msg::Float64MultiArray power_state_;
+
+  DiagnosticsPublisher *diagnostics_;
+  int diagnostic_status_;
+  BlackBoxRecorder *recorder_;
+  int recorder_source_;
+  rclcpp::Publisher<std_msgs::msg::Float64MultiArray>::SharedPtr power_state_pub_;
   rclcpp::Publisher<std_msgs::msg::Bool>::SharedPtr power_pub_;
   rclcpp::Publisher<std_msgs::msg::Float64>::SharedPtr vcc_pub_;
   rclcpp::Publisher<std_msgs::msg::Float64>::SharedPtr vbat_pub_;
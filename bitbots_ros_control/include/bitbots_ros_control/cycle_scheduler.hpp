@@ -0,0 +1,82 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_CYCLE_SCHEDULER_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_CYCLE_SCHEDULER_H_
+
+#include <cstdint>
+#include <string>
+#include <vector>
+
+namespace bitbots_ros_control {
+
+/**
+ * Something that an interface does only every rate cycles, e.g. reading a register or publishing diagnostics.
+ * The offset is assigned by the CycleScheduler, so that tasks with the same rate do not all run in the same cycle.
+ */
+struct ScheduledTask {
+  int rate = 1;
+  int offset = 0;
+  // cycle counter of the scheduler at which the task is registered, all tasks are checked against the same counter
+  const uint64_t *current_cycle = nullptr;
+
+  bool isDue(uint64_t cycle) const { return (cycle + offset) % rate == 0; }
+
+  /**
+   * @return true if the task is due in the current cycle of its scheduler, a task without scheduler is always due
+   */
+  bool isDue() const { return current_cycle == nullptr || isDue(*current_cycle); }
+};
+
+/**
+ * Central plan of all low rate tasks of the hardware interfaces.
+ * The interfaces register their tasks with an estimation of the cost, the scheduler then assigns an offset to each
+ * task so that the highest load per cycle on each port is as small as possible.
+ */
+class CycleScheduler {
+ public:
+  struct Entry {
+    size_t port;
+    std::string name;
+    // estimated number of bytes that the task transfers on the bus
+    int cost;
+    ScheduledTask *task;
+  };
+
+  /**
+   * Removes all registered tasks.
+   */
+  void clear();
+
+  /**
+   * Registers a task. The task has to live as long as the scheduler is used, its rate has to be set already.
+   * @param cost estimated number of bytes transferred on the bus. Tasks that do not use the bus, like diagnostics,
+   * still take time in the worker of their port and should use a small nominal value so that they are spread as well.
+   */
+  void addTask(size_t port, const std::string &name, int cost, ScheduledTask *task);
+
+  /**
+   * Assigns the offsets of all tasks.
+   * @param stagger if false, all offsets are set to 0, so all tasks with the same rate run in the same cycle
+   */
+  void plan(bool stagger = true);
+
+  /**
+   * Advances the cycle of all tasks. Called once per control cycle before the reads of the cycle are started, also
+   * while the power is off and only the CORE is read, so the offsets of the tasks stay aligned.
+   */
+  void nextCycle() { cycle_++; }
+
+  const std::vector<Entry> &getEntries() const { return entries_; }
+
+  /**
+   * @return estimated load of each cycle in one period of the plan for the given port
+   */
+  std::vector<int> getLoad(size_t port) const;
+
+ private:
+  int getPeriod(size_t port) const;
+
+  std::vector<Entry> entries_;
+  uint64_t cycle_ = 0;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_CYCLE_SCHEDULER_H_
@@ -0,0 +1,134 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_DEVICE_READ_SCHEDULER_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_DEVICE_READ_SCHEDULER_H_
+
+#include <dynamixel_driver.h>
+
+#include <bitbots_ros_control/bulk_reader.hpp>
+#include <bitbots_ros_control/cycle_scheduler.hpp>
+#include <chrono>
+#include <cstdint>
+#include <memory>
+#include <rclcpp/rclcpp.hpp>
+#include <string>
+#include <vector>
+
+namespace bitbots_ros_control {
+
+/**
+ * Collects the register windows that the hardware interfaces on one port want to read from their devices and reads
+ * them with as few transactions per device as possible. All windows of the same device which are read with the same
+ * rate are merged into one contiguous read, so e.g. multiple interfaces of one board only cost one request and response
+ * on the bus. If the bulk read is enabled, the transactions of all devices that are due in a cycle, including the
+ * present values of the servos, are read with one bulk read instruction. Transactions that are not received in the bulk
+ * read are read individually. A device that repeatedly fails in the bulk read but answers individually is removed from
+ * the bulk read, so that it does not stop the reception of the following devices. A device that does not answer at all
+ * is only retried with an increasing backoff.
+ * The windows are read once per cycle by the port worker before the interfaces are read. The interfaces then only take
+ * their slice of the reply buffer.
+ */
+class DeviceReadScheduler {
+ public:
+  DeviceReadScheduler(std::shared_ptr<DynamixelDriver> driver, rclcpp::Logger logger);
+
+  /**
+   * Registers a register window. Has to be called before plan().
+   * @param rate the window is read every rate cycles
+   * @return handle to access the data of the window
+   */
+  int addWindow(uint8_t id, uint16_t address, uint16_t length, int rate = 1);
+
+  /**
+   * Reads all due transactions with one bulk read instead of one read per transaction. Requires protocol 2.0.
+   * @param device_file serial port of the driver, it is opened a second time for the bulk read
+   * @return false if the port could not be opened, the transactions are read individually in this case
+   */
+  bool enableBulkRead(const std::string &device_file, int baudrate);
+
+  /**
+   * Merges all registered windows into transactions.
+   * @param max_gap maximal number of unused bytes between two windows of the same device that are read together
+   */
+  void plan(uint16_t max_gap = 16);
+
+  /**
+   * Registers the transactions with a lower rate at the central scheduler, which decides in which cycles they are read.
+   * Has to be called after plan().
+   */
+  void addScheduledTasks(CycleScheduler *scheduler, size_t port);
+
+  /**
+   * Executes all transactions that are due in this cycle. Called once per cycle by the port worker.
+   */
+  void read();
+
+  /**
+   * @return true if the window was due in the current cycle, independent of the success of the read. A window of a
+   * device that is not retried in this cycle because it did not answer recently is due but not successful.
+   */
+  bool isDue(int handle) const;
+
+  /**
+   * @return true if the window was requested from its device in the current cycle
+   */
+  bool wasRead(int handle) const;
+
+  /**
+   * Copies the data of the window into the given buffer.
+   * @return false if the window was not read successfully in this cycle
+   */
+  bool getData(int handle, uint8_t *data) const;
+
+  /**
+   * @return time at which the request for the window was sent in this cycle, the device answers right after it
+   */
+  std::chrono::steady_clock::time_point getReadTime(int handle) const;
+
+  size_t getTransactionCount() const { return transactions_.size(); }
+
+  bool isBulkReadEnabled() const { return bulk_reader_ != nullptr; }
+
+ private:
+  // number of failed bulk reads of a device that answers individually, before it is removed from the bulk read
+  static constexpr int MAX_BULK_FAILURES = 3;
+  // maximal exponent of the backoff with which a device that does not answer is retried
+  static constexpr int MAX_BACKOFF_EXPONENT = 6;
+
+  void readIndividually(size_t index);
+
+  struct Window {
+    uint8_t id;
+    uint16_t address;
+    uint16_t length;
+    int rate;
+    // index of the transaction that reads this window and offset of the window in its data
+    size_t transaction;
+    uint16_t offset;
+  };
+
+  struct Transaction {
+    uint8_t id;
+    uint16_t address;
+    uint16_t length;
+    ScheduledTask task;
+    bool due;
+    bool success;
+    std::chrono::steady_clock::time_point read_time;
+    std::vector<uint8_t> data;
+    // consecutive failed reads and number of due cycles that are skipped before the next retry
+    int failures;
+    int retry_wait;
+    bool waiting;
+    bool in_bulk_read;
+    int bulk_failures;
+  };
+
+  std::shared_ptr<DynamixelDriver> driver_;
+  rclcpp::Logger logger_;
+  std::vector<Window> windows_;
+  std::vector<Transaction> transactions_;
+  std::unique_ptr<BulkReader> bulk_reader_;
+  std::vector<size_t> bulk_transactions_;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_DEVICE_READ_SCHEDULER_H_
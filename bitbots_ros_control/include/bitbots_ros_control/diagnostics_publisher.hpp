@@ -0,0 +1,110 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_DIAGNOSTICS_PUBLISHER_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_DIAGNOSTICS_PUBLISHER_H_
+
+#include <array>
+#include <atomic>
+#include <bitbots_ros_control/lock_free_queue.hpp>
+#include <chrono>
+#include <diagnostic_msgs/msg/diagnostic_array.hpp>
+#include <diagnostic_msgs/msg/diagnostic_status.hpp>
+#include <functional>
+#include <mutex>
+#include <rclcpp/rclcpp.hpp>
+#include <string>
+#include <thread>
+#include <vector>
+
+namespace bitbots_ros_control {
+
+/**
+ * Raw values of one diagnostic status, as they are measured in the control loop. It does not contain any strings, so
+ * it can be created and queued without allocations.
+ */
+struct DiagnosticRecord {
+  static const size_t MAX_VALUES = 16;
+
+  // handle of the status from DiagnosticsPublisher::addStatus
+  int status;
+  // whether the device could be read, the meaning of the values is up to the formatter of the status
+  bool success;
+  int64_t stamp;
+  std::array<double, MAX_VALUES> values;
+};
+
+/**
+ * Publishes the diagnostics of all hardware interfaces on /diagnostics.
+ * The interfaces only push DiagnosticRecords in the control loop, which is lock free. A separate thread formats them
+ * into preallocated status messages and publishes them.
+ */
+class DiagnosticsPublisher {
+ public:
+  /**
+   * Fills the message of a status from a record. The keys of the status are already set, the formatter sets the
+   * level, message and the values.
+   */
+  using Formatter = std::function<void(const DiagnosticRecord &, diagnostic_msgs::msg::DiagnosticStatus &)>;
+  /**
+   * Formatter of a status whose values are split over several records.
+   * @return true if the record completed the status, it is only published then
+   */
+  using PartialFormatter = std::function<bool(const DiagnosticRecord &, diagnostic_msgs::msg::DiagnosticStatus &)>;
+
+  explicit DiagnosticsPublisher(rclcpp::Node::SharedPtr nh, size_t queue_size = 256);
+  ~DiagnosticsPublisher();
+
+  /**
+   * Adds a status message. Can not be called anymore after start().
+   * @param name name of the status, including the prefix for the diagnostic aggregator
+   * @param keys keys of the values of the status, in the order in which they are published
+   * @return handle for the records of this status
+   */
+  int addStatus(const std::string &name, const std::string &hardware_id, const std::vector<std::string> &keys,
+                Formatter formatter);
+  int addPartialStatus(const std::string &name, const std::string &hardware_id, const std::vector<std::string> &keys,
+                       PartialFormatter formatter);
+
+  /**
+   * Hands a record over to the publishing thread. Real time safe.
+   * @return false if the queue is full, the record is dropped then
+   */
+  bool push(const DiagnosticRecord &record);
+
+  /**
+   * Starts the publishing thread
+   * @param rate_hz how often the queue is checked for new records
+   */
+  void start(double rate_hz = 100);
+
+  void stop();
+
+  /**
+   * @return number of records that were dropped since the queue was full
+   */
+  uint64_t getDropped() const { return dropped_.load(std::memory_order_relaxed); }
+
+  /**
+   * Formats a number like std::to_string
+   */
+  static void setValue(diagnostic_msgs::msg::DiagnosticStatus &status, size_t index, double value);
+  static void setValue(diagnostic_msgs::msg::DiagnosticStatus &status, size_t index, int value);
+
+ private:
+  void run();
+
+  rclcpp::Node::SharedPtr nh_;
+  rclcpp::Publisher<diagnostic_msgs::msg::DiagnosticArray>::SharedPtr diagnostic_pub_;
+  LockFreeQueue<DiagnosticRecord> queue_;
+  std::atomic<uint64_t> dropped_;
+
+  // the templates are only changed before the thread is started
+  std::mutex templates_mutex_;
+  std::vector<diagnostic_msgs::msg::DiagnosticStatus> templates_;
+  std::vector<PartialFormatter> formatters_;
+
+  std::thread thread_;
+  std::atomic<bool> running_;
+  std::chrono::nanoseconds period_;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_DIAGNOSTICS_PUBLISHER_H_
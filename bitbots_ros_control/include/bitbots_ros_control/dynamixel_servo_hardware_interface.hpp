@@ -3,19 +3,24 @@
 
 #include <dynamixel_driver.h>
 
+#include <atomic>
 #include <bitbots_msgs/msg/joint_command.hpp>
 #include <bitbots_msgs/msg/joint_torque.hpp>
 #include <bitbots_ros_control/hardware_interface.hpp>
+#include <bitbots_ros_control/joint_values.hpp>
 #include <bitbots_ros_control/servo_bus_interface.hpp>
+#include <bitbots_ros_control/triple_buffer.hpp>
 #include <bitbots_ros_control/utils.hpp>
 #include <bitset>
 #include <diagnostic_msgs/msg/diagnostic_array.hpp>
 #include <diagnostic_msgs/msg/diagnostic_status.hpp>
+#include <memory>
 #include <rclcpp/rclcpp.hpp>
 #include <sensor_msgs/msg/joint_state.hpp>
 #include <std_msgs/msg/bool.hpp>
 #include <std_msgs/msg/int32_multi_array.hpp>
 #include <string>
+#include <unordered_map>
 
 namespace bitbots_ros_control {
 template <typename T>
@@ -53,7 +58,8 @@ class DynamixelServoHardwareInterface : public bitbots_ros_control::HardwareInte
   void read(const rclcpp::Time &t, const rclcpp::Duration &dt);
   void write(const rclcpp::Time &t, const rclcpp::Duration &dt);
   void addBusInterface(ServoBusInterface *bus);
-  void writeROMRAM(bool first_time);
+  // the ROM and RAM values are written by the bus interfaces during the next cycles
+  void requestROMRAM();
 
  private:
   rclcpp::Node::SharedPtr nh_;
@@ -62,7 +68,24 @@ class DynamixelServoHardwareInterface : public bitbots_ros_control::HardwareInte
   void setTorqueCb(std_msgs::msg::Bool::SharedPtr enabled);
   void individualTorqueCb(bitbots_msgs::msg::JointTorque msg);
   void commandCb(const bitbots_msgs::msg::JointCommand &command_msg);
-
+  void publishCommand();
+
+  // indices of the joints of a message in the arrays of all joints, cached for each order of joint names
+  struct JointLayout {
+    std::vector<std::string> names;
+    // -1 for names that are not known
+    std::vector<int> indices;
+    // all names are known
+    bool complete;
+    // the names are all joints in the same order, so the values can be copied at once
+    bool identity;
+  };
+  const JointLayout &resolveLayout(const std::vector<std::string> &names);
+
+  // set by the callbacks, which may run in another thread than the control loop
+  std::atomic<bool> goal_torque_;
+  std::atomic<bool> switch_torque_;
+  std::atomic<bool> switch_individual_torque_;
   std::vector<int32_t> goal_torque_individual_;
 
   ControlMode control_mode_;
@@ -71,20 +94,21 @@ class DynamixelServoHardwareInterface : public bitbots_ros_control::HardwareInte
 
   std::vector<std::string> joint_names_;
 
+  // the goals are only changed by the callbacks, the control loop gets them through the command buffer
+  // the buses use the goals of their joints directly from the read buffer, it is created when the joints are known
   std::vector<double> goal_position_;
   std::vector<double> goal_effort_;
   std::vector<double> goal_velocity_;
   std::vector<double> goal_acceleration_;
+  std::unique_ptr<TripleBuffer<ServoCommand>> command_buffer_;
 
-  std::vector<double> current_position_;
-  std::vector<double> current_velocity_;
-  std::vector<double> current_effort_;
-  std::vector<double> current_pwm_;
   std::vector<double> current_input_voltage_;
   std::vector<double> current_temperature_;
   std::vector<uint8_t> current_error_;
 
   std::map<std::string, int> joint_map_;
+  // the key is a hash of the names, the publishers usually always send the same names in the same order
+  std::unordered_map<uint64_t, JointLayout> layouts_;
 
   bool torqueless_mode_;
 
@@ -95,6 +119,7 @@ class DynamixelServoHardwareInterface : public bitbots_ros_control::HardwareInte
   rclcpp::Publisher<sensor_msgs::msg::JointState>::SharedPtr pwm_pub_;
   rclcpp::Publisher<sensor_msgs::msg::JointState>::SharedPtr joint_pub_;
 
+  // the buses write the read values of their joints directly into the messages
   sensor_msgs::msg::JointState joint_state_msg_;
   sensor_msgs::msg::JointState pwm_msg_;
 };
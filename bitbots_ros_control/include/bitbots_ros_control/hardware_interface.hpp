@@ -4,6 +4,11 @@
 
 #ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_HARDWARE_INTERFACE_H_
 #define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_HARDWARE_INTERFACE_H_
+#include <bitbots_ros_control/black_box_recorder.hpp>
+#include <bitbots_ros_control/control_parameters.hpp>
+#include <bitbots_ros_control/cycle_scheduler.hpp>
+#include <bitbots_ros_control/device_read_scheduler.hpp>
+#include <bitbots_ros_control/diagnostics_publisher.hpp>
 #include <rclcpp/rclcpp.hpp>
 
 namespace bitbots_ros_control {
@@ -16,6 +21,36 @@ class HardwareInterface {
 
   virtual void write(const rclcpp::Time &t, const rclcpp::Duration &dt){};
 
+  /**
+   * Registers the register windows that this interface reads in each cycle at the scheduler of its port. The scheduler
+   * reads them before read() is called, together with the windows of the other interfaces on the same device.
+   */
+  virtual void addDeviceReads(DeviceReadScheduler *scheduler){};
+
+  /**
+   * Registers the tasks that this interface only does every few cycles at the central scheduler, which distributes
+   * them over the cycles.
+   */
+  virtual void addScheduledTasks(CycleScheduler *scheduler, size_t port){};
+
+  /**
+   * Sets the publisher for the diagnostics of this interface. Called before init(), the interface registers its status
+   * messages there in init(). Without it, the interface does not publish diagnostics.
+   */
+  virtual void setDiagnostics(DiagnosticsPublisher *diagnostics){};
+
+  /**
+   * Sets the recorder for the raw data of this interface. Called before init(), the interface registers its sources
+   * there in init(). Without it, nothing is recorded.
+   */
+  virtual void setRecorder(BlackBoxRecorder *recorder){};
+
+  /**
+   * Sets the snapshot of the parameters that can change while the control loop runs. Called before init(), without it
+   * the interface keeps the values of the parameters at the initialization.
+   */
+  virtual void setParameters(const ControlParameterCache *parameters){};
+
   virtual ~HardwareInterface(){};
 };
 }  // namespace bitbots_ros_control
@@ -3,6 +3,7 @@
 
 #include <dynamixel_driver.h>
 
+#include <atomic>
 #include <bitbots_msgs/srv/accelerometer_calibration.hpp>
 #include <bitbots_msgs/srv/complementary_filter_params.hpp>
 #include <bitbots_msgs/srv/imu_ranges.hpp>
@@ -10,10 +11,13 @@
 #include <bitbots_ros_control/hardware_interface.hpp>
 #include <diagnostic_msgs/msg/diagnostic_array.hpp>
 #include <diagnostic_msgs/msg/diagnostic_status.hpp>
+#include <memory>
+#include <mutex>
 #include <rclcpp/rclcpp.hpp>
 #include <sensor_msgs/msg/imu.hpp>
 #include <std_srvs/srv/empty.hpp>
 #include <string>
+#include <vector>
 
 namespace bitbots_ros_control {
 
@@ -25,6 +29,10 @@ class ImuHardwareInterface : public bitbots_ros_control::HardwareInterface {
   bool init();
   void read(const rclcpp::Time &t, const rclcpp::Duration &dt);
   void write(const rclcpp::Time &t, const rclcpp::Duration &dt);
+  void addDeviceReads(DeviceReadScheduler *scheduler);
+  void addScheduledTasks(CycleScheduler *scheduler, size_t port);
+  void setDiagnostics(DiagnosticsPublisher *diagnostics);
+  void setRecorder(BlackBoxRecorder *recorder);
 
  private:
   rclcpp::Node::SharedPtr nh_;
@@ -34,6 +42,12 @@ class ImuHardwareInterface : public bitbots_ros_control::HardwareInterface {
   std::string frame_;
   std::string name_;
   uint8_t *data_;
+  // data of the last sample, the board updates its registers slower than they may be read
+  uint8_t last_data_[40];
+  // only publish a message when the board has a new sample
+  bool only_new_samples_;
+  DeviceReadScheduler *device_reads_;
+  int device_read_handle_;
   uint8_t *accel_calib_data_;
 
   uint32_t last_seq_number_{};
@@ -46,25 +60,30 @@ class ImuHardwareInterface : public bitbots_ros_control::HardwareInterface {
 
   diagnostic_msgs::msg::DiagnosticStatus status_imu_;
 
-  bool write_ranges_ = false;
+  // requests of the services, which may run in another thread than the control loop
+  // the values of a request are set before its flag, the control loop resets the flag when it handled it
+  std::atomic<bool> write_ranges_{false};
   uint8_t gyro_range_, accel_range_;
 
-  bool calibrate_gyro_ = false;
-  bool reset_gyro_calibration_ = false;
+  std::atomic<bool> calibrate_gyro_{false};
+  std::atomic<bool> reset_gyro_calibration_{false};
 
-  bool write_complementary_filter_params_ = false;
+  std::atomic<bool> write_complementary_filter_params_{false};
   bool do_adaptive_gain_, do_bias_estimation_;
   float accel_gain_, bias_alpha_;
 
-  bool calibrate_accel_ = false;
-  bool reset_accel_calibration_ = false;
+  std::atomic<bool> calibrate_accel_{false};
+  std::atomic<bool> reset_accel_calibration_{false};
 
-  bool read_accel_calibration_ = false;
+  // the calibration is read by the control loop, since it owns the bus, which then answers the waiting requests
+  std::atomic<bool> read_accel_calibration_{false};
+  std::mutex accel_calibration_mutex_;
+  std::vector<std::shared_ptr<rmw_request_id_t>> accel_calibration_requests_;
   float accel_calib_threshold_read_;
   float accel_calib_bias_[3];
   float accel_calib_scale_[3];
 
-  bool set_accel_calib_threshold_ = false;
+  std::atomic<bool> set_accel_calib_threshold_{false};
   float accel_calib_threshold_;
 
   rclcpp::Service<bitbots_msgs::srv::IMURanges>::SharedPtr imu_ranges_service_;
@@ -78,10 +97,15 @@ class ImuHardwareInterface : public bitbots_ros_control::HardwareInterface {
       set_accel_calib_threshold_service_;
 
   rclcpp::Publisher<sensor_msgs::msg::Imu>::SharedPtr imu_pub_;
-  rclcpp::Publisher<diagnostic_msgs::msg::DiagnosticArray>::SharedPtr diagnostic_pub_;
   sensor_msgs::msg::Imu imu_msg_;
 
-  int diag_counter_;
+  DiagnosticsPublisher *diagnostics_;
+  int diagnostic_status_;
+  ScheduledTask diag_task_;
+  BlackBoxRecorder *recorder_;
+  int recorder_source_;
+
+  bool readAccelCalibrationData();
 
   void setIMURanges(const std::shared_ptr<bitbots_msgs::srv::IMURanges::Request> req,
                     std::shared_ptr<bitbots_msgs::srv::IMURanges::Response> resp);
@@ -95,8 +119,8 @@ class ImuHardwareInterface : public bitbots_ros_control::HardwareInterface {
                       std::shared_ptr<std_srvs::srv::Empty::Response> resp);
   void resetAccelCalibraton(const std::shared_ptr<std_srvs::srv::Empty::Request> req,
                             std::shared_ptr<std_srvs::srv::Empty::Response> resp);
-  void readAccelCalibration(const std::shared_ptr<bitbots_msgs::srv::AccelerometerCalibration::Request> req,
-                            std::shared_ptr<bitbots_msgs::srv::AccelerometerCalibration::Response> resp);
+  void readAccelCalibration(std::shared_ptr<rmw_request_id_t> request_header,
+                            std::shared_ptr<bitbots_msgs::srv::AccelerometerCalibration::Request> req);
   void setAccelCalibrationThreshold(
       const std::shared_ptr<bitbots_msgs::srv::SetAccelerometerCalibrationThreshold::Request> req,
       std::shared_ptr<bitbots_msgs::srv::SetAccelerometerCalibrationThreshold::Response> resp);
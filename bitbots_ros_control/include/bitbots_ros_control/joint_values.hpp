@@ -0,0 +1,41 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_JOINT_VALUES_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_JOINT_VALUES_H_
+
+#include <cstddef>
+#include <cstdint>
+#include <vector>
+
+namespace bitbots_ros_control {
+
+/**
+ * Values of a range of joints in an array that belongs to someone else, e.g. the joints of one bus in the array of all
+ * joints. The array must not be resized while the view is used.
+ */
+template <typename T>
+class JointView {
+ public:
+  JointView() : data_(nullptr), size_(0) {}
+  JointView(std::vector<T> &values, size_t first, size_t size) : data_(values.data() + first), size_(size) {}
+
+  T &operator[](size_t i) const { return data_[i]; }
+  T *data() const { return data_; }
+  size_t size() const { return size_; }
+  T *begin() const { return data_; }
+  T *end() const { return data_ + size_; }
+
+ private:
+  T *data_;
+  size_t size_;
+};
+
+// goals of all joints, handed from the callbacks to the control loop
+struct ServoCommand {
+  std::vector<double> position;
+  std::vector<double> velocity;
+  std::vector<double> acceleration;
+  std::vector<double> effort;
+  std::vector<int32_t> torque_individual;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_JOINT_VALUES_H_
@@ -5,6 +5,7 @@
 
 #include <bitbots_msgs/srv/leds.hpp>
 #include <bitbots_ros_control/hardware_interface.hpp>
+#include <bitbots_ros_control/triple_buffer.hpp>
 #include <rclcpp/rclcpp.hpp>
 #include <string>
 
@@ -25,8 +26,33 @@ class LedsHardwareInterface : public bitbots_ros_control::HardwareInterface {
   uint8_t id_;
   uint8_t start_number_;
 
-  bool write_leds_ = false;
-  std::vector<std_msgs::msg::ColorRGBA> leds_;
+  // state set by the callbacks, the control loop gets it through the buffer when it changed
+  struct LedState {
+    std::vector<std_msgs::msg::ColorRGBA> leds;
+    // all LEDs alternate between this color and their own color while blinking
+    std_msgs::msg::ColorRGBA blink_color;
+    bool blink = false;
+  };
+  LedState state_;
+  TripleBuffer<LedState> leds_buffer_;
+  void publishLeds();
+
+  // register values of LED_0, LED_1, ... as they should be and as they were last written
+  std::vector<uint32_t> register_values_;
+  std::vector<uint32_t> written_values_;
+  bool written_valid_;
+  // the LED registers are written with one packet if they are contiguous
+  uint16_t first_register_address_;
+  bool contiguous_registers_;
+  std::vector<uint8_t> write_data_;
+  // changes within this period are combined into one write
+  int64_t min_write_period_ns_;
+  int64_t last_write_ns_;
+  int64_t blink_period_ns_;
+  bool writeRegisters(size_t first, size_t last);
+
+  rclcpp::Subscription<std_msgs::msg::ColorRGBA>::SharedPtr blink_sub_;
+  void blinkCb(std_msgs::msg::ColorRGBA msg);
 
   rclcpp::Service<bitbots_msgs::srv::Leds>::SharedPtr leds_service_;
   void setLeds(const std::shared_ptr<bitbots_msgs::srv::Leds::Request> req,
@@ -0,0 +1,87 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_LOCK_FREE_QUEUE_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_LOCK_FREE_QUEUE_H_
+
+#include <atomic>
+#include <cstddef>
+#include <memory>
+
+namespace bitbots_ros_control {
+
+/**
+ * Bounded queue for handing data from the control loop to other threads without locks or allocations.
+ * Multiple threads can push (e.g. the workers of the ports), only one thread may pop.
+ * Each slot has a sequence number which tells whether it is free for the producer of this round or filled for the
+ * consumer, so producers only have to agree on the next position.
+ */
+template <typename T>
+class LockFreeQueue {
+ public:
+  /**
+   * @param capacity maximal number of elements in the queue, is rounded up to a power of two
+   */
+  explicit LockFreeQueue(size_t capacity) : head_(0), tail_(0) {
+    size_t size = 1;
+    while (size < capacity) {
+      size *= 2;
+    }
+    mask_ = size - 1;
+    slots_ = std::make_unique<Slot[]>(size);
+    for (size_t i = 0; i < size; i++) {
+      slots_[i].sequence.store(i, std::memory_order_relaxed);
+    }
+  }
+
+  /**
+   * Adds an element, never blocks
+   * @return false if the queue is full, the element is dropped then
+   */
+  bool push(const T &value) {
+    size_t position = tail_.load(std::memory_order_relaxed);
+    while (true) {
+      Slot &slot = slots_[position & mask_];
+      size_t sequence = slot.sequence.load(std::memory_order_acquire);
+      if (sequence == position) {
+        if (tail_.compare_exchange_weak(position, position + 1, std::memory_order_relaxed)) {
+          slot.value = value;
+          slot.sequence.store(position + 1, std::memory_order_release);
+          return true;
+        }
+      } else if (sequence < position) {
+        // the consumer did not yet take the element of the previous round
+        return false;
+      } else {
+        position = tail_.load(std::memory_order_relaxed);
+      }
+    }
+  }
+
+  /**
+   * Takes the oldest element, may only be called by one thread
+   * @return false if the queue is empty
+   */
+  bool pop(T &value) {
+    Slot &slot = slots_[head_ & mask_];
+    if (slot.sequence.load(std::memory_order_acquire) != head_ + 1) {
+      return false;
+    }
+    value = slot.value;
+    slot.sequence.store(head_ + mask_ + 1, std::memory_order_release);
+    head_++;
+    return true;
+  }
+
+ private:
+  struct Slot {
+    std::atomic<size_t> sequence;
+    T value;
+  };
+
+  std::unique_ptr<Slot[]> slots_;
+  size_t mask_;
+  size_t head_;
+  // producers and the consumer should not share a cache line
+  alignas(64) std::atomic<size_t> tail_;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_LOCK_FREE_QUEUE_H_
@@ -0,0 +1,70 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_LOOP_TIMER_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_LOOP_TIMER_H_
+
+#include <chrono>
+#include <cstdint>
+#include <string>
+
+namespace bitbots_ros_control {
+
+/**
+ * Paces the control loop on absolute deadlines of CLOCK_MONOTONIC, so the wake up latency of one cycle does not shift
+ * all following cycles. The thread sleeps with clock_nanosleep until a margin before the deadline and spins for the
+ * rest, which trades some cpu time for a wake up close to the deadline.
+ */
+class LoopTimer {
+ public:
+  // steady_clock is CLOCK_MONOTONIC on linux, so the deadlines can be compared with the other timings of the loop
+  using Clock = std::chrono::steady_clock;
+
+  enum class OverrunPolicy {
+    // wait for the next deadline after the overrun, the following cycles keep the phase but a period is lost
+    SKIP,
+    // start the next cycles directly until the loop is back on its deadlines, up to MAX_CATCH_UP periods
+    CATCH_UP
+  };
+
+  LoopTimer(double control_loop_hz, std::chrono::nanoseconds spin_margin, OverrunPolicy policy);
+
+  /**
+   * Sets the first deadline one period from now.
+   */
+  void start();
+
+  /**
+   * Waits until the deadline of the current cycle and advances to the next one.
+   * @return number of periods that were skipped because the cycle overran its deadline
+   */
+  uint64_t wait();
+
+  /**
+   * Deadline that the last call of wait() waited for
+   */
+  Clock::time_point lastDeadline() const { return Clock::time_point(std::chrono::nanoseconds(last_deadline_)); }
+
+  /**
+   * Pins the calling thread to a cpu core and sets its real time priority, e.g. for the core that is isolated for the
+   * control loop.
+   * @param cpu cpu core, negative to keep the affinity
+   * @param priority SCHED_FIFO priority, 0 keeps the default scheduler
+   * @param error description of the failure, if one of them could not be applied
+   */
+  static bool configureThread(int64_t cpu, int priority, std::string &error);
+
+  static bool stringToOverrunPolicy(const std::string &name, OverrunPolicy &policy);
+
+ private:
+  static const int64_t MAX_CATCH_UP = 5;
+  static int64_t now();
+  static void sleepUntil(int64_t time);
+
+  // all times are in nanoseconds of CLOCK_MONOTONIC
+  int64_t period_;
+  int64_t spin_margin_;
+  OverrunPolicy policy_;
+  int64_t deadline_;
+  int64_t last_deadline_;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_LOOP_TIMER_H_
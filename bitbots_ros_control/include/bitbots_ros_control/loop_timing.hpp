@@ -0,0 +1,121 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_LOOP_TIMING_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_LOOP_TIMING_H_
+
+#include <array>
+#include <atomic>
+#include <bitbots_ros_control/diagnostics_publisher.hpp>
+#include <chrono>
+#include <cstdint>
+#include <deque>
+#include <diagnostic_msgs/msg/diagnostic_status.hpp>
+#include <functional>
+#include <string>
+
+namespace bitbots_ros_control {
+
+/**
+ * Histogram of durations with logarithmic buckets (8 buckets per power of two, so about 12% resolution).
+ * Recording is lock free and can be done from multiple threads, collecting is done by one thread.
+ */
+class LatencyHistogram {
+ public:
+  struct Summary {
+    uint64_t count;
+    // in nanoseconds, the percentiles are the upper bound of the bucket which contains them
+    uint64_t p50;
+    uint64_t p99;
+    uint64_t max;
+  };
+
+  void record(uint64_t ns);
+
+  /**
+   * Computes the summary of all values recorded since the last call and resets the histogram.
+   */
+  Summary collect();
+
+ private:
+  static const size_t SUB_BUCKETS = 8;
+  static const size_t NUM_BUCKETS = 2 * SUB_BUCKETS + 61 * SUB_BUCKETS;
+  static size_t bucket(uint64_t ns);
+  static uint64_t upperBound(size_t bucket);
+
+  std::array<std::atomic<uint32_t>, NUM_BUCKETS> buckets_{};
+  std::atomic<uint64_t> max_{0};
+};
+
+/**
+ * Timing of the phases of the control loop. Each phase gets its own histogram, additionally the measured period of the
+ * loop and its jitter, overruns (the work of a cycle took longer than the period), missed deadlines (a cycle started
+ * more than half a period too late) and periods skipped by the loop timer are counted.
+ */
+class LoopTiming {
+ public:
+  using Clock = std::chrono::steady_clock;
+
+  explicit LoopTiming(double control_loop_hz);
+
+  /**
+   * Adds a phase that is measured. Has to be called before the control loop starts.
+   * @return index of the phase for record()
+   */
+  size_t addPhase(const std::string &name);
+
+  void record(size_t phase, Clock::time_point start, Clock::time_point end) {
+    phases_[phase].histogram.record(std::chrono::duration_cast<std::chrono::nanoseconds>(end - start).count());
+  }
+
+  /**
+   * Called once per cycle by the control loop
+   * @param cycle_start time at which this cycle started
+   * @param work_end time at which all work of this cycle was done, before sleeping
+   */
+  void endCycle(Clock::time_point cycle_start, Clock::time_point work_end);
+
+  /**
+   * Counts periods that the loop timer skipped after an overrun
+   */
+  void addSkipped(uint64_t periods) { skipped_ += periods; }
+
+  using StatusCallback = std::function<void(const diagnostic_msgs::msg::DiagnosticStatus &)>;
+
+  /**
+   * Adds the status of the timing to the diagnostics, with one value per phase followed by the counters. Has to be
+   * called after all phases were added and before the diagnostics are started.
+   * @param formatted called by the diagnostics thread with each complete status, e.g. to publish it on another topic
+   */
+  void addDiagnostics(DiagnosticsPublisher *diagnostics, const std::string &name, const std::string &hardware_id,
+                      StatusCallback formatted = nullptr);
+
+  /**
+   * Summarizes all phases since the last call, hands the raw values to the diagnostics and resets the histograms.
+   * Called by the control loop, the status message is built by the diagnostics thread.
+   */
+  void push(int64_t stamp);
+
+ private:
+  struct Phase {
+    std::string name;
+    LatencyHistogram histogram;
+  };
+
+  // deque since the histograms can not be moved
+  std::deque<Phase> phases_;
+  std::chrono::nanoseconds target_period_;
+  size_t period_phase_;
+  size_t work_phase_;
+  // deviation of the measured period from the target period
+  size_t jitter_phase_;
+  Clock::time_point last_cycle_start_;
+  uint64_t overruns_;
+  uint64_t missed_deadlines_;
+  uint64_t total_overruns_;
+  uint64_t total_missed_deadlines_;
+  uint64_t skipped_;
+  uint64_t total_skipped_;
+  DiagnosticsPublisher *diagnostics_;
+  int diagnostic_status_;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_LOOP_TIMING_H_
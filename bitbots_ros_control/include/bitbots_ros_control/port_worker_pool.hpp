@@ -0,0 +1,97 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_PORT_WORKER_POOL_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_PORT_WORKER_POOL_H_
+
+#include <condition_variable>
+#include <cstdint>
+#include <functional>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
+
+namespace bitbots_ros_control {
+
+/**
+ * A set of long living threads with exactly one thread per bus port.
+ * Instead of creating and joining a thread for every read and write of every cycle, the workers sleep on a condition
+ * variable until the control loop hands them the next phase (e.g. read or write). All workers run the same work
+ * function, which gets the index of the port and the phase as arguments.
+ */
+class PortWorkerPool {
+ public:
+  using Work = std::function<void(size_t port, int phase)>;
+
+  PortWorkerPool();
+  ~PortWorkerPool();
+  PortWorkerPool(const PortWorkerPool &) = delete;
+  PortWorkerPool &operator=(const PortWorkerPool &) = delete;
+
+  /**
+   * Starts one worker thread per port.
+   * @param num_ports number of threads that will be created
+   * @param work function that is executed by each worker for each phase
+   * @param cpu_affinity cpu core for the worker of each port, negative values or missing entries keep the thread
+   * unpinned
+   * @param priority SCHED_FIFO priority for all workers, 0 keeps the default scheduler
+   * @return false if the affinity or the priority could not be applied for at least one worker. The workers are
+   * running anyway in this case. Details can be retrieved with getErrors().
+   */
+  bool start(size_t num_ports, Work work, const std::vector<int64_t> &cpu_affinity = {}, int priority = 0);
+
+  /**
+   * Stops and joins all workers. Called automatically on destruction.
+   */
+  void stop();
+
+  /**
+   * Runs the given phase on all ports and blocks until every worker has finished it.
+   */
+  void run(int phase);
+
+  /**
+   * Starts the given phase on all ports without waiting for it. wait() has to be called before the next phase.
+   */
+  void dispatch(int phase);
+
+  /**
+   * Blocks until all workers have finished the last dispatched phase.
+   */
+  void wait();
+
+  /**
+   * Can be called by the work function to tell the control loop that the part of the phase which it needs to wait
+   * for is done, e.g. all writes are finished while the reads of the next cycle are still running.
+   */
+  void signalHandoff(size_t port);
+
+  /**
+   * Blocks until all workers have called signalHandoff() or finished the last dispatched phase.
+   */
+  void waitHandoff();
+
+  size_t size() const { return threads_.size(); }
+
+  const std::vector<std::string> &getErrors() const { return errors_; }
+
+ private:
+  void workerLoop(size_t port, uint64_t start_generation);
+  bool configureThread(size_t port, const std::vector<int64_t> &cpu_affinity, int priority);
+
+  Work work_;
+  std::vector<std::thread> threads_;
+  std::vector<std::string> errors_;
+
+  std::mutex mutex_;
+  std::condition_variable start_cv_;
+  std::condition_variable done_cv_;
+  // incremented for every phase, workers compare it to the last generation they have processed
+  uint64_t generation_;
+  int phase_;
+  size_t pending_;
+  size_t handoff_pending_;
+  std::vector<bool> handoff_signaled_;
+  bool shutdown_;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_PORT_WORKER_POOL_H_
@@ -3,6 +3,7 @@
 #include <yaml-cpp/yaml.h>
 
 #include <ament_index_cpp/get_package_share_directory.hpp>
+#include <array>
 #include <bitbots_msgs/msg/foot_pressure.hpp>
 #include <bitbots_msgs/srv/foot_scale.hpp>
 #include <fstream>
@@ -10,13 +11,33 @@
 #include <geometry_msgs/msg/transform_stamped.hpp>
 #include <geometry_msgs/msg/wrench_stamped.hpp>
 #include <iostream>
+#include <mutex>
 #include <numeric>
 #include <rclcpp/rclcpp.hpp>
 #include <std_srvs/srv/empty.hpp>
 
+/**
+ * Collects the center of pressure transforms of both feet and sends them together in one tf message.
+ */
+class CopTfBatcher {
+ public:
+  explicit CopTfBatcher(rclcpp::Node::SharedPtr nh);
+  void add(const geometry_msgs::msg::TransformStamped& transform, char side);
+
+ private:
+  std::mutex mutex_;
+  // left and right transform
+  std::vector<geometry_msgs::msg::TransformStamped> transforms_;
+  std::array<bool, 2> pending_;
+  std::unique_ptr<tf2_ros::TransformBroadcaster> tf_broadcaster_;
+};
+
 class PressureConverter {
  public:
-  PressureConverter(rclcpp::Node::SharedPtr nh, char side);
+  /**
+   * @param tf_batcher if set, the center of pressure tf is sent together with the one of the other foot
+   */
+  PressureConverter(rclcpp::Node::SharedPtr nh, char side, std::shared_ptr<CopTfBatcher> tf_batcher = nullptr);
 
  private:
   rclcpp::Node::SharedPtr nh_;
@@ -28,12 +49,24 @@ class PressureConverter {
   std::vector<rclcpp::Publisher<geometry_msgs::msg::WrenchStamped>::SharedPtr> wrench_pubs_;
   rclcpp::Subscription<bitbots_msgs::msg::FootPressure>::SharedPtr sub_;
   std::unique_ptr<tf2_ros::TransformBroadcaster> tf_broadcaster_;
+  std::shared_ptr<CopTfBatcher> tf_batcher_;
 
-  std::vector<std::string> wrench_frames_;
+  // all four channels of the sensor are processed together, in the order left front, left back, right front, right
+  // back. the fixed size allows the compiler to vectorize the loops over the channels
+  using Channels = std::array<double, 4>;
+  std::vector<geometry_msgs::msg::WrenchStamped> wrench_msgs_;
   std::vector<double> zero_, scale_;
-  std::vector<std::vector<double>> previous_values_, zero_and_scale_values_;
+  alignas(32) Channels zero_channels_;
+  alignas(32) Channels scale_channels_;
+  // ring buffer of the last values and their running sum for the moving average
+  std::vector<Channels> previous_values_;
+  alignas(32) Channels sums_;
+  std::vector<std::vector<double>> zero_and_scale_values_;
   bool save_zero_and_scale_values_;
   int current_index_;
+  // wrenches and tf are only published for every n-th message
+  int wrench_decimation_;
+  int wrench_counter_;
   int average_, scale_and_zero_average_;
   double cop_threshold_;
   char side_;
@@ -45,6 +78,7 @@ class PressureConverter {
   rclcpp::Service<bitbots_msgs::srv::FootScale>::SharedPtr scale_service_;
 
   void pressureCallback(bitbots_msgs::msg::FootPressure pressure_raw);
+  void setZeroAndScale();
   void resetZeroAndScaleValues();
   bool zeroCallback(const std::shared_ptr<std_srvs::srv::Empty::Request> req,
                     std::shared_ptr<std_srvs::srv::Empty::Response> resp);
@@ -3,11 +3,15 @@
 
 #include <dynamixel_driver.h>
 
+#include <array>
 #include <bitbots_msgs/msg/audio.hpp>
 #include <bitbots_msgs/msg/joint_torque.hpp>
 #include <bitbots_ros_control/hardware_interface.hpp>
+#include <bitbots_ros_control/joint_values.hpp>
+#include <bitbots_ros_control/servo_conversion.hpp>
 #include <bitbots_ros_control/utils.hpp>
 #include <bitset>
+#include <chrono>
 #include <diagnostic_msgs/msg/diagnostic_array.hpp>
 #include <diagnostic_msgs/msg/diagnostic_status.hpp>
 #include <rcl_interfaces/msg/list_parameters_result.hpp>
@@ -27,27 +31,41 @@ class ServoBusInterface : public bitbots_ros_control::HardwareInterface {
   bool init();
   void read(const rclcpp::Time &t, const rclcpp::Duration &dt);
   void write(const rclcpp::Time &t, const rclcpp::Duration &dt);
+  void addDeviceReads(DeviceReadScheduler *scheduler);
+  void addScheduledTasks(CycleScheduler *scheduler, size_t port);
+  void setDiagnostics(DiagnosticsPublisher *diagnostics);
+  void setRecorder(BlackBoxRecorder *recorder);
+  void setParameters(const ControlParameterCache *parameters);
+  void setCurrentValues(sensor_msgs::msg::JointState &joint_state, sensor_msgs::msg::JointState &pwm,
+                        size_t first_joint);
+  void setGoals(ServoCommand &command, size_t first_joint);
 
   bool loadDynamixels();
-  bool writeROMRAM(bool first_time);
+  bool loadROMRAM();
+  bool syncReadROMRAM();
 
   void syncWritePWM();
 
-  void switchDynamixelControlMode();
-  diagnostic_msgs::msg::DiagnosticStatus createServoDiagMsg(int id, char level, std::string message,
-                                                            std::map<std::string, std::string> map, std::string name);
+  void requestControlModeSwitch();
+  void requestROMRAM();
+  bool stepSetup();
+  void pushSetupDiagnostics();
+  void formatSetupDiagnostics(const DiagnosticRecord &record, diagnostic_msgs::msg::DiagnosticStatus &status);
+  void formatServoDiagnostics(const DiagnosticRecord &record, diagnostic_msgs::msg::DiagnosticStatus &status);
   void processVte(bool success);
 
   bool goal_torque_;
   bool current_torque_;
   void writeTorque(bool enabled);
-  void writeTorqueForServos(std::vector<int32_t> torque);
-
-  bool syncReadPositions();
-  bool syncReadVelocities();
-  bool syncReadEfforts();
-  bool syncReadPWMs();
-  bool syncReadAll();
+  void writeTorqueForServos(int32_t *torque);
+
+  void planPresentRead();
+  bool syncReadPresent();
+  bool readPresentIndividually(bool only_failed);
+  bool takeScheduledPresent();
+  void decodePresent();
+  void updateLink(int joint, bool success);
+  void reinitServos();
   bool syncReadVoltageAndTemp();
   bool syncReadError();
 
@@ -57,22 +75,118 @@ class ServoBusInterface : public bitbots_ros_control::HardwareInterface {
   void syncWriteCurrent();
   void syncWriteProfileAcceleration();
 
+  // goal values of one register, converted to register units
+  struct GoalRegister {
+    std::string name;
+    // size of the register in bytes, from the control table of the servos
+    uint16_t data_length;
+    std::vector<int32_t> values;
+    // values that were last sent to the servos
+    std::vector<int32_t> written;
+    // false if the servos may not have the written values, e.g. after a lost connection
+    bool valid;
+    // a servo is only written if its goal differs by more than write_deadband_ from the last written value
+    bool use_deadband;
+    // servos which are written in any case, e.g. after they did not answer
+    std::vector<bool> stale;
+  };
+  void initGoalRegister(GoalRegister &reg, const std::string &name);
+  void invalidateGoalRegisters();
+  bool syncWriteChanged(GoalRegister &reg);
+
   rclcpp::Node::SharedPtr nh_;
-  int32_t *data_sync_read_positions_;
-  int32_t *data_sync_read_velocities_;
-  int32_t *data_sync_read_efforts_;
-  int32_t *data_sync_read_pwms_;
   int32_t *data_sync_read_error_;
-  int32_t *sync_write_goal_position_;
-  int32_t *sync_write_goal_velocity_;
-  int32_t *sync_write_profile_velocity_;
-  int32_t *sync_write_profile_acceleration_;
-  int32_t *sync_write_goal_current_;
-  int32_t *sync_write_goal_pwm_;
-  std::vector<uint8_t> sync_read_all_data_;
+  GoalRegister goal_position_register_;
+  GoalRegister goal_velocity_register_;
+  GoalRegister profile_velocity_register_;
+  GoalRegister profile_acceleration_register_;
+  GoalRegister goal_current_register_;
+  GoalRegister goal_pwm_register_;
+  // deadband of the goal registers, in register units, taken from the parameters in each cycle
+  int write_deadband_;
+  std::vector<uint8_t> changed_joints_;
+
+  // the present values of the servos which can be read in the control loop
+  enum PresentValue { PRESENT_PWM, PRESENT_CURRENT, PRESENT_VELOCITY, PRESENT_POSITION };
+  struct PresentRegister {
+    PresentValue value;
+    uint16_t address;
+    uint16_t length;
+  };
+  // registers that are read, the address is relative to present_read_address_
+  std::vector<PresentRegister> present_registers_;
+  // smallest contiguous span covering all registers that are read
+  uint16_t present_read_address_;
+  uint16_t present_read_length_;
+  // received data of the last sync read, in the order of the read servos
+  std::vector<uint8_t> sync_read_present_data_;
+  // last data that was read from each servo, in the order of joint_ids_. the servos that do not answer keep theirs
+  std::vector<uint8_t> present_data_;
+  std::vector<uint8_t> single_read_present_data_;
+  // servos that are sync read, without the ones that do not answer
+  std::vector<uint8_t> sync_read_ids_;
+  std::vector<int> sync_read_joints_;
+  // with a bulk read on the port, the present values are part of it instead of the sync read
+  DeviceReadScheduler *device_reads_;
+  std::vector<int> present_read_handles_;
+  // raw values of each present value for all joints, so that they can be converted in one go
+  std::array<std::vector<int32_t>, 4> present_values_;
+
+  // register writes that need more than one cycle, like switching the control mode, which needs pauses in which the
+  // servos process the change. write() does one step per cycle instead of the goals, so the other ports keep running
+  enum SetupStep {
+    SETUP_IDLE,
+    SETUP_TORQUE_OFF,
+    SETUP_OPERATING_MODE,
+    SETUP_ROM_RAM_READ,
+    SETUP_ROM_RAM,
+    SETUP_FINISH
+  };
+  SetupStep setup_step_;
+  bool control_mode_switch_requested_;
+  bool rom_ram_requested_;
+  // the next step is not done before this time
+  std::chrono::steady_clock::time_point setup_wait_until_;
+  // false if one of the writes of the current or last setup failed
+  bool setup_success_;
+  std::vector<int32_t> operating_mode_;
+  // ROM and RAM values from the config, the written values are read from the servos before writing
+  // so that only the servos with a different value are written
+  struct RomRamRegister {
+    GoalRegister reg;
+    // address relative to rom_ram_read_address_, the length is 0 if the register is not read back
+    uint16_t address;
+    uint16_t length;
+  };
+  std::vector<RomRamRegister> rom_ram_registers_;
+  size_t rom_ram_index_;
+  // number of registers that had to be written in the current or last setup
+  size_t rom_ram_written_;
+  // smallest contiguous span covering all registers that are read back
+  uint16_t rom_ram_read_address_;
+  uint16_t rom_ram_read_length_;
+  std::vector<uint8_t> rom_ram_read_data_;
+  ScheduledTask setup_diag_task_;
+  int setup_diagnostic_status_;
 
   bool first_cycle_;
-  bool lost_servo_connection_;
+  // state of the communication with each servo. if the sync read fails, the servos are read one by one to find the
+  // ones that do not answer, the others still get new values in the same cycle. the servos that do not answer are left
+  // out of the sync read and only retried on their own with increasing pauses until they answer again
+  struct ServoLink {
+    bool failed;
+    // consecutive failed reads, the pause before the next retry doubles with each
+    int failures;
+    uint64_t retry_cycle;
+    // the torque and the goals are written again when the servo answers again, it may have lost power
+    bool reinit;
+    // reads and failed reads since the error rate was last computed
+    int reads;
+    int errors;
+    double error_rate;
+  };
+  std::vector<ServoLink> links_;
+  int failed_servos_;
   ControlMode control_mode_;
 
   bool switch_individual_torque_;
@@ -82,46 +196,53 @@ class ServoBusInterface : public bitbots_ros_control::HardwareInterface {
   std::vector<std::tuple<int, std::string, float, float, std::string>> servos_;
   int joint_count_;
 
-  std::vector<int32_t> goal_torque_individual_;
+  // the goals and the read values are in the arrays of all joints of the DynamixelServoHardwareInterface, so that they
+  // do not have to be copied between both
+  JointView<int32_t> goal_torque_individual_;
 
   std::vector<std::string> joint_names_;
   std::vector<uint8_t> joint_ids_;
   std::vector<double> joint_mounting_offsets_;
   std::vector<double> joint_offsets_;
   std::vector<std::string> joint_groups_;  // The group name for each joint
+  ServoConversion conversion_;
 
-  std::vector<double> goal_position_;
-  std::vector<double> goal_effort_;
-  std::vector<double> goal_velocity_;
-  std::vector<double> goal_acceleration_;
-
-  std::vector<double> last_goal_position_;
-  std::vector<double> last_goal_effort_;
-  std::vector<double> last_goal_velocity_;
-  std::vector<double> last_goal_acceleration_;
+  JointView<double> goal_position_;
+  JointView<double> goal_effort_;
+  JointView<double> goal_velocity_;
+  JointView<double> goal_acceleration_;
 
   bool read_position_;
   bool read_velocity_;
   bool read_effort_;
   bool read_pwm_;
   bool read_volt_temp_;
-  std::vector<double> current_position_;
-  std::vector<double> current_velocity_;
-  std::vector<double> current_effort_;
-  std::vector<double> current_pwm_;
+  JointView<double> current_position_;
+  JointView<double> current_velocity_;
+  JointView<double> current_effort_;
+  JointView<double> current_pwm_;
   std::vector<double> current_input_voltage_;
   std::vector<double> current_temperature_;
   std::vector<uint8_t> current_error_;
 
-  int read_vt_counter_;
-  int vt_update_rate_;
+  // number of reads of this bus, only for the retries of the servos that do not answer
+  uint64_t read_counter_;
+  // reading voltage, temperature and error
+  ScheduledTask vte_task_;
   double warn_temp_;
   double warn_volt_;
   bool torqueless_mode_;
 
-  int reading_errors_;
-  int reading_successes_;
-  rclcpp::Publisher<diagnostic_msgs::msg::DiagnosticArray>::SharedPtr diagnostic_pub_;
+  DiagnosticsPublisher *diagnostics_;
+  // one diagnostic status per servo
+  std::vector<int> diagnostic_statuses_;
+  // the sync read data of the present values and the goals are recorded
+  BlackBoxRecorder *recorder_;
+  const ControlParameterCache *parameters_;
+  int present_source_;
+  int goal_source_;
+  // goal positions, velocities, accelerations and efforts of all joints
+  std::vector<double> recorded_goals_;
   rclcpp::Publisher<bitbots_msgs::msg::Audio>::SharedPtr speak_pub_;
 };
 }  // namespace bitbots_ros_control
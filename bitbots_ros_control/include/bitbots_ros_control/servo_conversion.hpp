@@ -0,0 +1,68 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_SERVO_CONVERSION_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_SERVO_CONVERSION_H_
+
+#include <dynamixel_driver.h>
+
+#include <cstdint>
+#include <vector>
+
+namespace bitbots_ros_control {
+
+/**
+ * Converts between register values of the servos and SI units for all joints of a bus at once.
+ * The driver looks up the model of the servo for each single conversion. Instead, the parameters of all joints are
+ * taken from the driver once and stored in one array per parameter, so that each conversion is a simple loop.
+ */
+class ServoConversion {
+ public:
+  /**
+   * Takes the conversion parameters of the joints from the driver. The servos have to be known to the driver.
+   * @param position_offsets offset of each joint in radian, which is added to the read positions and subtracted from
+   * the goal positions
+   */
+  void init(DynamixelDriver &driver, const std::vector<uint8_t> &ids, const std::vector<double> &position_offsets);
+
+  /**
+   * Converts present positions to radian. Values which are most probably reading errors are skipped, the position of
+   * the joint is not changed then.
+   */
+  void valueToPosition(const int32_t *values, double *positions) const;
+  void positionToValue(const double *positions, int32_t *values) const;
+  void valueToVelocity(const int32_t *values, double *velocities) const;
+  void velocityToValue(const double *velocities, int32_t *values) const;
+  void valueToTorque(const int32_t *values, double *torques) const;
+  void torqueToValue(const double *torques, int32_t *values) const;
+
+  /**
+   * @return maximal goal current of the joint in register units, -1 if it is not known for the model
+   */
+  int32_t getMaxCurrent(size_t joint) const { return max_current_[joint]; }
+
+ private:
+  size_t joint_count_ = 0;
+  std::vector<double> position_offset_;
+  // register value of 0 rad
+  std::vector<int32_t> zero_value_;
+  // the models can have a different resolution above and below the zero value
+  std::vector<double> radian_per_value_positive_;
+  std::vector<double> radian_per_value_negative_;
+  std::vector<double> value_per_radian_positive_;
+  std::vector<double> value_per_radian_negative_;
+  std::vector<double> velocity_per_value_;
+  std::vector<double> value_per_velocity_;
+  std::vector<double> torque_per_value_;
+  std::vector<double> value_per_torque_;
+  std::vector<int32_t> max_current_;
+};
+
+/**
+ * Extracts the signed values of one register of all joints from the data of a sync read
+ * @param stride number of bytes per joint in the data
+ * @param address address of the register relative to the data of a joint
+ * @param length 2 or 4 bytes
+ */
+void decodeRegister(const uint8_t *data, size_t stride, uint16_t address, uint16_t length, size_t joint_count,
+                    int32_t *values);
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_SERVO_CONVERSION_H_
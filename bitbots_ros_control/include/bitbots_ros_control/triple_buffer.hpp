@@ -0,0 +1,74 @@
+#ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_TRIPLE_BUFFER_H_
+#define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_TRIPLE_BUFFER_H_
+
+#include <array>
+#include <atomic>
+#include <cstdint>
+
+namespace bitbots_ros_control {
+
+/**
+ * Hands the latest value from one writer thread to one reader thread without locks, e.g. commands from the ROS
+ * callbacks to the control loop. Neither side ever waits for the other, older values are overwritten.
+ * The writer fills its own buffer and swaps it with the middle one, the reader swaps the middle one with its own buffer
+ * if it contains a newer value. The buffers are allocated once, so the values can be reused without allocations.
+ */
+template <typename T>
+class TripleBuffer {
+ public:
+  explicit TripleBuffer(const T &initial = T())
+      : buffers_{initial, initial, initial},
+        middle_(MIDDLE_INDEX),
+        write_index_(WRITE_INDEX),
+        read_index_(READ_INDEX) {}
+
+  /**
+   * Buffer of the writer, it contains an old value that has to be overwritten completely
+   */
+  T &writeBuffer() { return buffers_[write_index_]; }
+
+  /**
+   * Makes the content of the write buffer available to the reader
+   */
+  void publish() {
+    uint8_t previous = middle_.exchange(write_index_ | NEW_FLAG, std::memory_order_acq_rel);
+    write_index_ = previous & INDEX_MASK;
+  }
+
+  /**
+   * Takes the latest published value, if there is one that the reader did not see yet
+   * @return true if readBuffer() contains a new value
+   */
+  bool update() {
+    if (!(middle_.load(std::memory_order_relaxed) & NEW_FLAG)) {
+      return false;
+    }
+    uint8_t previous = middle_.exchange(read_index_, std::memory_order_acq_rel);
+    read_index_ = previous & INDEX_MASK;
+    return true;
+  }
+
+  /**
+   * Buffer of the reader, it is not changed by the writer until the next update()
+   */
+  const T &readBuffer() const { return buffers_[read_index_]; }
+  T &readBuffer() { return buffers_[read_index_]; }
+
+ private:
+  static const uint8_t WRITE_INDEX = 0;
+  static const uint8_t MIDDLE_INDEX = 1;
+  static const uint8_t READ_INDEX = 2;
+  static const uint8_t INDEX_MASK = 3;
+  static const uint8_t NEW_FLAG = 4;
+
+  std::array<T, 3> buffers_;
+  // index of the middle buffer and whether it contains a value which the reader did not take yet
+  std::atomic<uint8_t> middle_;
+  // only used by the writer
+  uint8_t write_index_;
+  // only used by the reader, on its own cache line
+  alignas(64) uint8_t read_index_;
+};
+}  // namespace bitbots_ros_control
+
+#endif  // BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_TRIPLE_BUFFER_H_
@@ -1,6 +1,8 @@
 #ifndef BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_UTILS_H_
 #define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_UTILS_H_
 
+#include <memory>
+
 #include "bitbots_msgs/msg/audio.hpp"
 #include "rclcpp/rclcpp.hpp"
 
@@ -10,6 +12,44 @@ enum ControlMode { POSITION_CONTROL, VELOCITY_CONTROL, EFFORT_CONTROL, CURRENT_B
 
 bool stringToControlMode(rclcpp::Node::SharedPtr nh, const std::string& control_modestr, ControlMode& control_mode);
 void speakError(rclcpp::Publisher<bitbots_msgs::msg::Audio>::SharedPtr speak_pub, const std::string& text);
+std::string defaultRosHomePath(const std::string& filename);
+
+/**
+ * Publishes a message from the control loop that is built by fill(MessageT&), which sets all fields that change.
+ * If the middleware can loan messages of this type (e.g. shared memory for messages of fixed size), it is built
+ * directly in the loaned message. If there are subscribers in the same process, it is built in a new message that they
+ * take over, this is one allocation but no copy. Otherwise it is built in msg and published by reference.
+ */
+template <typename MessageT, typename Fill>
+void publishMessage(const typename rclcpp::Publisher<MessageT>::SharedPtr& pub, MessageT& msg, Fill fill) {
+  if (pub->can_loan_messages()) {
+    auto loaned_msg = pub->borrow_loaned_message();
+    fill(loaned_msg.get());
+    pub->publish(std::move(loaned_msg));
+  } else if (pub->get_intra_process_subscription_count() > 0) {
+    auto unique_msg = std::make_unique<MessageT>();
+    fill(*unique_msg);
+    pub->publish(std::move(unique_msg));
+  } else {
+    fill(msg);
+    pub->publish(msg);
+  }
+}
+
+/**
+ * Publishes a message that is already complete, e.g. one that is also kept for the diagnostics. It is copied into a
+ * loaned message if the middleware can loan messages of this type, otherwise it is published by reference.
+ */
+template <typename MessageT>
+void publishMessage(const typename rclcpp::Publisher<MessageT>::SharedPtr& pub, const MessageT& msg) {
+  if (pub->can_loan_messages()) {
+    auto loaned_msg = pub->borrow_loaned_message();
+    loaned_msg.get() = msg;
+    pub->publish(std::move(loaned_msg));
+  } else {
+    pub->publish(msg);
+  }
+}
 
 uint16_t dxlMakeword(uint64_t a, uint64_t b);
 uint32_t dxlMakedword(uint64_t a, uint64_t b);
@@ -2,19 +2,33 @@
 #define BITBOTS_ROS_CONTROL_INCLUDE_BITBOTS_ROS_CONTROL_WOLFGANG_HARDWARE_INTERFACE_H_
 
 #include <bitbots_ros_control/bitfoot_hardware_interface.hpp>
+#include <bitbots_ros_control/black_box_recorder.hpp>
 #include <bitbots_ros_control/button_hardware_interface.hpp>
+#include <bitbots_ros_control/control_parameters.hpp>
 #include <bitbots_ros_control/core_hardware_interface.hpp>
+#include <bitbots_ros_control/cycle_scheduler.hpp>
+#include <bitbots_ros_control/device_read_scheduler.hpp>
+#include <bitbots_ros_control/diagnostics_publisher.hpp>
 #include <bitbots_ros_control/dynamixel_servo_hardware_interface.hpp>
 #include <bitbots_ros_control/hardware_interface.hpp>
 #include <bitbots_ros_control/imu_hardware_interface.hpp>
 #include <bitbots_ros_control/leds_hardware_interface.hpp>
+#include <bitbots_ros_control/loop_timing.hpp>
+#include <bitbots_ros_control/port_worker_pool.hpp>
 #include <bitbots_ros_control/utils.hpp>
+#include <diagnostic_msgs/msg/diagnostic_array.hpp>
+#include <map>
+#include <numeric>
 #include <rcl_interfaces/msg/list_parameters_result.hpp>
 #include <rclcpp/rclcpp.hpp>
 #include <thread>
 
 namespace bitbots_ros_control {
 
+// phases that are executed by the worker thread of each port
+// PORT_WRITE_READ is used in pipelined mode, the next read is started directly after the write of the port is done
+enum PortPhase { PORT_READ, PORT_WRITE, PORT_WRITE_READ };
+
 class WolfgangHardwareInterface {
  public:
   explicit WolfgangHardwareInterface(rclcpp::Node::SharedPtr nh);
@@ -25,17 +39,73 @@ class WolfgangHardwareInterface {
 
   void write(const rclcpp::Time &t, const rclcpp::Duration &dt);
 
+  /**
+   * Measures the phases of reading and writing with the given timing. Has to be called before the control loop starts.
+   */
+  void setTiming(LoopTiming *timing);
+
  private:
+  // device that answered a ping, with the model number it returned
+  struct FoundDevice {
+    std::string name;
+    int id;
+    uint16_t model_number;
+  };
   bool create_interfaces(std::vector<std::pair<std::string, int>> dxl_devices);
+  std::vector<std::vector<FoundDevice>> discoverDevices(const std::vector<std::shared_ptr<DynamixelDriver>> &drivers,
+                                                        const std::vector<std::pair<std::string, int>> &dxl_devices,
+                                                        bool only_cached);
+  void loadDeviceCache();
+  void saveDeviceCache(const std::vector<std::vector<FoundDevice>> &devices_on_ports);
+  void runPortPhase(size_t port, int phase);
+  void readPort(size_t port);
+  void writePort(size_t port);
+  void publishSchedule();
   rclcpp::Node::SharedPtr nh_;
 
   // two dimensional list of all hardware interfaces, sorted by port
   std::vector<std::vector<bitbots_ros_control::HardwareInterface *>> interfaces_;
+  // register windows of the interfaces which are read together, one scheduler per port
+  std::vector<std::shared_ptr<DeviceReadScheduler>> device_reads_;
+  std::vector<std::string> port_names_;
+  // distributes the low rate reads and diagnostics of all interfaces over the cycles
+  CycleScheduler cycle_scheduler_;
+  rclcpp::Publisher<diagnostic_msgs::msg::DiagnosticArray>::SharedPtr schedule_pub_;
+  // formats and publishes the diagnostics of all interfaces outside of the control loop
+  std::shared_ptr<DiagnosticsPublisher> diagnostics_;
+  // parameters that are used in the control loop, they are changed by the parameter callback
+  std::shared_ptr<ControlParameterCache> parameters_;
+
+  LoopTiming *timing_;
+  std::vector<size_t> port_read_phases_;
+  std::vector<size_t> port_write_phases_;
+  size_t servo_read_phase_;
+  size_t servo_write_phase_;
+  size_t core_read_phase_;
+  // overall servo interface since we need a single interface for the controllers
   DynamixelServoHardwareInterface servo_interface_;
   rclcpp::Publisher<bitbots_msgs::msg::Audio>::SharedPtr speak_pub_;
 
+  // one persistent thread per port which does the reading and writing
+  PortWorkerPool port_workers_;
+  // time and period of the current cycle, handed to the interfaces by the port workers
+  rclcpp::Time cycle_time_;
+  rclcpp::Duration cycle_period_;
+  // overlap the reading of the buses with the rest of the control loop
+  bool pipelined_;
+  bool reads_in_flight_;
+
   // prevent unnecessary error when power is turned on
   bool first_ping_error_;
+  // names of the devices found on each port at the last start, they are only verified instead of searching all ports
+  bool use_device_cache_;
+  std::string device_cache_file_;
+  std::map<std::string, std::vector<std::string>> device_cache_;
+  // records the raw data of the buses, the goals and the timing of the cycles, null if disabled
+  std::shared_ptr<BlackBoxRecorder> recorder_;
+  int cycle_source_;
+  LoopTiming::Clock::time_point cycle_start_;
+  int64_t cycle_read_ns_;
 
   bool only_imu_;
   bool only_pressure_;
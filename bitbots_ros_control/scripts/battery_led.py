@@ -2,7 +2,7 @@
 
 import rclpy
 from rclpy.node import Node
-from std_msgs.msg import ColorRGBA, Float64
+from std_msgs.msg import ColorRGBA, Float64, Float64MultiArray
 
 rclpy.init(args=None)
 node = Node("battery_led")
@@ -15,16 +15,30 @@ led_low = ColorRGBA(a=1.0, r=1.0, g=0.0, b=0.0)
 led_no = ColorRGBA(a=1.0, r=0.0, g=0.0, b=0.0)
 
 
-def vbat_cb(msg: Float64):
-    if msg.data > 16:
+# index of the battery voltage in the packed power state of the core
+POWER_STATE_VBAT = 2
+
+
+def show_vbat(vbat: float):
+    if vbat > 16:
         pub.publish(led_full)
-    elif msg.data > 14:
+    elif vbat > 14:
         pub.publish(led_mid)
-    elif msg.data > 13:
+    elif vbat > 13:
         pub.publish(led_low)
     else:
         pub.publish(led_no)
 
 
+def vbat_cb(msg: Float64):
+    show_vbat(msg.data)
+
+
+def power_state_cb(msg: Float64MultiArray):
+    show_vbat(msg.data[POWER_STATE_VBAT])
+
+
+# depending on core.packed_power_state, only one of them is published
 sub = node.create_subscription(Float64, "/core/vbat", vbat_cb, 1)
+power_state_sub = node.create_subscription(Float64MultiArray, "/core/power_state", power_state_cb, 1)
 rclpy.spin(node)
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Emulates the Dynamixel buses of the robot on pseudo terminals, so that the hardware interface can be run and
+benchmarked without a robot. Each port of the hardware config gets its own pty which answers protocol 2.0 ping, read,
+write, sync read/write and bulk read/write packets of the devices that are placed on this port.
+
+The responses are delayed by the time that the request and the response would need on a real bus with the configured
+baudrate, and single status packets can be dropped to emulate packet loss.
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import select
+import signal
+import struct
+import sys
+import time
+import tty
+
+import yaml
+
+HEADER = b"\xff\xff\xfd\x00"
+BROADCAST_ID = 0xFE
+
+INST_PING = 0x01
+INST_READ = 0x02
+INST_WRITE = 0x03
+INST_REG_WRITE = 0x04
+INST_ACTION = 0x05
+INST_REBOOT = 0x08
+INST_STATUS = 0x55
+INST_SYNC_READ = 0x82
+INST_SYNC_WRITE = 0x83
+INST_BULK_READ = 0x92
+INST_BULK_WRITE = 0x93
+
+ERROR_INSTRUCTION = 0x02
+ERROR_DATA_RANGE = 0x04
+
+# registers of the servos, the same for all used models (MX-64 and MX-106 with protocol 2.0, XH540)
+SERVO_MODELS = (311, 321, 1100)
+SERVO_TORQUE_ENABLE = 64
+SERVO_GOAL_POSITION = 116
+SERVO_PRESENT_POSITION = 132
+SERVO_PRESENT_VOLTAGE = 144
+SERVO_PRESENT_TEMPERATURE = 146
+CORE_MODEL = 0xABBA
+IMU_MODEL = 0xBAFF
+
+# size of the emulated control table of each device
+MEMORY_SIZE = 256
+
+
+def make_crc_table():
+    table = []
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x8005) if crc & 0x8000 else (crc << 1)
+        table.append(crc & 0xFFFF)
+    return table
+
+
+CRC_TABLE = make_crc_table()
+
+
+def crc16(data):
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) ^ CRC_TABLE[((crc >> 8) ^ byte) & 0xFF]) & 0xFFFF
+    return crc
+
+
+def stuff(payload):
+    """Adds the byte stuffing of protocol 2.0, so that the header can not appear inside of a packet"""
+    return payload.replace(b"\xff\xff\xfd", b"\xff\xff\xfd\xfd")
+
+
+def unstuff(payload):
+    return payload.replace(b"\xff\xff\xfd\xfd", b"\xff\xff\xfd")
+
+
+def status_packet(device_id, error, params=b""):
+    payload = stuff(bytes([INST_STATUS, error]) + params)
+    packet = HEADER + struct.pack("<BH", device_id, len(payload) + 2) + payload
+    return packet + struct.pack("<H", crc16(packet))
+
+
+class Device:
+    """Control table of one emulated device"""
+
+    def __init__(self, device_id, model_number):
+        self.id = device_id
+        self.model_number = model_number
+        self.memory = bytearray(MEMORY_SIZE)
+        struct.pack_into("<HB", self.memory, 0, model_number, 1)
+        self.memory[7] = device_id
+        if model_number in SERVO_MODELS:
+            # the servos are at their zero position, a present position of 0 is discarded by the servo interface
+            struct.pack_into("<i", self.memory, SERVO_PRESENT_POSITION, 2048)
+            struct.pack_into("<i", self.memory, SERVO_GOAL_POSITION, 2048)
+            struct.pack_into("<H", self.memory, SERVO_PRESENT_VOLTAGE, 150)
+            self.memory[SERVO_PRESENT_TEMPERATURE] = 35
+        elif model_number == CORE_MODEL:
+            # power is on, all voltages are plausible for a charged battery
+            self.memory[23] = 1
+            struct.pack_into("<HHHH", self.memory, 28, 827, 827, 827, 775)
+            struct.pack_into("<H", self.memory, 36, 1)
+            dividers = (3.3 / 4.5, 3.6 / 9.8, 2.2 / 9.0, 3.6 / 19.6, 6.2 / 42.2, 1.8 / 14.8)
+            for cell, divider in enumerate(dividers):
+                value = min(int(4.0 * (cell + 1) / (3.3 / 1024 * divider)), 0xFFFF)
+                struct.pack_into("<H", self.memory, 38 + 2 * cell, value)
+        elif model_number == IMU_MODEL:
+            # robot is standing still and upright, gravity is measured on the z axis, orientation is x, y, z, w
+            struct.pack_into("<f", self.memory, 56, 9.81)
+            struct.pack_into("<ffff", self.memory, 60, 0.0, 0.0, 0.0, 1.0)
+
+    def read(self, address, length):
+        if address + length > MEMORY_SIZE:
+            return None
+        return bytes(self.memory[address : address + length])
+
+    def write(self, address, data):
+        if address + len(data) > MEMORY_SIZE:
+            return False
+        self.memory[address : address + len(data)] = data
+        if self.model_number in SERVO_MODELS and self.memory[SERVO_TORQUE_ENABLE]:
+            # the servos reach their goal instantly
+            self.memory[SERVO_PRESENT_POSITION : SERVO_PRESENT_POSITION + 4] = self.memory[
+                SERVO_GOAL_POSITION : SERVO_GOAL_POSITION + 4
+            ]
+        return True
+
+
+class Bus:
+    """One emulated port with the devices that are connected to it"""
+
+    def __init__(self, name, link, baudrate, devices, packet_loss, rng):
+        self.name = name
+        self.link = link
+        self.byte_time = 10.0 / baudrate  # start bit, 8 data bits and stop bit
+        self.devices = {device.id: device for device in devices}
+        self.packet_loss = packet_loss
+        self.rng = rng
+        self.master, slave = os.openpty()
+        tty.setraw(slave)
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.ttyname(slave), link)
+        # keep the slave open, otherwise reading from the master fails while the hardware interface reconnects
+        self.slave = slave
+        self.buffer = bytearray()
+        self.bus_free = 0.0
+        self.packets = 0
+        self.dropped = 0
+
+    def close(self):
+        if os.path.islink(self.link):
+            os.remove(self.link)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def run(self):
+        try:
+            self.serve()
+        except KeyboardInterrupt:
+            pass
+
+    def serve(self):
+        last_report = time.monotonic()
+        while True:
+            if time.monotonic() - last_report > 10:
+                last_report = time.monotonic()
+                print(f"{self.name}: {self.packets} packets, {self.dropped} status packets dropped", flush=True)
+            readable, _, _ = select.select([self.master], [], [], 1.0)
+            if not readable:
+                continue
+            try:
+                chunk = os.read(self.master, 4096)
+            except OSError:
+                return
+            now = time.monotonic()
+            self.buffer += chunk
+            # the request is on the bus from the moment it was sent until all its bytes are transferred
+            self.bus_free = max(self.bus_free, now) + len(chunk) * self.byte_time
+            while self.handle_packet():
+                pass
+
+    def handle_packet(self):
+        start = self.buffer.find(HEADER)
+        if start < 0:
+            # keep the end, it could be the beginning of a header
+            del self.buffer[: max(len(self.buffer) - 3, 0)]
+            return False
+        del self.buffer[:start]
+        if len(self.buffer) < 7:
+            return False
+        device_id, length = struct.unpack_from("<BH", self.buffer, 4)
+        if len(self.buffer) < 7 + length:
+            return False
+        packet = bytes(self.buffer[: 7 + length])
+        del self.buffer[: 7 + length]
+        if length < 3 or crc16(packet[:-2]) != struct.unpack_from("<H", packet, len(packet) - 2)[0]:
+            # corrupted packets are ignored by the devices
+            return True
+        payload = unstuff(packet[7:-2])
+        self.packets += 1
+        self.respond(self.execute(device_id, payload[0], payload[1:]))
+        return True
+
+    def execute(self, device_id, instruction, params):
+        """
+        Executes an instruction on the addressed devices.
+        :return: status packets of the devices that answer, in the order in which they are sent
+        """
+        if instruction == INST_PING:
+            ids = sorted(self.devices) if device_id == BROADCAST_ID else [device_id]
+            return [
+                status_packet(i, 0, struct.pack("<HB", self.devices[i].model_number, 1))
+                for i in ids
+                if i in self.devices
+            ]
+        if instruction == INST_READ and len(params) == 4:
+            address, length = struct.unpack("<HH", params)
+            return self.read_status(device_id, address, length)
+        if instruction in (INST_WRITE, INST_REG_WRITE) and len(params) >= 2:
+            address = struct.unpack_from("<H", params)[0]
+            ids = sorted(self.devices) if device_id == BROADCAST_ID else [device_id]
+            responses = []
+            for i in ids:
+                if i in self.devices:
+                    success = self.devices[i].write(address, params[2:])
+                    responses.append(status_packet(i, 0 if success else ERROR_DATA_RANGE))
+            # broadcasts are not answered
+            return responses if device_id != BROADCAST_ID else []
+        if instruction == INST_SYNC_READ and len(params) >= 4:
+            address, length = struct.unpack_from("<HH", params)
+            responses = []
+            for i in params[4:]:
+                responses += self.read_status(i, address, length)
+            return responses
+        if instruction == INST_SYNC_WRITE and len(params) >= 4:
+            address, length = struct.unpack_from("<HH", params)
+            for offset in range(4, len(params) - length, length + 1):
+                device = self.devices.get(params[offset])
+                if device:
+                    device.write(address, params[offset + 1 : offset + 1 + length])
+            return []
+        if instruction == INST_BULK_READ:
+            responses = []
+            for offset in range(0, len(params) - 4, 5):
+                i, address, length = struct.unpack_from("<BHH", params, offset)
+                responses += self.read_status(i, address, length)
+            return responses
+        if instruction == INST_BULK_WRITE:
+            offset = 0
+            while offset + 5 <= len(params):
+                i, address, length = struct.unpack_from("<BHH", params, offset)
+                device = self.devices.get(i)
+                if device:
+                    device.write(address, params[offset + 5 : offset + 5 + length])
+                offset += 5 + length
+            return []
+        if instruction in (INST_ACTION, INST_REBOOT):
+            return [status_packet(device_id, 0)] if device_id in self.devices else []
+        if device_id in self.devices:
+            return [status_packet(device_id, ERROR_INSTRUCTION)]
+        return []
+
+    def read_status(self, device_id, address, length):
+        device = self.devices.get(device_id)
+        if device is None:
+            return []
+        data = device.read(address, length)
+        if data is None:
+            return [status_packet(device_id, ERROR_DATA_RANGE)]
+        return [status_packet(device_id, 0, data)]
+
+    def respond(self, responses):
+        for response in responses:
+            # the status packet is sent after the request (or the previous status packet) is completely transferred
+            self.bus_free += len(response) * self.byte_time
+            if self.packet_loss > 0 and self.rng.random() < self.packet_loss:
+                self.dropped += 1
+                continue
+            wait_until(self.bus_free)
+            os.write(self.master, response)
+
+
+def wait_until(deadline):
+    # sleeping is too coarse for transfers of a few microseconds, so the last part is busy waited
+    remaining = deadline - time.monotonic()
+    if remaining > 0.0005:
+        time.sleep(remaining - 0.0005)
+    while time.monotonic() < deadline:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hardware-config", required=True, help="config of the hardware interface, e.g. wolfgang.yaml")
+    parser.add_argument("--bus-config", required=True, help="placement of the devices on the ports")
+    parser.add_argument("--packet-loss", type=float, help="probability that a status packet is lost")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the packet loss, for repeatable runs")
+    args, _ = parser.parse_known_args()
+
+    with open(args.hardware_config) as f:
+        hardware_config = yaml.safe_load(f)["wolfgang_hardware_interface"]["ros__parameters"]
+    with open(args.bus_config) as f:
+        bus_config = yaml.safe_load(f)["dynamixel_bus_emulator"]
+    packet_loss = args.packet_loss if args.packet_loss is not None else bus_config.get("packet_loss", 0.0)
+    device_dir = bus_config["device_dir"]
+    os.makedirs(device_dir, exist_ok=True)
+
+    device_info = hardware_config["device_info"]
+    buses = []
+    for port_name, port_info in hardware_config["port_info"].items():
+        devices = {}
+        for name in bus_config["ports"].get(port_name, []):
+            # some boards provide multiple interfaces with the same id, e.g. the core and its LEDs
+            info = device_info[name]
+            devices.setdefault(info["id"], Device(info["id"], info["model_number"]))
+        bus = Bus(
+            port_name,
+            os.path.join(device_dir, port_name),
+            port_info["baudrate"],
+            devices.values(),
+            packet_loss,
+            random.Random(args.seed + len(buses)),
+        )
+        buses.append(bus)
+        print(f"{port_name}: {bus.link} with ids {sorted(bus.devices)}", flush=True)
+
+    # stopping the launch file sends SIGTERM, the links are removed in both cases
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    # one process per port, the busy waiting of one port would otherwise delay the others
+    processes = [multiprocessing.Process(target=bus.run, daemon=True) for bus in buses]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        for process in processes:
+            process.terminate()
+            process.join()
+        for bus in buses:
+            bus.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Runs the hardware interface against the emulated dynamixel buses (launch/ros_control_emulated.launch) in a number of
+scenarios and measures the cycle rate and the timing of the control loop in each of them.
+The rate is measured with the messages on /joint_states, the latencies are taken from /ros_control/loop_timing.
+In the service burst scenarios, bursts of LED and IMU service calls and LED messages are sent during the measurement,
+which shows how much the callbacks disturb the control loop with and without a separate callback thread.
+"""
+
+import argparse
+import os
+import re
+import signal
+import statistics
+import subprocess
+import time
+
+import rclpy
+import yaml
+from bitbots_msgs.srv import Leds
+from diagnostic_msgs.msg import DiagnosticArray
+from rclpy.node import Node
+from sensor_msgs.msg import JointState
+from std_msgs.msg import ColorRGBA
+from std_srvs.srv import Empty
+
+# launch arguments of each scenario
+SCENARIOS = {
+    "baseline": {},
+    "pipelined": {"pipelined": "true"},
+    "no_stagger": {"stagger": "false"},
+    "packet_loss_1": {"packet_loss": "0.01"},
+    "packet_loss_5": {"packet_loss": "0.05"},
+    "service_burst": {"burst": True},
+    "service_burst_separate_thread": {"burst": True, "separate_callback_thread": "true"},
+}
+
+TIMING_REGEX = re.compile(r"p50 ([\d.]+) us, p99 ([\d.]+) us, max ([\d.]+) us")
+COUNT_REGEX = re.compile(r"(\d+) \(")
+
+
+class LoopMonitor(Node):
+    def __init__(self):
+        super().__init__("emulated_bus_benchmark")
+        self.recording = False
+        self.joint_states = 0
+        self.timings = {}
+        self.counts = {}
+        self.create_subscription(JointState, "/joint_states", self.joint_state_cb, 10)
+        self.create_subscription(DiagnosticArray, "/ros_control/loop_timing", self.timing_cb, 10)
+        self.leds_client = self.create_client(Leds, "/set_leds")
+        self.gyro_client = self.create_client(Empty, "/imu/reset_gyro_calibration")
+        self.led_pubs = [self.create_publisher(ColorRGBA, f"/led{i}", 10) for i in range(3)]
+
+    def burst(self, size):
+        """Sends size service calls and LED messages at once, without waiting for the responses"""
+        leds = Leds.Request(leds=[ColorRGBA(r=0.5, a=1.0), ColorRGBA(g=0.5, a=1.0), ColorRGBA(b=0.5, a=1.0)])
+        for i in range(size):
+            if self.leds_client.service_is_ready():
+                self.leds_client.call_async(leds)
+            if self.gyro_client.service_is_ready():
+                self.gyro_client.call_async(Empty.Request())
+            # alternate the color, the interface ignores messages that do not change it
+            self.led_pubs[i % 3].publish(ColorRGBA(r=float(i % 2), a=1.0))
+
+    def reset(self):
+        self.joint_states = 0
+        self.timings = {}
+        self.counts = {}
+
+    def joint_state_cb(self, msg: JointState):
+        if self.recording:
+            self.joint_states += 1
+
+    def timing_cb(self, msg: DiagnosticArray):
+        if not self.recording:
+            return
+        for status in msg.status:
+            for value in status.values:
+                match = TIMING_REGEX.match(value.value)
+                if match:
+                    self.timings.setdefault(value.key, []).append([float(x) for x in match.groups()])
+                    continue
+                match = COUNT_REGEX.match(value.value)
+                if match:
+                    self.counts[value.key] = self.counts.get(value.key, 0) + int(match.group(1))
+
+    def summary(self, duration):
+        phases = {}
+        for phase, values in self.timings.items():
+            # the values are per second, the median of the medians is stable against single outliers
+            phases[phase] = {
+                "p50_us": statistics.median(v[0] for v in values),
+                "p99_us": max(v[1] for v in values),
+                "max_us": max(v[2] for v in values),
+            }
+        return {"cycle_rate_hz": self.joint_states / duration, "phases": phases, **self.counts}
+
+
+def spin_for(node, duration, burst_size=0, burst_period=1.0):
+    end = time.monotonic() + duration
+    next_burst = time.monotonic()
+    while time.monotonic() < end:
+        if burst_size and time.monotonic() >= next_burst:
+            node.burst(burst_size)
+            next_burst += burst_period
+        rclpy.spin_once(node, timeout_sec=0.01 if burst_size else 0.1)
+
+
+def run_scenario(node, scenario, warmup, duration, burst_size, burst_period):
+    launch_args = {key: value for key, value in scenario.items() if key != "burst"}
+    if not scenario.get("burst"):
+        burst_size = 0
+    command = ["ros2", "launch", "bitbots_ros_control", "ros_control_emulated.launch"]
+    command += [f"{key}:={value}" for key, value in launch_args.items()]
+    launch = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    try:
+        node.recording = False
+        spin_for(node, warmup)
+        node.reset()
+        node.recording = True
+        spin_for(node, duration, burst_size, burst_period)
+        node.recording = False
+        return node.summary(duration)
+    finally:
+        os.killpg(launch.pid, signal.SIGINT)
+        try:
+            launch.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            os.killpg(launch.pid, signal.SIGKILL)
+            launch.wait()
+
+
+def print_summary(name, summary):
+    print(f"\n{name}: {summary['cycle_rate_hz']:.1f} Hz", end="")
+    for key in ("overruns", "missed deadlines"):
+        if key in summary:
+            print(f", {summary[key]} {key}", end="")
+    print()
+    for phase, values in summary["phases"].items():
+        print(
+            f"  {phase:32s} p50 {values['p50_us']:9.1f} us  p99 {values['p99_us']:9.1f} us  max {values['max_us']:9.1f} us"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("scenarios", nargs="*", default=list(SCENARIOS), help=f"any of {', '.join(SCENARIOS)}")
+    parser.add_argument("--warmup", type=float, default=10.0, help="seconds until the measurement starts")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds that are measured per scenario")
+    parser.add_argument("--output", help="yaml file to which the results are written")
+    parser.add_argument("--burst-size", type=int, default=50, help="service calls per burst in the burst scenarios")
+    parser.add_argument("--burst-period", type=float, default=0.5, help="seconds between two bursts")
+    args = parser.parse_args()
+
+    rclpy.init()
+    node = LoopMonitor()
+    results = {}
+    try:
+        for name in args.scenarios:
+            results[name] = run_scenario(
+                node, SCENARIOS[name], args.warmup, args.duration, args.burst_size, args.burst_period
+            )
+            print_summary(name, results[name])
+    finally:
+        node.destroy_node()
+        rclpy.shutdown()
+    if args.output:
+        with open(args.output, "w") as f:
+            yaml.safe_dump(results, f, sort_keys=False)
+
+
+if __name__ == "__main__":
+    main()
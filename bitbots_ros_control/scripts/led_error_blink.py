@@ -1,13 +1,11 @@
 #!/usr/bin/env python3
 
 import rclpy
-from bitbots_msgs.srv import Leds
 from diagnostic_msgs.msg import DiagnosticStatus
 from rclpy.duration import Duration
 from rclpy.node import Node
 from std_msgs.msg import ColorRGBA
 
-BLINK_DURATION = 0.2
 ERROR_TIMEOUT = 1
 
 rclpy.init(args=None)
@@ -16,32 +14,16 @@ node = Node("led_error_blink")
 last_hardware_error_time = None
 # true means warning, false error
 warn_not_error = True
-currently_blinking = False
-leds_red = False
-led_set_time = None
+# color which was last sent to the LEDs, None while they are not blinking
+current_blink_color = None
 
-# set up service and prepare requests
-led_serv = node.create_client(Leds, "/set_leds")
-red_request = Leds.Request()
-red_leds_array = []
-for _i in range(3):
-    red_led = ColorRGBA()
-    red_led.r = 1.0
-    red_led.a = 1.0
-    red_leds_array.append(red_led)
-
-red_request.leds = red_leds_array
-
-orange_leds_array = []
-for _i in range(3):
-    orange_led = ColorRGBA()
-    orange_led.r = 1.0
-    orange_led.g = 0.5
-    orange_led.b = 0.0
-    orange_led.a = 1.0
-    orange_leds_array.append(orange_led)
-
-previous_req = Leds.Request()
+# the hardware interface does the blinking, we only tell it when to start and stop
+# the previous colors of the LEDs are shown again when it stops
+blink_pub = node.create_publisher(ColorRGBA, "/led_blink", 1)
+red = ColorRGBA(r=1.0, a=1.0)
+orange = ColorRGBA(r=1.0, g=0.5, b=0.0, a=1.0)
+# an alpha of 0 stops the blinking
+stop = ColorRGBA(a=0.0)
 
 
 def cb(msg: DiagnosticStatus):
@@ -49,57 +31,30 @@ def cb(msg: DiagnosticStatus):
     # we check if any status in the received array is not ok
     if msg.level != DiagnosticStatus.OK:
         warn_not_error = msg.level == DiagnosticStatus.WARN
-        last_hardware_error_time = node.get_clock().now().to_sec()
-
-
-def set_red():
-    global leds_red, red_request, warn_not_error
-    leds_red = True
-    # set orange or red
-    if warn_not_error:
-        red_request.leds = orange_leds_array
-    else:
-        red_request.leds = red_leds_array
-    previous_req.leds = led_serv.call(red_request).previous_leds
-
-
-def reset_leds():
-    global leds_red, previous_req
-    leds_red = False
-    led_serv.call(previous_req)
+        last_hardware_error_time = node.get_clock().now().nanoseconds / 1e9
 
 
 # wait a moment on startup, otherwise we will think there is a problem while ros control is still booting
-set_leds_service = node.create_client(Leds, "/set_leds")
-set_leds_service.wait_for_service()
+while rclpy.ok() and blink_pub.get_subscription_count() == 0:
+    node.get_clock().sleep_for(Duration(seconds=0.1))
 node.get_clock().sleep_for(Duration(seconds=1))
 
 node.create_subscription(DiagnosticStatus, "/diagnostics_toplevel_state", cb, 1)
 
-rate = node.create_rate(100)
-while rclpy.ok():
+
+def update():
+    global current_blink_color
+    blink_color = None
     if last_hardware_error_time is not None:
-        current_time = node.get_clock().now().to_sec()
-        if currently_blinking:
-            # we are currently blinking, check if the last hardware error is to long ago
-            if current_time - last_hardware_error_time > ERROR_TIMEOUT:
-                currently_blinking = False
-                reset_leds()
-                led_set_time = current_time
-            else:
-                if leds_red and current_time - led_set_time > BLINK_DURATION:
-                    # reset LEDs
-                    reset_leds()
-                    led_set_time = current_time
-                elif not leds_red and current_time - led_set_time > BLINK_DURATION:
-                    # set LEDs red
-                    set_red()
-                    led_set_time = current_time
-        else:
-            # we are not blinking, check if we want to start
-            if current_time - last_hardware_error_time < ERROR_TIMEOUT:
-                # start blinking
-                currently_blinking = True
-                set_red()
-                led_set_time = current_time
-    rate.sleep()
+        current_time = node.get_clock().now().nanoseconds / 1e9
+        if current_time - last_hardware_error_time < ERROR_TIMEOUT:
+            # blink orange or red
+            blink_color = orange if warn_not_error else red
+    # only changes are sent
+    if blink_color is not current_blink_color:
+        blink_pub.publish(stop if blink_color is None else blink_color)
+        current_blink_color = blink_color
+
+
+node.create_timer(0.1, update)
+rclpy.spin(node)
@@ -1,3 +1,4 @@
+#include <algorithm>
 #include <bitbots_ros_control/bitfoot_hardware_interface.hpp>
 #include <bitbots_ros_control/utils.hpp>
 
@@ -10,110 +11,112 @@ BitFootHardwareInterface::BitFootHardwareInterface(rclcpp::Node::SharedPtr nh, s
   id_ = id;
   topic_name_ = topic_name;
   name_ = name;
+  device_reads_ = nullptr;
+  diagnostics_ = nullptr;
+  parameters_ = nullptr;
+  current_pressure_.fill(0);
+  unchanged_reads_.fill(0);
+  reads_successful_ = true;
 }
 
 bool BitFootHardwareInterface::init() {
-  current_pressure_.resize(4, std::vector<double>());
   data_ = (uint8_t *)malloc(16 * sizeof(uint8_t));
+  nh_->get_parameter_or("bitfoot.max_unchanged_reads", max_unchanged_reads_, 10);
+  nh_->get_parameter_or("bitfoot.diagnostics_rate", diag_task_.rate, 100);
+  diag_task_.rate = std::max(diag_task_.rate, 1);
   pressure_pub_ = nh_->create_publisher<bitbots_msgs::msg::FootPressure>(topic_name_, 1);
-  diagnostic_pub_ = nh_->create_publisher<diagnostic_msgs::msg::DiagnosticArray>("/diagnostics", 10);
+  if (diagnostics_) {
+    // add prefix PS for pressure sensor to sort in diagnostic analyser
+    diagnostic_status_ = diagnostics_->addStatus(
+        "PS" + name_, std::to_string(id_),
+        {"Strain Gauge Left Back", "Strain Gauge Left Front", "Strain Gauge Right Back", "Strain Gauge Right Front"},
+        [](const DiagnosticRecord &record, diagnostic_msgs::msg::DiagnosticStatus &status) {
+          bool all_okay = true;
+          for (size_t i = 0; i < 4; i++) {
+            status.values[i].value = record.values[i] ? "Okay" : "Error";
+            all_okay &= record.values[i] != 0;
+          }
+          if (record.success) {
+            if (all_okay) {
+              status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
+              status.message = "OK";
+            } else {
+              status.level = diagnostic_msgs::msg::DiagnosticStatus::ERROR;
+              status.message = "Cable problem to strain gauge";
+            }
+          } else {
+            status.level = diagnostic_msgs::msg::DiagnosticStatus::ERROR;
+            status.message = "Could not read foot sensor";
+          }
+        });
+  }
   return true;
 }
 
+void BitFootHardwareInterface::addDeviceReads(DeviceReadScheduler *scheduler) {
+  device_reads_ = scheduler;
+  device_read_handle_ = scheduler->addWindow(id_, 36, 16);
+}
+
+void BitFootHardwareInterface::setDiagnostics(DiagnosticsPublisher *diagnostics) { diagnostics_ = diagnostics; }
+
+void BitFootHardwareInterface::setParameters(const ControlParameterCache *parameters) { parameters_ = parameters; }
+
+void BitFootHardwareInterface::addScheduledTasks(CycleScheduler *scheduler, size_t port) {
+  scheduler->addTask(port, "diagnostics " + name_, 10, &diag_task_);
+}
+
 void BitFootHardwareInterface::read(const rclcpp::Time &t, const rclcpp::Duration &dt) {
   /**
    * Reads the foot pressure sensors of the BitFoot
    */
+  if (parameters_) {
+    max_unchanged_reads_ = parameters_->get().max_unchanged_reads;
+  }
 
   // read foot
-  bool read_successful = true;
-  if (driver_->readMultipleRegisters(id_, 36, 16, data_)) {
+  bool data_available = device_reads_ ? device_reads_->getData(device_read_handle_, data_)
+                                      : driver_->readMultipleRegisters(id_, 36, 16, data_);
+  if (data_available) {
     for (int i = 0; i < 4; i++) {
       int32_t pres =
           dxlMakedword(dxlMakeword(data_[i * 4], data_[i * 4 + 1]), dxlMakeword(data_[i * 4 + 2], data_[i * 4 + 3]));
-      float pres_d = (float)pres;
       // we directly provide raw data since the scaling has to be calibrated by another node for every robot anyway
-      current_pressure_[i].push_back((double)pres_d);
+      double pres_d = (float)pres;
+      // the values are noisy, if one does not change there is a connection error on the board
+      if (pres_d != current_pressure_[i]) {
+        unchanged_reads_[i] = 0;
+      } else if (unchanged_reads_[i] < max_unchanged_reads_) {
+        unchanged_reads_[i]++;
+      }
+      current_pressure_[i] = pres_d;
     }
   } else {
     RCLCPP_ERROR_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 3000, "Could not read %s", name_.c_str());
-    read_successful = false;
+    reads_successful_ = false;
   }
 
-  msg_.header.stamp = nh_->get_clock()->now();
-  msg_.left_front = current_pressure_[0].back();
-  msg_.right_front = current_pressure_[1].back();
-  msg_.left_back = current_pressure_[2].back();
-  msg_.right_back = current_pressure_[3].back();
-  pressure_pub_->publish(msg_);
+  rclcpp::Time stamp = nh_->get_clock()->now();
+  publishMessage(pressure_pub_, msg_, [this, &stamp](bitbots_msgs::msg::FootPressure &msg) {
+    msg.header.stamp = stamp;
+    msg.left_front = current_pressure_[0];
+    msg.right_front = current_pressure_[1];
+    msg.left_back = current_pressure_[2];
+    msg.right_back = current_pressure_[3];
+  });
 
-  // wait till we have 10 values
-  if (current_pressure_[0].size() > 10) {
-    // erase older value
-    current_pressure_[0].erase(current_pressure_[0].begin());
-    // diagnostics. check if values are changing, otherwise there is a connection error on the board
-    diagnostic_msgs::msg::DiagnosticArray array_msg = diagnostic_msgs::msg::DiagnosticArray();
-    std::vector<diagnostic_msgs::msg::DiagnosticStatus> array = std::vector<diagnostic_msgs::msg::DiagnosticStatus>();
-    array_msg.header.stamp = nh_->get_clock()->now();
-    diagnostic_msgs::msg::DiagnosticStatus status = diagnostic_msgs::msg::DiagnosticStatus();
-    // add prefix PS for pressure sensor to sort in diagnostic analyser
-    status.name = "PS" + name_;
-    status.hardware_id = std::to_string(id_);
-    std::map<std::string, std::string> map;
-    bool all_okay = true;
-    for (int i = 0; i < 4; i++) {
-      std::string gauge_name;
-      if (i == 0) {
-        gauge_name = "Strain Gauge Left Front";
-      } else if (i == 1) {
-        gauge_name = "Strain Gauge Right Front";
-      } else if (i == 2) {
-        gauge_name = "Strain Gauge Left Back";
-      } else if (i == 3) {
-        gauge_name = "Strain Gauge Right Back";
-      }
-
-      bool okay = false;
-      double last = 0;
-      for (size_t j = 0; j < current_pressure_[i].size(); j++) {
-        if (last != current_pressure_[0][j]) {
-          okay = true;
-          break;
-        }
-      }
-      all_okay &= okay;
-      std::string okay_string;
-      if (okay) {
-        okay_string = "Okay";
-      } else {
-        okay_string = "Error";
-      }
-      map.insert(std::make_pair(gauge_name, okay_string));
-    }
-    if (read_successful) {
-      if (all_okay) {
-        status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
-        status.message = "OK";
-      } else {
-        status.level = diagnostic_msgs::msg::DiagnosticStatus::ERROR;
-        status.message = "Cable problem to strain gauge";
-      }
-    } else {
-      status.level = diagnostic_msgs::msg::DiagnosticStatus::ERROR;
-      status.message = "Could not read foot sensor";
-    }
-    std::vector<diagnostic_msgs::msg::KeyValue> keyValues = std::vector<diagnostic_msgs::msg::KeyValue>();
-    // iterate through map and save it into values
-    for (auto const &ent1 : map) {
-      diagnostic_msgs::msg::KeyValue key_value = diagnostic_msgs::msg::KeyValue();
-      key_value.key = ent1.first;
-      key_value.value = ent1.second;
-      keyValues.push_back(key_value);
+  if (diagnostics_ && diag_task_.isDue()) {
+    // the values are in the order of the keys of the status: left back, left front, right back, right front
+    DiagnosticRecord record;
+    record.status = diagnostic_status_;
+    record.success = reads_successful_;
+    record.stamp = nh_->get_clock()->now().nanoseconds();
+    const int gauges[] = {2, 0, 3, 1};
+    for (int k = 0; k < 4; k++) {
+      record.values[k] = unchanged_reads_[gauges[k]] < max_unchanged_reads_;
     }
-    status.values = keyValues;
-    array.push_back(status);
-    array_msg.status = array;
-    diagnostic_pub_->publish(array_msg);
+    diagnostics_->push(record);
+    reads_successful_ = true;
   }
 }
 
@@ -0,0 +1,181 @@
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+
+#include <bitbots_ros_control/black_box_recorder.hpp>
+#include <chrono>
+#include <cstring>
+
+namespace bitbots_ros_control {
+using namespace black_box;
+
+BlackBoxRecorder::~BlackBoxRecorder() {
+  if (memory_) {
+    munmap(memory_, size_);
+  }
+}
+
+bool BlackBoxRecorder::open(const std::string &path, size_t capacity) {
+  capacity = capacity / 8 * 8;
+  if (memory_ || capacity < 4 * recordSize(0)) {
+    return false;
+  }
+  int fd = ::open(path.c_str(), O_RDWR | O_CREAT | O_TRUNC, 0644);
+  if (fd < 0) {
+    return false;
+  }
+  size_t size = sizeof(FileHeader) + capacity;
+  if (ftruncate(fd, off_t(size)) != 0) {
+    ::close(fd);
+    return false;
+  }
+  void *memory = mmap(nullptr, size, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+  ::close(fd);
+  if (memory == MAP_FAILED) {
+    return false;
+  }
+  // touch all pages now, so that the control loop does not wait for page faults when it writes a page the first time
+  memset(memory, 0, size);
+  memory_ = static_cast<uint8_t *>(memory);
+  size_ = size;
+  header_ = reinterpret_cast<FileHeader *>(memory_);
+  data_ = memory_ + sizeof(FileHeader);
+  memcpy(header_->magic, MAGIC, sizeof(MAGIC));
+  header_->version = VERSION;
+  header_->capacity = capacity;
+  return true;
+}
+
+int BlackBoxRecorder::addSource(const std::string &name, const void *info, size_t info_length) {
+  if (!header_ || info_length > MAX_SOURCE_INFO) {
+    return -1;
+  }
+  // the interfaces are initialized by one thread per port
+  while (lock_.test_and_set(std::memory_order_acquire)) {
+  }
+  int index = -1;
+  if (header_->source_count < MAX_SOURCES) {
+    index = int(header_->source_count);
+    Source &source = header_->sources[index];
+    strncpy(source.name, name.c_str(), sizeof(source.name) - 1);
+    source.info_length = uint32_t(info_length);
+    if (info_length > 0) {
+      memcpy(source.info, info, info_length);
+    }
+    header_->source_count++;
+  }
+  lock_.clear(std::memory_order_release);
+  return index;
+}
+
+void BlackBoxRecorder::dropOldest() {
+  const RecordHeader *oldest = reinterpret_cast<const RecordHeader *>(data_ + header_->tail);
+  if (oldest->source == WRAP_SOURCE) {
+    header_->tail = 0;
+  } else {
+    header_->tail += recordSize(oldest->length);
+    header_->record_count--;
+  }
+}
+
+void BlackBoxRecorder::record(int source, const void *data, size_t length) {
+  /**
+   * The records are written one after another. When a record does not fit before the end of the data area, a wrap
+   * record is written instead and the record is written at the start. Before a record is written, the oldest records
+   * which it overlaps are dropped.
+   */
+  if (!header_ || source < 0) {
+    return;
+  }
+  uint64_t size = recordSize(length);
+  if (size > header_->capacity / 2) {
+    return;
+  }
+  int64_t stamp =
+      std::chrono::duration_cast<std::chrono::nanoseconds>(std::chrono::steady_clock::now().time_since_epoch()).count();
+  while (lock_.test_and_set(std::memory_order_acquire)) {
+  }
+  // there is always space for a wrap record after the head
+  if (header_->head + size + sizeof(RecordHeader) > header_->capacity) {
+    // the records behind the head are older than the ones at the start, they can not be read anymore
+    while (header_->record_count > 0 && header_->tail >= header_->head) {
+      dropOldest();
+    }
+    RecordHeader *wrap = reinterpret_cast<RecordHeader *>(data_ + header_->head);
+    *wrap = RecordHeader{0, WRAP_SOURCE, 0, cycle_.load(std::memory_order_relaxed), stamp};
+    header_->head = 0;
+  }
+  while (header_->record_count > 0 && header_->tail >= header_->head && header_->tail < header_->head + size) {
+    dropOldest();
+  }
+  if (header_->record_count == 0) {
+    header_->tail = header_->head;
+  }
+  RecordHeader *record = reinterpret_cast<RecordHeader *>(data_ + header_->head);
+  *record = RecordHeader{uint32_t(length), uint16_t(source), 0, cycle_.load(std::memory_order_relaxed), stamp};
+  memcpy(record + 1, data, length);
+  header_->head += size;
+  header_->record_count++;
+  lock_.clear(std::memory_order_release);
+}
+
+BlackBoxReader::~BlackBoxReader() {
+  if (memory_) {
+    munmap(memory_, size_);
+  }
+}
+
+bool BlackBoxReader::open(const std::string &path) {
+  int fd = ::open(path.c_str(), O_RDONLY);
+  if (fd < 0) {
+    return false;
+  }
+  struct stat file_stat;
+  if (fstat(fd, &file_stat) != 0 || size_t(file_stat.st_size) < sizeof(FileHeader)) {
+    ::close(fd);
+    return false;
+  }
+  size_t size = size_t(file_stat.st_size);
+  void *memory = mmap(nullptr, size, PROT_READ, MAP_SHARED, fd, 0);
+  ::close(fd);
+  if (memory == MAP_FAILED) {
+    return false;
+  }
+  memory_ = static_cast<uint8_t *>(memory);
+  size_ = size;
+  header_ = reinterpret_cast<const FileHeader *>(memory_);
+  return memcmp(header_->magic, MAGIC, sizeof(MAGIC)) == 0 && header_->version == VERSION &&
+         sizeof(FileHeader) + header_->capacity <= size_;
+}
+
+bool BlackBoxReader::forEach(
+    const std::function<void(const black_box::RecordHeader &, const uint8_t *)> &callback) const {
+  const uint8_t *data = memory_ + sizeof(FileHeader);
+  uint64_t position = header_->tail;
+  uint64_t read = 0;
+  bool wrapped = false;
+  while (read < header_->record_count) {
+    if (position + sizeof(RecordHeader) > header_->capacity) {
+      return false;
+    }
+    const RecordHeader *record = reinterpret_cast<const RecordHeader *>(data + position);
+    if (record->source == WRAP_SOURCE) {
+      // the records can only wrap around once
+      if (wrapped) {
+        return false;
+      }
+      wrapped = true;
+      position = 0;
+      continue;
+    }
+    if (record->source >= header_->source_count || position + recordSize(record->length) > header_->capacity) {
+      return false;
+    }
+    callback(*record, reinterpret_cast<const uint8_t *>(record + 1));
+    position += recordSize(record->length);
+    read++;
+  }
+  return true;
+}
+}  // namespace bitbots_ros_control
@@ -0,0 +1,52 @@
+#include <bitbots_ros_control/bulk_reader.hpp>
+
+namespace bitbots_ros_control {
+
+BulkReader::BulkReader() : port_handler_(nullptr), packet_handler_(dynamixel::PacketHandler::getPacketHandler(2.0)) {}
+
+BulkReader::~BulkReader() {
+  if (port_handler_ != nullptr) {
+    port_handler_->closePort();
+    delete port_handler_;
+  }
+}
+
+bool BulkReader::open(const std::string &device_file, int baudrate) {
+  if (port_handler_ == nullptr) {
+    port_handler_ = dynamixel::PortHandler::getPortHandler(device_file.c_str());
+  }
+  return port_handler_->openPort() && port_handler_->setBaudRate(baudrate);
+}
+
+void BulkReader::clear() {
+  windows_.clear();
+  param_.clear();
+}
+
+void BulkReader::addWindow(uint8_t id, uint16_t address, uint16_t length, uint8_t *data) {
+  windows_.push_back({id, length, data});
+  // parameters of one device in a protocol 2.0 bulk read: id, address and length, both in little endian
+  param_.push_back(id);
+  param_.push_back(address & 0xFF);
+  param_.push_back(address >> 8);
+  param_.push_back(length & 0xFF);
+  param_.push_back(length >> 8);
+}
+
+size_t BulkReader::read() {
+  if (port_handler_ == nullptr || windows_.empty()) {
+    return 0;
+  }
+  if (packet_handler_->bulkReadTx(port_handler_, param_.data(), param_.size()) != COMM_SUCCESS) {
+    return 0;
+  }
+  size_t received = 0;
+  for (const Window &window : windows_) {
+    if (packet_handler_->readRx(port_handler_, window.id, window.length, window.data) != COMM_SUCCESS) {
+      break;
+    }
+    received++;
+  }
+  return received;
+}
+}  // namespace bitbots_ros_control
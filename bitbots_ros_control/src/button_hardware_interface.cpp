@@ -1,3 +1,4 @@
+#include <algorithm>
 #include <bitbots_ros_control/button_hardware_interface.hpp>
 
 namespace bitbots_ros_control {
@@ -7,24 +8,55 @@ ButtonHardwareInterface::ButtonHardwareInterface(rclcpp::Node::SharedPtr nh, std
   driver_ = driver;
   id_ = id;
   topic_ = topic;
-  read_rate_ = read_rate;
+  read_rate_ = std::max(read_rate, 1);
+  counter_ = 0;
+  device_reads_ = nullptr;
+  diagnostics_ = nullptr;
 }
 
 bool ButtonHardwareInterface::init() {
   data_ = (uint8_t *)malloc(3 * sizeof(uint8_t));
   button_pub_ = nh_->create_publisher<bitbots_msgs::msg::Buttons>(topic_, 1);
-  diagnostic_pub_ = nh_->create_publisher<diagnostic_msgs::msg::DiagnosticArray>("/diagnostics", 10);
+  if (diagnostics_) {
+    // add prefix BUTTON to sort in diagnostic analyser
+    diagnostic_status_ =
+        diagnostics_->addStatus("BUTTONButton", std::to_string(id_), {},
+                                [](const DiagnosticRecord &record, diagnostic_msgs::msg::DiagnosticStatus &status) {
+                                  if (record.success) {
+                                    status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
+                                    status.message = "OK";
+                                  } else {
+                                    status.level = diagnostic_msgs::msg::DiagnosticStatus::STALE;
+                                    status.message = "No response";
+                                  }
+                                });
+  }
   return true;
 }
 
+void ButtonHardwareInterface::addDeviceReads(DeviceReadScheduler *scheduler) {
+  device_reads_ = scheduler;
+  device_read_handle_ = scheduler->addWindow(id_, 76, 3, read_rate_);
+}
+
+void ButtonHardwareInterface::setDiagnostics(DiagnosticsPublisher *diagnostics) { diagnostics_ = diagnostics; }
+
 void ButtonHardwareInterface::read(const rclcpp::Time &t, const rclcpp::Duration &dt) {
   /**
    * Reads the buttons
    */
-  counter_ = (counter_ + 1) % read_rate_;
-  if (counter_ != 0) return;
+  bool data_available;
+  if (device_reads_) {
+    // the scheduler decides in which cycles the buttons are read
+    if (!device_reads_->isDue(device_read_handle_)) return;
+    data_available = device_reads_->getData(device_read_handle_, data_);
+  } else {
+    counter_ = (counter_ + 1) % read_rate_;
+    if (counter_ != 0) return;
+    data_available = driver_->readMultipleRegisters(id_, 76, 3, data_);
+  }
   bool read_successful = true;
-  if (driver_->readMultipleRegisters(id_, 76, 3, data_)) {
+  if (data_available) {
     bitbots_msgs::msg::Buttons msg;
     msg.button1 = data_[0];
     msg.button2 = data_[1];
@@ -35,25 +67,14 @@ void ButtonHardwareInterface::read(const rclcpp::Time &t, const rclcpp::Duration
     read_successful = false;
   }
 
-  // diagnostics. check if values are changing, otherwise there is a connection error on the board
-  diagnostic_msgs::msg::DiagnosticArray array_msg = diagnostic_msgs::msg::DiagnosticArray();
-  std::vector<diagnostic_msgs::msg::DiagnosticStatus> array = std::vector<diagnostic_msgs::msg::DiagnosticStatus>();
-  array_msg.header.stamp = nh_->get_clock()->now();
-  diagnostic_msgs::msg::DiagnosticStatus status = diagnostic_msgs::msg::DiagnosticStatus();
-  // add prefix CORE to sort in diagnostic analyser
-  status.name = "BUTTONButton";
-  status.hardware_id = std::to_string(id_);
-
-  if (read_successful) {
-    status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
-    status.message = "OK";
-  } else {
-    status.level = diagnostic_msgs::msg::DiagnosticStatus::STALE;
-    status.message = "No response";
+  // diagnostics, the message is built by the diagnostics thread
+  if (diagnostics_) {
+    DiagnosticRecord record;
+    record.status = diagnostic_status_;
+    record.success = read_successful;
+    record.stamp = nh_->get_clock()->now().nanoseconds();
+    diagnostics_->push(record);
   }
-  array.push_back(status);
-  array_msg.status = array;
-  diagnostic_pub_->publish(array_msg);
 }
 
 // we don't write anything to the buttons
@@ -0,0 +1,79 @@
+#include <bitbots_ros_control/control_parameters.hpp>
+
+namespace bitbots_ros_control {
+
+static ControlParameters loadControlParameters(rclcpp::Node::SharedPtr nh) {
+  ControlParameters parameters;
+  nh->get_parameter_or("servos.set_ROM_RAM", parameters.set_rom_ram, parameters.set_rom_ram);
+  nh->get_parameter_or("servos.write_deadband", parameters.write_deadband, parameters.write_deadband);
+  nh->get_parameter_or("bitfoot.max_unchanged_reads", parameters.max_unchanged_reads, parameters.max_unchanged_reads);
+  if (parameters.max_unchanged_reads < 1) {
+    RCLCPP_WARN(nh->get_logger(), "bitfoot.max_unchanged_reads has to be positive, using 1");
+    parameters.max_unchanged_reads = 1;
+  }
+  return parameters;
+}
+
+static bool isRateParameter(const std::string &name) {
+  static const std::string READ_RATE = ".read_rate";
+  return name == "bitfoot.diagnostics_rate" || name == "servos.VT_update_rate" ||
+         (name.rfind("device_info.", 0) == 0 && name.size() > READ_RATE.size() &&
+          name.compare(name.size() - READ_RATE.size(), READ_RATE.size(), READ_RATE) == 0);
+}
+
+ControlParameterCache::ControlParameterCache(rclcpp::Node::SharedPtr nh)
+    : nh_(nh), parameters_(loadControlParameters(nh)), buffer_(parameters_) {
+  callback_handle_ = nh_->add_on_set_parameters_callback(
+      std::bind(&ControlParameterCache::onSetParameters, this, std::placeholders::_1));
+}
+
+rcl_interfaces::msg::SetParametersResult ControlParameterCache::onSetParameters(
+    const std::vector<rclcpp::Parameter> &parameters) {
+  /**
+   * Checks the changed parameters and hands the new snapshot to the control loop. Of the other parameters, which are
+   * only read during the initialization, only the read and diagnostic rates are checked.
+   */
+  rcl_interfaces::msg::SetParametersResult result;
+  result.successful = true;
+  ControlParameters changed = parameters_;
+  for (const rclcpp::Parameter &parameter : parameters) {
+    const std::string &name = parameter.get_name();
+    if (name == "servos.set_ROM_RAM") {
+      if (parameter.get_type() != rclcpp::ParameterType::PARAMETER_BOOL) {
+        result.reason = name + " has to be a bool";
+      } else {
+        changed.set_rom_ram = parameter.as_bool();
+      }
+    } else if (name == "servos.write_deadband") {
+      if (parameter.get_type() != rclcpp::ParameterType::PARAMETER_INTEGER || parameter.as_int() < 0) {
+        result.reason = name + " has to be an integer that is not negative";
+      } else {
+        changed.write_deadband = int(parameter.as_int());
+      }
+    } else if (name == "bitfoot.max_unchanged_reads") {
+      // with 0, every sensor would count as disconnected
+      if (parameter.get_type() != rclcpp::ParameterType::PARAMETER_INTEGER || parameter.as_int() < 1) {
+        result.reason = name + " has to be a positive integer";
+      } else {
+        changed.max_unchanged_reads = int(parameter.as_int());
+      }
+    } else if (isRateParameter(name)) {
+      // the rates are only read during the initialization, but a rate of 0 would divide by zero in the schedule
+      if (parameter.get_type() != rclcpp::ParameterType::PARAMETER_INTEGER || parameter.as_int() < 1) {
+        result.reason = name + " has to be a positive integer";
+      }
+    }
+  }
+  if (!result.reason.empty()) {
+    result.successful = false;
+    return result;
+  }
+  if (changed.set_rom_ram != parameters_.set_rom_ram || changed.write_deadband != parameters_.write_deadband ||
+      changed.max_unchanged_reads != parameters_.max_unchanged_reads) {
+    parameters_ = changed;
+    buffer_.writeBuffer() = parameters_;
+    buffer_.publish();
+  }
+  return result;
+}
+}  // namespace bitbots_ros_control
@@ -1,3 +1,4 @@
+#include <algorithm>
 #include <bitbots_ros_control/core_hardware_interface.hpp>
 
 namespace bitbots_ros_control {
@@ -7,12 +8,14 @@ CoreHardwareInterface::CoreHardwareInterface(rclcpp::Node::SharedPtr nh, std::sh
   nh_ = nh;
   driver_ = driver;
   id_ = id;
-  read_rate_ = read_rate;
-  read_counter_ = 0;
+  read_task_.rate = std::max(read_rate, 1);
   requested_power_status_ = true;
   power_switch_status_.data = false;
   power_control_status_.data = false;
   last_read_successful_ = false;
+  diagnostics_ = nullptr;
+  recorder_ = nullptr;
+  recorder_source_ = -1;
 }
 
 bool CoreHardwareInterface::switch_power(std::shared_ptr<std_srvs::srv::SetBool::Request> req,
@@ -25,16 +28,49 @@ bool CoreHardwareInterface::switch_power(std::shared_ptr<std_srvs::srv::SetBool:
 
 bool CoreHardwareInterface::init() {
   VBAT_individual_.data.resize(6);
-  data_ = (uint8_t *)malloc(16 * sizeof(uint8_t));
-  power_pub_ = nh_->create_publisher<std_msgs::msg::Bool>("/core/power_switch_status", 1);
-  vcc_pub_ = nh_->create_publisher<std_msgs::msg::Float64>("/core/vcc", 1);
-  vbat_pub_ = nh_->create_publisher<std_msgs::msg::Float64>("/core/vbat", 1);
-  vbat_individual_pub_ = nh_->create_publisher<std_msgs::msg::Float64MultiArray>("/core/vbat_cells", 1);
-  vext_pub_ = nh_->create_publisher<std_msgs::msg::Float64>("/core/vext", 1);
-  vdxl_pub_ = nh_->create_publisher<std_msgs::msg::Float64>("/core/vdxl", 1);
-  current_pub_ = nh_->create_publisher<std_msgs::msg::Float64>("/core/current", 1);
+  data_ = (uint8_t *)malloc(27 * sizeof(uint8_t));
+  nh_->get_parameter_or("core.packed_power_state", packed_power_state_, false);
+  if (packed_power_state_) {
+    std_msgs::msg::MultiArrayDimension dim;
+    dim.label = "power_switch_status, vcc, vbat, vext, vdxl, current, vbat_cells[6]";
+    dim.size = VBAT_CELLS + VBAT_individual_.data.size();
+    dim.stride = dim.size;
+    power_state_.layout.dim.push_back(dim);
+    power_state_.data.resize(dim.size, 0);
+    power_state_pub_ = nh_->create_publisher<std_msgs::msg::Float64MultiArray>("/core/power_state", 1);
+  } else {
+    power_pub_ = nh_->create_publisher<std_msgs::msg::Bool>("/core/power_switch_status", 1);
+    vcc_pub_ = nh_->create_publisher<std_msgs::msg::Float64>("/core/vcc", 1);
+    vbat_pub_ = nh_->create_publisher<std_msgs::msg::Float64>("/core/vbat", 1);
+    vbat_individual_pub_ = nh_->create_publisher<std_msgs::msg::Float64MultiArray>("/core/vbat_cells", 1);
+    vext_pub_ = nh_->create_publisher<std_msgs::msg::Float64>("/core/vext", 1);
+    vdxl_pub_ = nh_->create_publisher<std_msgs::msg::Float64>("/core/vdxl", 1);
+    current_pub_ = nh_->create_publisher<std_msgs::msg::Float64>("/core/current", 1);
+  }
 
-  diagnostic_pub_ = nh_->create_publisher<diagnostic_msgs::msg::DiagnosticArray>("/diagnostics", 10);
+  if (recorder_) {
+    recorder_source_ = recorder_->addSource("core");
+  }
+  if (diagnostics_) {
+    // add prefix CORE to sort in diagnostic analyser
+    diagnostic_status_ = diagnostics_->addStatus(
+        "CORECORE", std::to_string(id_),
+        {"Current", "VBAT", "VCC", "VDXL", "VEXT", "power_control_status", "power_switch_status"},
+        [](const DiagnosticRecord &record, diagnostic_msgs::msg::DiagnosticStatus &status) {
+          for (size_t i = 0; i < 5; i++) {
+            DiagnosticsPublisher::setValue(status, i, record.values[i]);
+          }
+          status.values[5].value = record.values[5] ? "ON" : "OFF";
+          status.values[6].value = record.values[6] ? "ON" : "OFF";
+          if (record.success) {
+            status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
+            status.message = "OK";
+          } else {
+            status.level = diagnostic_msgs::msg::DiagnosticStatus::STALE;
+            status.message = "No response";
+          }
+        });
+  }
 
   // service to switch power
   power_switch_service_ = nh_->create_service<std_srvs::srv::SetBool>(
@@ -48,16 +84,26 @@ bool CoreHardwareInterface::get_power_status() {
   return power_control_status_.data && power_switch_status_.data;
 }
 
+void CoreHardwareInterface::setDiagnostics(DiagnosticsPublisher *diagnostics) { diagnostics_ = diagnostics; }
+
+void CoreHardwareInterface::setRecorder(BlackBoxRecorder *recorder) { recorder_ = recorder; }
+
+void CoreHardwareInterface::addScheduledTasks(CycleScheduler *scheduler, size_t port) {
+  scheduler->addTask(port, "read CORE", 27 + 25, &read_task_);
+}
+
 void CoreHardwareInterface::read(const rclcpp::Time &t, const rclcpp::Duration &dt) {
   /**
    * Reads the CORE board
    */
 
-  if (read_counter_ % read_rate_ == 0) {
-    read_counter_ = 0;
+  if (read_task_.isDue()) {
     // read core
     last_read_successful_ = true;
     if (driver_->readMultipleRegisters(id_, 23, 27, data_)) {
+      if (recorder_) {
+        recorder_->record(recorder_source_, data_, 27);
+      }
       // we read one string of bytes. see CORE firmware for definition of registers
       // convert to volt
       power_control_status_.data = data_[0];
@@ -82,72 +128,53 @@ void CoreHardwareInterface::read(const rclcpp::Time &t, const rclcpp::Duration &
           ((float)dxlMakeword(data_[25], data_[26])) * (3.3 / 1024) * (1.8 / (13.0 + 1.8)) - VBAT_individual_.data[4];
       VBAT_.data = ((float)dxlMakeword(data_[25], data_[26])) * (3.3 / 1024) * (1.8 / (13.0 + 1.8));
 
-      power_pub_->publish(power_switch_status_);
-      vcc_pub_->publish(VCC_);
-      vbat_pub_->publish(VBAT_);
-      vbat_individual_pub_->publish(VBAT_individual_);
-      vext_pub_->publish(VEXT_);
-      vdxl_pub_->publish(VDXL_);
-      current_pub_->publish(current_);
+      if (packed_power_state_) {
+        power_state_.data[POWER_SWITCH_STATUS] = power_switch_status_.data;
+        power_state_.data[VCC] = VCC_.data;
+        power_state_.data[VBAT] = VBAT_.data;
+        power_state_.data[VEXT] = VEXT_.data;
+        power_state_.data[VDXL] = VDXL_.data;
+        power_state_.data[CURRENT] = current_.data;
+        std::copy(VBAT_individual_.data.begin(), VBAT_individual_.data.end(), power_state_.data.begin() + VBAT_CELLS);
+        publishMessage(power_state_pub_, power_state_);
+      } else {
+        publishMessage(power_pub_, power_switch_status_);
+        publishMessage(vcc_pub_, VCC_);
+        publishMessage(vbat_pub_, VBAT_);
+        publishMessage(vbat_individual_pub_, VBAT_individual_);
+        publishMessage(vext_pub_, VEXT_);
+        publishMessage(vdxl_pub_, VDXL_);
+        publishMessage(current_pub_, current_);
+      }
     } else {
       RCLCPP_ERROR_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 3000, "Could not read CORE sensor");
       last_read_successful_ = false;
     }
 
-    // diagnostics. check if values are changing, otherwise there is a connection error on the board
-    diagnostic_msgs::msg::DiagnosticArray array_msg = diagnostic_msgs::msg::DiagnosticArray();
-    std::vector<diagnostic_msgs::msg::DiagnosticStatus> array = std::vector<diagnostic_msgs::msg::DiagnosticStatus>();
-    array_msg.header.stamp = nh_->get_clock()->now();
-    diagnostic_msgs::msg::DiagnosticStatus status = diagnostic_msgs::msg::DiagnosticStatus();
-    // add prefix CORE to sort in diagnostic analyser
-    status.name = "CORECORE";
-    status.hardware_id = std::to_string(id_);
-    std::map<std::string, std::string> map;
-
-    if (power_switch_status_.data) {
-      map.insert(std::make_pair("power_switch_status", "ON"));
-    } else {
-      map.insert(std::make_pair("power_switch_status", "OFF"));
-    }
-    if (power_control_status_.data) {
-      map.insert(std::make_pair("power_control_status", "ON"));
-    } else {
-      map.insert(std::make_pair("power_control_status", "OFF"));
-    }
-    map.insert(std::make_pair("VCC", std::to_string(VCC_.data)));
-    map.insert(std::make_pair("VBAT", std::to_string(VBAT_.data)));
-    map.insert(std::make_pair("VEXT", std::to_string(VEXT_.data)));
-    map.insert(std::make_pair("VDXL", std::to_string(VDXL_.data)));
-    map.insert(std::make_pair("Current", std::to_string(current_.data)));
-
-    if (last_read_successful_) {
-      status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
-      status.message = "OK";
-    } else {
-      status.level = diagnostic_msgs::msg::DiagnosticStatus::STALE;
-      status.message = "No response";
-    }
-    std::vector<diagnostic_msgs::msg::KeyValue> keyValues = std::vector<diagnostic_msgs::msg::KeyValue>();
-    // iterate through map and save it into values
-    for (auto const &ent1 : map) {
-      diagnostic_msgs::msg::KeyValue key_value = diagnostic_msgs::msg::KeyValue();
-      key_value.key = ent1.first;
-      key_value.value = ent1.second;
-      keyValues.push_back(key_value);
+    // diagnostics, the message is built by the diagnostics thread
+    if (diagnostics_) {
+      DiagnosticRecord record;
+      record.status = diagnostic_status_;
+      record.success = last_read_successful_;
+      record.stamp = nh_->get_clock()->now().nanoseconds();
+      record.values[0] = current_.data;
+      record.values[1] = VBAT_.data;
+      record.values[2] = VCC_.data;
+      record.values[3] = VDXL_.data;
+      record.values[4] = VEXT_.data;
+      record.values[5] = power_control_status_.data;
+      record.values[6] = power_switch_status_.data;
+      diagnostics_->push(record);
     }
-    status.values = keyValues;
-    array.push_back(status);
-    array_msg.status = array;
-    diagnostic_pub_->publish(array_msg);
   }
-  read_counter_++;
 }
 
 void CoreHardwareInterface::write(const rclcpp::Time &t, const rclcpp::Duration &dt) {
   // we only need to write something if requested power status and current power status do not match
   // we don't use power_switch_status here because we cannot overwrite the physical switch
-  if (requested_power_status_ != power_control_status_.data && last_read_successful_) {
-    driver_->writeRegister(id_, "Power", requested_power_status_);
+  bool requested_power_status = requested_power_status_;
+  if (requested_power_status != power_control_status_.data && last_read_successful_) {
+    driver_->writeRegister(id_, "Power", requested_power_status);
   }
 }
 }  // namespace bitbots_ros_control
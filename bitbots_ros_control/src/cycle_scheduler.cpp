@@ -0,0 +1,93 @@
+#include <algorithm>
+#include <bitbots_ros_control/cycle_scheduler.hpp>
+#include <numeric>
+
+namespace bitbots_ros_control {
+
+// the load is tracked over the least common multiple of all rates, but not longer than this
+const int MAX_PERIOD = 10000;
+
+void CycleScheduler::clear() { entries_.clear(); }
+
+void CycleScheduler::addTask(size_t port, const std::string &name, int cost, ScheduledTask *task) {
+  task->rate = std::max(task->rate, 1);
+  task->offset = 0;
+  task->current_cycle = &cycle_;
+  entries_.push_back({port, name, cost, task});
+}
+
+int CycleScheduler::getPeriod(size_t port) const {
+  int period = 1;
+  for (const Entry &entry : entries_) {
+    if (entry.port == port) {
+      period = std::min(std::lcm(period, entry.task->rate), MAX_PERIOD);
+    }
+  }
+  return period;
+}
+
+void CycleScheduler::plan(bool stagger) {
+  for (Entry &entry : entries_) {
+    entry.task->offset = 0;
+  }
+  if (!stagger) {
+    return;
+  }
+  size_t num_ports = 0;
+  for (const Entry &entry : entries_) {
+    num_ports = std::max(num_ports, entry.port + 1);
+  }
+  for (size_t port = 0; port < num_ports; port++) {
+    std::vector<int> load(getPeriod(port), 0);
+    // the most expensive tasks are placed first, they have the most influence on the peak load
+    std::vector<Entry *> tasks;
+    for (Entry &entry : entries_) {
+      if (entry.port == port) {
+        tasks.push_back(&entry);
+      }
+    }
+    std::stable_sort(tasks.begin(), tasks.end(), [](const Entry *a, const Entry *b) {
+      if (a->task->rate != b->task->rate) {
+        // tasks of every cycle first, they can not be moved
+        return a->task->rate < b->task->rate;
+      }
+      return a->cost > b->cost;
+    });
+    for (Entry *entry : tasks) {
+      int rate = entry->task->rate;
+      // choose the offset with the smallest peak, a task with offset o runs in the cycles rate - o + k * rate
+      int best_offset = 0;
+      int best_peak = -1;
+      for (int offset = 0; offset < rate; offset++) {
+        int peak = 0;
+        for (size_t cycle = (rate - offset) % rate; cycle < load.size(); cycle += rate) {
+          peak = std::max(peak, load[cycle]);
+        }
+        if (best_peak < 0 || peak < best_peak) {
+          best_peak = peak;
+          best_offset = offset;
+        }
+      }
+      entry->task->offset = best_offset;
+      for (size_t cycle = (rate - best_offset) % rate; cycle < load.size(); cycle += rate) {
+        load[cycle] += entry->cost;
+      }
+    }
+  }
+}
+
+std::vector<int> CycleScheduler::getLoad(size_t port) const {
+  std::vector<int> load(getPeriod(port), 0);
+  for (const Entry &entry : entries_) {
+    if (entry.port != port) {
+      continue;
+    }
+    for (size_t cycle = 0; cycle < load.size(); cycle++) {
+      if (entry.task->isDue(cycle)) {
+        load[cycle] += entry.cost;
+      }
+    }
+  }
+  return load;
+}
+}  // namespace bitbots_ros_control
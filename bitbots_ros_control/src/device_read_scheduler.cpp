@@ -0,0 +1,173 @@
+#include <algorithm>
+#include <bitbots_ros_control/device_read_scheduler.hpp>
+#include <cstring>
+#include <numeric>
+
+namespace bitbots_ros_control {
+
+DeviceReadScheduler::DeviceReadScheduler(std::shared_ptr<DynamixelDriver> driver, rclcpp::Logger logger)
+    : driver_(driver), logger_(logger) {}
+
+bool DeviceReadScheduler::enableBulkRead(const std::string &device_file, int baudrate) {
+  auto bulk_reader = std::make_unique<BulkReader>();
+  if (!bulk_reader->open(device_file, baudrate)) {
+    return false;
+  }
+  bulk_reader_ = std::move(bulk_reader);
+  return true;
+}
+
+int DeviceReadScheduler::addWindow(uint8_t id, uint16_t address, uint16_t length, int rate) {
+  windows_.push_back({id, address, length, std::max(rate, 1), 0, 0});
+  return windows_.size() - 1;
+}
+
+void DeviceReadScheduler::plan(uint16_t max_gap) {
+  transactions_.clear();
+  // sort the windows by device, rate and address, so that windows which can be merged are next to each other
+  std::vector<size_t> order(windows_.size());
+  std::iota(order.begin(), order.end(), 0);
+  std::sort(order.begin(), order.end(), [this](size_t a, size_t b) {
+    const Window &wa = windows_[a];
+    const Window &wb = windows_[b];
+    if (wa.id != wb.id) {
+      return wa.id < wb.id;
+    }
+    if (wa.rate != wb.rate) {
+      return wa.rate < wb.rate;
+    }
+    return wa.address < wb.address;
+  });
+
+  for (size_t index : order) {
+    Window &window = windows_[index];
+    uint32_t window_end = window.address + window.length;
+    if (!transactions_.empty()) {
+      Transaction &last = transactions_.back();
+      uint32_t last_end = last.address + last.length;
+      if (last.id == window.id && last.task.rate == window.rate && window.address <= last_end + max_gap) {
+        // extend the previous transaction so that it also covers this window
+        last.length = std::max(last_end, window_end) - last.address;
+        window.transaction = transactions_.size() - 1;
+        window.offset = window.address - last.address;
+        continue;
+      }
+    }
+    transactions_.push_back(
+        {window.id, window.address, window.length, {window.rate, 0}, false, false, {}, {}, 0, 0, false, true, 0});
+    window.transaction = transactions_.size() - 1;
+    window.offset = 0;
+  }
+
+  for (Transaction &transaction : transactions_) {
+    transaction.data.resize(transaction.length);
+  }
+}
+
+void DeviceReadScheduler::addScheduledTasks(CycleScheduler *scheduler, size_t port) {
+  for (Transaction &transaction : transactions_) {
+    // transactions of every cycle are registered as well, they are part of the load of each cycle
+    scheduler->addTask(port,
+                       "read ID " + std::to_string(transaction.id) + " registers " +
+                           std::to_string(transaction.address) + "-" +
+                           std::to_string(transaction.address + transaction.length - 1),
+                       transaction.length + (bulk_reader_ ? 16 : 25), &transaction.task);
+  }
+}
+
+void DeviceReadScheduler::read() {
+  for (Transaction &transaction : transactions_) {
+    transaction.due = transaction.task.isDue();
+    transaction.success = false;
+    // a device that did not answer recently is not read in every cycle, so that it does not block the bus
+    transaction.waiting = transaction.due && transaction.failures > 0 && transaction.retry_wait > 0;
+    if (transaction.waiting) {
+      transaction.retry_wait--;
+    }
+  }
+
+  // transaction which was already read individually after it was missing in the bulk read
+  size_t retried = transactions_.size();
+  if (bulk_reader_) {
+    // read all devices that answered recently with one instruction, they answer one after another
+    bulk_reader_->clear();
+    bulk_transactions_.clear();
+    for (size_t index = 0; index < transactions_.size(); index++) {
+      Transaction &transaction = transactions_[index];
+      if (transaction.due && !transaction.waiting && transaction.failures == 0 && transaction.in_bulk_read) {
+        bulk_reader_->addWindow(transaction.id, transaction.address, transaction.length, transaction.data.data());
+        bulk_transactions_.push_back(index);
+      }
+    }
+    if (!bulk_transactions_.empty()) {
+      std::chrono::steady_clock::time_point read_time = std::chrono::steady_clock::now();
+      size_t received = bulk_reader_->read();
+      for (size_t i = 0; i < bulk_transactions_.size(); i++) {
+        Transaction &transaction = transactions_[bulk_transactions_[i]];
+        transaction.read_time = read_time;
+        transaction.success = i < received;
+        if (transaction.success) {
+          transaction.bulk_failures = 0;
+        }
+      }
+      if (received < bulk_transactions_.size()) {
+        // the first missing device stopped the reception of all following ones, check if it answers on its own
+        retried = bulk_transactions_[received];
+        Transaction &missing = transactions_[retried];
+        readIndividually(retried);
+        if (missing.success) {
+          missing.bulk_failures++;
+          if (missing.bulk_failures >= MAX_BULK_FAILURES) {
+            missing.in_bulk_read = false;
+            RCLCPP_WARN(logger_, "ID %d does not answer in bulk reads, reading registers %d-%d individually",
+                        missing.id, missing.address, missing.address + missing.length - 1);
+          }
+        }
+      }
+    }
+  }
+
+  // read everything that is not part of the bulk read or was not received in it
+  for (size_t index = 0; index < transactions_.size(); index++) {
+    Transaction &transaction = transactions_[index];
+    if (transaction.due && !transaction.waiting && !transaction.success && index != retried) {
+      readIndividually(index);
+    }
+  }
+}
+
+void DeviceReadScheduler::readIndividually(size_t index) {
+  Transaction &transaction = transactions_[index];
+  transaction.read_time = std::chrono::steady_clock::now();
+  transaction.success =
+      driver_->readMultipleRegisters(transaction.id, transaction.address, transaction.length, transaction.data.data());
+  if (transaction.success) {
+    transaction.failures = 0;
+    transaction.retry_wait = 0;
+  } else {
+    transaction.failures++;
+    transaction.retry_wait = (1 << std::min(transaction.failures - 1, MAX_BACKOFF_EXPONENT)) - 1;
+  }
+}
+
+bool DeviceReadScheduler::isDue(int handle) const { return transactions_[windows_[handle].transaction].due; }
+
+bool DeviceReadScheduler::wasRead(int handle) const {
+  const Transaction &transaction = transactions_[windows_[handle].transaction];
+  return transaction.due && !transaction.waiting;
+}
+
+bool DeviceReadScheduler::getData(int handle, uint8_t *data) const {
+  const Window &window = windows_[handle];
+  const Transaction &transaction = transactions_[window.transaction];
+  if (!transaction.due || !transaction.success) {
+    return false;
+  }
+  memcpy(data, transaction.data.data() + window.offset, window.length);
+  return true;
+}
+
+std::chrono::steady_clock::time_point DeviceReadScheduler::getReadTime(int handle) const {
+  return transactions_[windows_[handle].transaction].read_time;
+}
+}  // namespace bitbots_ros_control
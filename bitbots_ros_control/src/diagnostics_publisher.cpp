@@ -0,0 +1,104 @@
+#include <algorithm>
+#include <bitbots_ros_control/diagnostics_publisher.hpp>
+#include <cstdio>
+
+namespace bitbots_ros_control {
+
+DiagnosticsPublisher::DiagnosticsPublisher(rclcpp::Node::SharedPtr nh, size_t queue_size)
+    : nh_(nh), queue_(queue_size), dropped_(0), running_(false), period_(0) {
+  diagnostic_pub_ = nh_->create_publisher<diagnostic_msgs::msg::DiagnosticArray>("/diagnostics", 10);
+}
+
+DiagnosticsPublisher::~DiagnosticsPublisher() { stop(); }
+
+int DiagnosticsPublisher::addStatus(const std::string &name, const std::string &hardware_id,
+                                    const std::vector<std::string> &keys, Formatter formatter) {
+  return addPartialStatus(name, hardware_id, keys,
+                          [formatter](const DiagnosticRecord &record, diagnostic_msgs::msg::DiagnosticStatus &status) {
+                            formatter(record, status);
+                            return true;
+                          });
+}
+
+int DiagnosticsPublisher::addPartialStatus(const std::string &name, const std::string &hardware_id,
+                                           const std::vector<std::string> &keys, PartialFormatter formatter) {
+  // the interfaces are initialized in parallel
+  std::lock_guard<std::mutex> lock(templates_mutex_);
+  diagnostic_msgs::msg::DiagnosticStatus status;
+  status.name = name;
+  status.hardware_id = hardware_id;
+  for (const std::string &key : keys) {
+    diagnostic_msgs::msg::KeyValue key_value;
+    key_value.key = key;
+    status.values.push_back(key_value);
+  }
+  templates_.push_back(status);
+  formatters_.push_back(formatter);
+  return templates_.size() - 1;
+}
+
+bool DiagnosticsPublisher::push(const DiagnosticRecord &record) {
+  if (!queue_.push(record)) {
+    dropped_.fetch_add(1, std::memory_order_relaxed);
+    return false;
+  }
+  return true;
+}
+
+void DiagnosticsPublisher::start(double rate_hz) {
+  if (running_) {
+    return;
+  }
+  period_ = std::chrono::nanoseconds(int64_t(1e9 / rate_hz));
+  running_ = true;
+  thread_ = std::thread(&DiagnosticsPublisher::run, this);
+}
+
+void DiagnosticsPublisher::stop() {
+  running_ = false;
+  if (thread_.joinable()) {
+    thread_.join();
+  }
+}
+
+void DiagnosticsPublisher::setValue(diagnostic_msgs::msg::DiagnosticStatus &status, size_t index, double value) {
+  char buffer[32];
+  snprintf(buffer, sizeof(buffer), "%f", value);
+  status.values[index].value = buffer;
+}
+
+void DiagnosticsPublisher::setValue(diagnostic_msgs::msg::DiagnosticStatus &status, size_t index, int value) {
+  char buffer[16];
+  snprintf(buffer, sizeof(buffer), "%d", value);
+  status.values[index].value = buffer;
+}
+
+void DiagnosticsPublisher::run() {
+  diagnostic_msgs::msg::DiagnosticArray array_msg;
+  std::vector<bool> updated(templates_.size(), false);
+  DiagnosticRecord record;
+  while (running_) {
+    std::this_thread::sleep_for(period_);
+    int64_t stamp = -1;
+    while (queue_.pop(record)) {
+      // the templates are updated in place, a newer record of the same status overwrites an older one
+      if (formatters_[record.status](record, templates_[record.status])) {
+        updated[record.status] = true;
+        stamp = std::max(stamp, record.stamp);
+      }
+    }
+    if (stamp < 0) {
+      continue;
+    }
+    array_msg.header.stamp = rclcpp::Time(stamp, nh_->get_clock()->get_clock_type());
+    array_msg.status.clear();
+    for (size_t i = 0; i < templates_.size(); i++) {
+      if (updated[i]) {
+        array_msg.status.push_back(templates_[i]);
+        updated[i] = false;
+      }
+    }
+    diagnostic_pub_->publish(array_msg);
+  }
+}
+}  // namespace bitbots_ros_control
@@ -1,3 +1,4 @@
+#include <algorithm>
 #include <bitbots_ros_control/dynamixel_servo_hardware_interface.hpp>
 #include <bitbots_ros_control/utils.hpp>
 #include <utility>
@@ -5,13 +6,19 @@
 namespace bitbots_ros_control {
 using std::placeholders::_1;
 
-DynamixelServoHardwareInterface::DynamixelServoHardwareInterface(rclcpp::Node::SharedPtr nh) { nh_ = nh; }
+// the cache is cleared when there are more layouts, e.g. from publishers that send different subsets of joints
+const size_t MAX_LAYOUTS = 32;
+
+DynamixelServoHardwareInterface::DynamixelServoHardwareInterface(rclcpp::Node::SharedPtr nh)
+    : goal_torque_(false), switch_torque_(false), switch_individual_torque_(false) {
+  nh_ = nh;
+}
 
 void DynamixelServoHardwareInterface::addBusInterface(ServoBusInterface *bus) { bus_interfaces_.push_back(bus); }
 
-void DynamixelServoHardwareInterface::writeROMRAM(bool first_time) {
+void DynamixelServoHardwareInterface::requestROMRAM() {
   for (ServoBusInterface *bus : bus_interfaces_) {
-    bus->writeROMRAM(first_time);
+    bus->requestROMRAM();
   }
 }
 
@@ -21,15 +28,7 @@ bool DynamixelServoHardwareInterface::init() {
    * The servos are pinged to verify that a connection is present and to know which type of servo it is.
    */
 
-  // Init subscriber / publisher
-  set_torque_sub_ = nh_->create_subscription<std_msgs::msg::Bool>(
-      "set_torque", 1, std::bind(&DynamixelServoHardwareInterface::setTorqueCb, this, _1));
-  set_torque_indiv_sub_ = nh_->create_subscription<bitbots_msgs::msg::JointTorque>(
-      "set_torque_individual", 1, std::bind(&DynamixelServoHardwareInterface::individualTorqueCb, this, _1));
-  // todo we could change the command topic to something better
-  sub_command_ = nh_->create_subscription<bitbots_msgs::msg::JointCommand>(
-      "/DynamixelController/command", 1,
-      std::bind(&DynamixelServoHardwareInterface::commandCb, this, std::placeholders::_1));
+  // Init publisher
   pwm_pub_ = nh_->create_publisher<sensor_msgs::msg::JointState>("/servo_PWM", 10);
   joint_pub_ = nh_->create_publisher<sensor_msgs::msg::JointState>("/joint_states", 10);
 
@@ -43,10 +42,6 @@ bool DynamixelServoHardwareInterface::init() {
       joint_names_.push_back(bus->joint_names_[i]);
     }
   }
-  current_position_.resize(joint_count_, 0);
-  current_velocity_.resize(joint_count_, 0);
-  current_effort_.resize(joint_count_, 0);
-  current_pwm_.resize(joint_count_, 0);
   current_input_voltage_.resize(joint_count_, 0);
   current_temperature_.resize(joint_count_, 0);
   current_error_.resize(joint_count_, 0);
@@ -71,8 +66,39 @@ bool DynamixelServoHardwareInterface::init() {
 
   joint_state_msg_ = sensor_msgs::msg::JointState();
   joint_state_msg_.name = joint_names_;
+  joint_state_msg_.position.resize(joint_count_, 0);
+  joint_state_msg_.velocity.resize(joint_count_, 0);
+  joint_state_msg_.effort.resize(joint_count_, 0);
   pwm_msg_ = sensor_msgs::msg::JointState();
   pwm_msg_.name = joint_names_;
+  pwm_msg_.effort.resize(joint_count_, 0);
+
+  // all buffers of the command get the size of all joints, they are not resized later
+  ServoCommand initial_command;
+  initial_command.position = goal_position_;
+  initial_command.velocity = goal_velocity_;
+  initial_command.acceleration = goal_acceleration_;
+  initial_command.effort = goal_effort_;
+  initial_command.torque_individual = goal_torque_individual_;
+  command_buffer_ = std::make_unique<TripleBuffer<ServoCommand>>(initial_command);
+
+  // each bus uses the range of its joints in the messages and the command
+  size_t first_joint = 0;
+  for (ServoBusInterface *bus : bus_interfaces_) {
+    bus->setCurrentValues(joint_state_msg_, pwm_msg_, first_joint);
+    bus->setGoals(command_buffer_->readBuffer(), first_joint);
+    first_joint += bus->joint_count_;
+  }
+
+  // Init subscriber, the callbacks need the command buffer
+  set_torque_sub_ = nh_->create_subscription<std_msgs::msg::Bool>(
+      "set_torque", 1, std::bind(&DynamixelServoHardwareInterface::setTorqueCb, this, _1));
+  set_torque_indiv_sub_ = nh_->create_subscription<bitbots_msgs::msg::JointTorque>(
+      "set_torque_individual", 1, std::bind(&DynamixelServoHardwareInterface::individualTorqueCb, this, _1));
+  // todo we could change the command topic to something better
+  sub_command_ = nh_->create_subscription<bitbots_msgs::msg::JointCommand>(
+      "/DynamixelController/command", 1,
+      std::bind(&DynamixelServoHardwareInterface::commandCb, this, std::placeholders::_1));
 
   RCLCPP_INFO(nh_->get_logger(), "Hardware interface init finished.");
   return true;
@@ -86,14 +112,79 @@ void DynamixelServoHardwareInterface::commandCb(const bitbots_msgs::msg::JointCo
     RCLCPP_ERROR(nh_->get_logger(), "Dynamixel Controller got command with inconsistent array lengths.");
     return;
   }
-  // todo improve performance
-  for (unsigned int i = 0; i < command_msg.joint_names.size(); i++) {
-    int joint_id = joint_map_[command_msg.joint_names[i]];
-    goal_position_[joint_id] = command_msg.positions[i];
-    goal_velocity_[joint_id] = command_msg.velocities[i];
-    goal_acceleration_[joint_id] = command_msg.accelerations[i];
-    goal_effort_[joint_id] = command_msg.max_currents[i];
+  const JointLayout &layout = resolveLayout(command_msg.joint_names);
+  if (!layout.complete) {
+    RCLCPP_ERROR_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 1000,
+                          "Dynamixel Controller got command with unknown joint names, it is ignored.");
+    return;
+  }
+  if (layout.identity) {
+    std::copy(command_msg.positions.begin(), command_msg.positions.end(), goal_position_.begin());
+    std::copy(command_msg.velocities.begin(), command_msg.velocities.end(), goal_velocity_.begin());
+    std::copy(command_msg.accelerations.begin(), command_msg.accelerations.end(), goal_acceleration_.begin());
+    std::copy(command_msg.max_currents.begin(), command_msg.max_currents.end(), goal_effort_.begin());
+  } else {
+    for (size_t i = 0; i < layout.indices.size(); i++) {
+      int joint = layout.indices[i];
+      goal_position_[joint] = command_msg.positions[i];
+      goal_velocity_[joint] = command_msg.velocities[i];
+      goal_acceleration_[joint] = command_msg.accelerations[i];
+      goal_effort_[joint] = command_msg.max_currents[i];
+    }
+  }
+  publishCommand();
+}
+
+const DynamixelServoHardwareInterface::JointLayout &DynamixelServoHardwareInterface::resolveLayout(
+    const std::vector<std::string> &names) {
+  /**
+   * Looks up the indices of the joint names. The names are only compared with the cached ones, the map of the joints is
+   * only searched for new layouts.
+   */
+  // FNV-1a over all names, with a separator so that the split between the names matters
+  uint64_t hash = 14695981039346656037ull;
+  for (const std::string &name : names) {
+    for (char c : name) {
+      hash = (hash ^ uint8_t(c)) * 1099511628211ull;
+    }
+    hash = (hash ^ 0xff) * 1099511628211ull;
+  }
+  auto cached = layouts_.find(hash);
+  if (cached != layouts_.end() && cached->second.names == names) {
+    return cached->second;
   }
+  if (layouts_.size() >= MAX_LAYOUTS) {
+    layouts_.clear();
+  }
+  JointLayout &layout = layouts_[hash];
+  layout.names = names;
+  layout.indices.resize(names.size());
+  layout.complete = true;
+  for (size_t i = 0; i < names.size(); i++) {
+    auto joint = joint_map_.find(names[i]);
+    if (joint == joint_map_.end()) {
+      layout.indices[i] = -1;
+      layout.complete = false;
+      RCLCPP_WARN(nh_->get_logger(), "Unknown joint %s", names[i].c_str());
+    } else {
+      layout.indices[i] = joint->second;
+    }
+  }
+  layout.identity = names == joint_names_;
+  return layout;
+}
+
+void DynamixelServoHardwareInterface::publishCommand() {
+  /**
+   * Hands the current goals over to the control loop. The buffers keep their size, so this does not allocate.
+   */
+  ServoCommand &command = command_buffer_->writeBuffer();
+  command.position = goal_position_;
+  command.velocity = goal_velocity_;
+  command.acceleration = goal_acceleration_;
+  command.effort = goal_effort_;
+  command.torque_individual = goal_torque_individual_;
+  command_buffer_->publish();
 }
 
 void DynamixelServoHardwareInterface::individualTorqueCb(bitbots_msgs::msg::JointTorque msg) {
@@ -105,80 +196,70 @@ void DynamixelServoHardwareInterface::individualTorqueCb(bitbots_msgs::msg::Join
     return;
   }
 
+  if (msg.on.size() != msg.joint_names.size()) {
+    RCLCPP_WARN(nh_->get_logger(), "Somethings wrong with your message to set torques.");
+    return;
+  }
   // we save the goal torque value. It will be set during write process
-  for (size_t i = 0; i < msg.joint_names.size(); i++) {
-    bool success = false;
-    for (size_t j = 0; j < joint_names_.size(); j++) {
-      if (msg.joint_names[i] == joint_names_[j]) {
-        if (i < msg.joint_names.size()) {
-          goal_torque_individual_[j] = msg.on[i];
-          success = true;
-        } else {
-          RCLCPP_WARN(nh_->get_logger(), "Somethings wrong with your message to set torques.");
-        }
-      }
-    }
-    if (!success) {
+  const JointLayout &layout = resolveLayout(msg.joint_names);
+  for (size_t i = 0; i < layout.indices.size(); i++) {
+    if (layout.indices[i] < 0) {
       RCLCPP_WARN(nh_->get_logger(), "Couldn't set torque for servo %s ", msg.joint_names[i].c_str());
+    } else {
+      goal_torque_individual_[layout.indices[i]] = msg.on[i];
     }
   }
-  for (ServoBusInterface *bus : bus_interfaces_) {
-    bus->switch_individual_torque_ = true;
-  }
+  publishCommand();
+  // the buses get told in the write method, since they might be reading in parallel to this callback
+  switch_individual_torque_ = true;
 }
 
 void DynamixelServoHardwareInterface::setTorqueCb(std_msgs::msg::Bool::SharedPtr enabled) {
   /**
    * This saves the given required value, so that it can be written to the servos in the write method
    */
-  for (ServoBusInterface *bus : bus_interfaces_) {
-    bus->goal_torque_ = enabled->data;
-  }
+  // the buses get the value in the write method, since they might be reading in parallel to this callback
   for (size_t j = 0; j < joint_names_.size(); j++) {
     goal_torque_individual_[j] = enabled->data;
   }
+  publishCommand();
+  goal_torque_ = enabled->data;
+  switch_torque_ = true;
 }
 
 void DynamixelServoHardwareInterface::read(const rclcpp::Time &t, const rclcpp::Duration &dt) {
-  // retrieve values from the buses and set controller vector accordingly
-  // todo improve performance
-  int i = 0;
-  for (ServoBusInterface *bus : bus_interfaces_) {
-    for (int j = 0; j < bus->joint_count_; j++) {
-      current_position_[i] = bus->current_position_[j];
-      current_velocity_[i] = bus->current_velocity_[j];
-      current_effort_[i] = bus->current_effort_[j];
-      current_pwm_[i] = bus->current_pwm_[j];
-      i++;
-    }
-  }
-
+  // the buses already wrote the read values into the messages
   // publish joint states
   joint_state_msg_.header.stamp = nh_->get_clock()->now();
-  joint_state_msg_.position = current_position_;
-  joint_state_msg_.velocity = current_velocity_;
-  joint_state_msg_.effort = current_effort_;
-  joint_pub_->publish(joint_state_msg_);
+  publishMessage(joint_pub_, joint_state_msg_);
 
   // PWM values are not part of joint state controller and have to be published independently
-  pwm_msg_.header.stamp = nh_->get_clock()->now();
-  pwm_msg_.effort = current_pwm_;
-  pwm_pub_->publish(pwm_msg_);
+  pwm_msg_.header.stamp = joint_state_msg_.header.stamp;
+  publishMessage(pwm_pub_, pwm_msg_);
 }
 
 void DynamixelServoHardwareInterface::write(const rclcpp::Time &t, const rclcpp::Duration &dt) {
   // set all values from controller to the buses
-  // todo improve performance
-  int i = 0;
-  for (ServoBusInterface *bus : bus_interfaces_) {
-    for (int j = 0; j < bus->joint_count_; j++) {
-      bus->goal_position_[j] = goal_position_[i];
-      bus->goal_velocity_[j] = goal_velocity_[i];
-      bus->goal_acceleration_[j] = goal_acceleration_[i];
-      bus->goal_effort_[j] = goal_effort_[i];
-      bus->goal_torque_individual_[j] = goal_torque_individual_[i];
-      i++;
+  // the flags are set after the command is published, so the command buffer contains the corresponding goals
+  if (switch_torque_.exchange(false)) {
+    for (ServoBusInterface *bus : bus_interfaces_) {
+      bus->goal_torque_ = goal_torque_;
+    }
+  }
+  if (switch_individual_torque_.exchange(false)) {
+    for (ServoBusInterface *bus : bus_interfaces_) {
+      bus->switch_individual_torque_ = true;
     }
   }
+  // the goals of the buses only change when there is a new command
+  if (!command_buffer_->update()) {
+    return;
+  }
+  // the buses use the new command directly
+  size_t first_joint = 0;
+  for (ServoBusInterface *bus : bus_interfaces_) {
+    bus->setGoals(command_buffer_->readBuffer(), first_joint);
+    first_joint += bus->joint_count_;
+  }
 }
 }  // namespace bitbots_ros_control
@@ -1,5 +1,7 @@
 #include <bitbots_ros_control/imu_hardware_interface.hpp>
 #include <bitbots_ros_control/utils.hpp>
+#include <chrono>
+#include <cstring>
 
 #define gravity 9.80665
 
@@ -15,7 +17,11 @@ ImuHardwareInterface::ImuHardwareInterface(rclcpp::Node::SharedPtr nh, std::shar
   topic_ = topic;
   frame_ = frame;
   name_ = name;
-  diag_counter_ = 0;
+  diag_task_.rate = 100;
+  device_reads_ = nullptr;
+  diagnostics_ = nullptr;
+  recorder_ = nullptr;
+  recorder_source_ = -1;
   imu_msg_ = sensor_msgs::msg::Imu();
   imu_msg_.header.frame_id = frame_;
 }
@@ -40,6 +46,8 @@ bool ImuHardwareInterface::init() {
 
   data_ = (uint8_t *)malloc(40 * sizeof(uint8_t));
   accel_calib_data_ = (uint8_t *)malloc(28 * sizeof(uint8_t));
+  std::fill(last_data_, last_data_ + 40, 0);
+  nh_->get_parameter_or("imu.only_new_samples", only_new_samples_, false);
 
   // make services
   imu_ranges_service_ = nh_->create_service<bitbots_msgs::srv::IMURanges>(
@@ -62,14 +70,42 @@ bool ImuHardwareInterface::init() {
       std::bind(&ImuHardwareInterface::setAccelCalibrationThreshold, this, _1, _2));
 
   imu_pub_ = nh_->create_publisher<sensor_msgs::msg::Imu>(topic_, 10);
-  diagnostic_pub_ = nh_->create_publisher<diagnostic_msgs::msg::DiagnosticArray>("/diagnostics", 10);
+  if (recorder_) {
+    recorder_source_ = recorder_->addSource("imu " + name_);
+  }
+  if (diagnostics_) {
+    // add prefix IMU to sort in diagnostic analyser
+    diagnostic_status_ = diagnostics_->addStatus(
+        "IMU" + name_, std::to_string(id_),
+        {"Accel Calib Bias 0", "Accel Calib Bias 1", "Accel Calib Bias 2", "Accel Calib Scale 0", "Accel Calib Scale 1",
+         "Accel Calib Scale 2", "Accel Calib Thresh", "Accel Gain", "Accel Range", "Adaptive Gain", "Bias Alpha",
+         "Bias Estimation", "Gyro Range"},
+        [](const DiagnosticRecord &record, diagnostic_msgs::msg::DiagnosticStatus &status) {
+          // ranges and flags are integers, everything else is a float
+          const bool integer[] = {false, false, false, false, false, false, false,
+                                  false, true,  true,  false, true,  true};
+          for (size_t i = 0; i < status.values.size(); i++) {
+            if (integer[i]) {
+              DiagnosticsPublisher::setValue(status, i, int(record.values[i]));
+            } else {
+              DiagnosticsPublisher::setValue(status, i, record.values[i]);
+            }
+          }
+          if (record.success) {
+            status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
+            status.message = "OK";
+          } else {
+            status.level = diagnostic_msgs::msg::DiagnosticStatus::STALE;
+            status.message = "No response";
+          }
+        });
+  }
 
   // read the current values in the IMU module so that they can later be displayed in diagnostic message
-  const std::shared_ptr<bitbots_msgs::srv::AccelerometerCalibration::Request> req =
-      std::make_shared<bitbots_msgs::srv::AccelerometerCalibration::Request>();
-  std::shared_ptr<bitbots_msgs::srv::AccelerometerCalibration::Response> resp =
-      std::make_shared<bitbots_msgs::srv::AccelerometerCalibration::Response>();
-  readAccelCalibration(req, resp);
+  // the control loop does not run yet, so the bus can be used directly
+  if (!readAccelCalibrationData()) {
+    RCLCPP_WARN(nh_->get_logger(), "Could not read IMU %s accelerometer calibration in init", name_.c_str());
+  }
   if (driver_->readMultipleRegisters(id_, 102, 16, data_)) {
     gyro_range_ = data_[0];
     accel_range_ = data_[1];
@@ -95,12 +131,38 @@ bool ImuHardwareInterface::init() {
   return true;
 }
 
+void ImuHardwareInterface::addDeviceReads(DeviceReadScheduler *scheduler) {
+  device_reads_ = scheduler;
+  device_read_handle_ = scheduler->addWindow(id_, 36, 40);
+}
+
+void ImuHardwareInterface::setDiagnostics(DiagnosticsPublisher *diagnostics) { diagnostics_ = diagnostics; }
+
+void ImuHardwareInterface::setRecorder(BlackBoxRecorder *recorder) { recorder_ = recorder; }
+
+void ImuHardwareInterface::addScheduledTasks(CycleScheduler *scheduler, size_t port) {
+  scheduler->addTask(port, "diagnostics " + name_, 10, &diag_task_);
+}
+
 void ImuHardwareInterface::read(const rclcpp::Time &t, const rclcpp::Duration &dt) {
   /**
    * Reads the IMU
    */
   bool read_successful = true;
-  if (driver_->readMultipleRegisters(id_, 36, 40, data_)) {
+  std::chrono::steady_clock::time_point read_time = std::chrono::steady_clock::now();
+  bool data_available;
+  if (device_reads_) {
+    data_available = device_reads_->getData(device_read_handle_, data_);
+    read_time = device_reads_->getReadTime(device_read_handle_);
+  } else {
+    data_available = driver_->readMultipleRegisters(id_, 36, 40, data_);
+  }
+  bool new_sample = data_available && memcmp(data_, last_data_, 40) != 0;
+  if (data_available) {
+    memcpy(last_data_, data_, 40);
+    if (recorder_) {
+      recorder_->record(recorder_source_, data_, 40);
+    }
     // sometimes we only get 0 right after power on, don't use that data
     // test on orientation is sufficient as 0,0,0,0 would not be a valid quaternion
     if (dxlMakeFloat(data_ + 24) + dxlMakeFloat(data_ + 28) + dxlMakeFloat(data_ + 32) + dxlMakeFloat(data_ + 36) !=
@@ -123,67 +185,48 @@ void ImuHardwareInterface::read(const rclcpp::Time &t, const rclcpp::Duration &d
     read_successful = false;
   }
 
-  imu_msg_.header.stamp = nh_->get_clock()->now();
-  imu_msg_.angular_velocity.x = angular_velocity_[0];
-  imu_msg_.angular_velocity.y = angular_velocity_[1];
-  imu_msg_.angular_velocity.z = angular_velocity_[2];
-  imu_msg_.linear_acceleration.x = linear_acceleration_[0];
-  imu_msg_.linear_acceleration.y = linear_acceleration_[1];
-  imu_msg_.linear_acceleration.z = linear_acceleration_[2];
-  imu_msg_.orientation.x = orientation_[0];
-  imu_msg_.orientation.y = orientation_[1];
-  imu_msg_.orientation.z = orientation_[2];
-  imu_msg_.orientation.w = orientation_[3];
-  imu_pub_->publish(imu_msg_);
+  // the sample is stamped with the time of the request instead of the time after the transfer and the other reads
+  rclcpp::Duration age(std::chrono::steady_clock::now() - read_time);
+  rclcpp::Time stamp = nh_->get_clock()->now() - age;
+  if (new_sample || !only_new_samples_) {
+    publishMessage(imu_pub_, imu_msg_, [this, &stamp](sensor_msgs::msg::Imu &msg) {
+      msg.header.stamp = stamp;
+      msg.header.frame_id = frame_;
+      msg.angular_velocity.x = angular_velocity_[0];
+      msg.angular_velocity.y = angular_velocity_[1];
+      msg.angular_velocity.z = angular_velocity_[2];
+      msg.linear_acceleration.x = linear_acceleration_[0];
+      msg.linear_acceleration.y = linear_acceleration_[1];
+      msg.linear_acceleration.z = linear_acceleration_[2];
+      msg.orientation.x = orientation_[0];
+      msg.orientation.y = orientation_[1];
+      msg.orientation.z = orientation_[2];
+      msg.orientation.w = orientation_[3];
+    });
+  }
 
   // publish diagnostic messages each 100 frames
-  if (diag_counter_ % 100 == 0) {
-    // diagnostics. check if values are changing, otherwise there is a connection error on the board
-    diagnostic_msgs::msg::DiagnosticArray array_msg = diagnostic_msgs::msg::DiagnosticArray();
-    std::vector<diagnostic_msgs::msg::DiagnosticStatus> array = std::vector<diagnostic_msgs::msg::DiagnosticStatus>();
-    array_msg.header.stamp = nh_->get_clock()->now();
-    diagnostic_msgs::msg::DiagnosticStatus status = diagnostic_msgs::msg::DiagnosticStatus();
-    // add prefix CORE to sort in diagnostic analyser
-    status.name = "IMU" + name_;
-    status.hardware_id = std::to_string(id_);
-    std::map<std::string, std::string> map;
-
-    map.insert(std::make_pair("Gyro Range", std::to_string(gyro_range_)));
-    map.insert(std::make_pair("Accel Range", std::to_string(accel_range_)));
-    map.insert(std::make_pair("Accel Gain", std::to_string(accel_gain_)));
-    map.insert(std::make_pair("Bias Alpha", std::to_string(bias_alpha_)));
-    map.insert(std::make_pair("Adaptive Gain", std::to_string(do_adaptive_gain_)));
-    map.insert(std::make_pair("Bias Estimation", std::to_string(do_bias_estimation_)));
-    map.insert(std::make_pair("Adaptive Gain", std::to_string(do_adaptive_gain_)));
-    map.insert(std::make_pair("Accel Calib Thresh", std::to_string(accel_calib_threshold_read_)));
-    map.insert(std::make_pair("Accel Calib Bias 0", std::to_string(accel_calib_bias_[0])));
-    map.insert(std::make_pair("Accel Calib Bias 1", std::to_string(accel_calib_bias_[1])));
-    map.insert(std::make_pair("Accel Calib Bias 2", std::to_string(accel_calib_bias_[2])));
-    map.insert(std::make_pair("Accel Calib Scale 0", std::to_string(accel_calib_scale_[0])));
-    map.insert(std::make_pair("Accel Calib Scale 1", std::to_string(accel_calib_scale_[1])));
-    map.insert(std::make_pair("Accel Calib Scale 2", std::to_string(accel_calib_scale_[2])));
-
-    if (read_successful) {
-      status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
-      status.message = "OK";
-    } else {
-      status.level = diagnostic_msgs::msg::DiagnosticStatus::STALE;
-      status.message = "No response";
-    }
-    std::vector<diagnostic_msgs::msg::KeyValue> keyValues = std::vector<diagnostic_msgs::msg::KeyValue>();
-    // itarate through map and save it into values
-    for (auto const &ent1 : map) {
-      diagnostic_msgs::msg::KeyValue key_value = diagnostic_msgs::msg::KeyValue();
-      key_value.key = ent1.first;
-      key_value.value = ent1.second;
-      keyValues.push_back(key_value);
-    }
-    status.values = keyValues;
-    array.push_back(status);
-    array_msg.status = array;
-    diagnostic_pub_->publish(array_msg);
+  if (diagnostics_ && diag_task_.isDue()) {
+    // the message is built by the diagnostics thread
+    DiagnosticRecord record;
+    record.status = diagnostic_status_;
+    record.success = read_successful;
+    record.stamp = nh_->get_clock()->now().nanoseconds();
+    record.values[0] = accel_calib_bias_[0];
+    record.values[1] = accel_calib_bias_[1];
+    record.values[2] = accel_calib_bias_[2];
+    record.values[3] = accel_calib_scale_[0];
+    record.values[4] = accel_calib_scale_[1];
+    record.values[5] = accel_calib_scale_[2];
+    record.values[6] = accel_calib_threshold_read_;
+    record.values[7] = accel_gain_;
+    record.values[8] = accel_range_;
+    record.values[9] = do_adaptive_gain_;
+    record.values[10] = bias_alpha_;
+    record.values[11] = do_bias_estimation_;
+    record.values[12] = gyro_range_;
+    diagnostics_->push(record);
   }
-  diag_counter_++;
 }
 
 void ImuHardwareInterface::setIMURanges(const std::shared_ptr<bitbots_msgs::srv::IMURanges::Request> req,
@@ -224,28 +267,31 @@ void ImuHardwareInterface::resetAccelCalibraton(const std::shared_ptr<std_srvs::
 }
 
 void ImuHardwareInterface::readAccelCalibration(
-    const std::shared_ptr<bitbots_msgs::srv::AccelerometerCalibration::Request> req,
-    std::shared_ptr<bitbots_msgs::srv::AccelerometerCalibration::Response> resp) {
-  resp->biases.resize(3);
-  resp->scales.resize(3);
-  if (driver_->readMultipleRegisters(id_, 118, 28, accel_calib_data_)) {
-    // save in class variables for diagnostics
-    accel_calib_threshold_read_ = dxlMakeFloat(accel_calib_data_ + 0);
-    accel_calib_bias_[0] = dxlMakeFloat(accel_calib_data_ + 4);
-    accel_calib_bias_[1] = dxlMakeFloat(accel_calib_data_ + 8);
-    accel_calib_bias_[2] = dxlMakeFloat(accel_calib_data_ + 12);
-    accel_calib_scale_[0] = dxlMakeFloat(accel_calib_data_ + 16);
-    accel_calib_scale_[1] = dxlMakeFloat(accel_calib_data_ + 20);
-    accel_calib_scale_[2] = dxlMakeFloat(accel_calib_data_ + 24);
-
-    resp->threshold = accel_calib_threshold_read_;
-    resp->biases[0] = accel_calib_bias_[0];
-    resp->biases[1] = accel_calib_bias_[1];
-    resp->biases[2] = accel_calib_bias_[2];
-    resp->scales[0] = accel_calib_scale_[0];
-    resp->scales[1] = accel_calib_scale_[1];
-    resp->scales[2] = accel_calib_scale_[2];
+    std::shared_ptr<rmw_request_id_t> request_header,
+    std::shared_ptr<bitbots_msgs::srv::AccelerometerCalibration::Request> req) {
+  /**
+   * The bus may only be used by the control loop, even when the callbacks run between its cycles, since the port
+   * workers may still be reading in pipelined mode. The values are therefore read by write(), which also sends the
+   * response.
+   */
+  std::lock_guard<std::mutex> lock(accel_calibration_mutex_);
+  accel_calibration_requests_.push_back(request_header);
+  read_accel_calibration_ = true;
+}
+
+bool ImuHardwareInterface::readAccelCalibrationData() {
+  if (!driver_->readMultipleRegisters(id_, 118, 28, accel_calib_data_)) {
+    return false;
   }
+  // save in class variables for diagnostics
+  accel_calib_threshold_read_ = dxlMakeFloat(accel_calib_data_ + 0);
+  accel_calib_bias_[0] = dxlMakeFloat(accel_calib_data_ + 4);
+  accel_calib_bias_[1] = dxlMakeFloat(accel_calib_data_ + 8);
+  accel_calib_bias_[2] = dxlMakeFloat(accel_calib_data_ + 12);
+  accel_calib_scale_[0] = dxlMakeFloat(accel_calib_data_ + 16);
+  accel_calib_scale_[1] = dxlMakeFloat(accel_calib_data_ + 20);
+  accel_calib_scale_[2] = dxlMakeFloat(accel_calib_data_ + 24);
+  return true;
 }
 
 void ImuHardwareInterface::setAccelCalibrationThreshold(
@@ -257,24 +303,21 @@ void ImuHardwareInterface::setAccelCalibrationThreshold(
 }
 
 void ImuHardwareInterface::write(const rclcpp::Time &t, const rclcpp::Duration &dt) {
-  if (write_ranges_) {
+  if (write_ranges_.exchange(false)) {
     RCLCPP_INFO_STREAM(nh_->get_logger(), "Setting Gyroscope range to " << gyroRangeToString(gyro_range_));
     RCLCPP_INFO_STREAM(nh_->get_logger(), "Setting Accelerometer range to " << accelRangeToString(accel_range_));
     driver_->writeRegister(id_, "Gyro_Range", gyro_range_);
     driver_->writeRegister(id_, "Accel_Range", accel_range_);
-    write_ranges_ = false;
   }
-  if (calibrate_gyro_) {
+  if (calibrate_gyro_.exchange(false)) {
     RCLCPP_INFO(nh_->get_logger(), "Calibrating gyroscope");
     driver_->writeRegister(id_, "Calibrate_Gyro", 1);
-    calibrate_gyro_ = false;
   }
-  if (reset_gyro_calibration_) {
+  if (reset_gyro_calibration_.exchange(false)) {
     RCLCPP_INFO(nh_->get_logger(), "Resetting gyroscope Calibration");
     driver_->writeRegister(id_, "Reset_Gyro_Calibration", 1);
-    reset_gyro_calibration_ = false;
   }
-  if (write_complementary_filter_params_) {
+  if (write_complementary_filter_params_.exchange(false)) {
     RCLCPP_INFO(nh_->get_logger(), "Writing Complementary Filter parameters.");
     driver_->writeRegister(id_, "Do_Adaptive_Gain", do_adaptive_gain_);
     driver_->writeRegister(id_, "Do_Bias_Estimation", do_bias_estimation_);
@@ -286,24 +329,39 @@ void ImuHardwareInterface::write(const rclcpp::Time &t, const rclcpp::Duration &
     driver_->writeRegister(id_, "Accel_Gain", data);
     memcpy(&data, &bias_alpha_, sizeof(data));
     driver_->writeRegister(id_, "Bias_Alpha", data);
-
-    write_complementary_filter_params_ = false;
   }
-  if (calibrate_accel_) {
+  if (calibrate_accel_.exchange(false)) {
     RCLCPP_ERROR(nh_->get_logger(), "Disabled for normal users for safety reasons, uncomment code to use");
     // driver_->writeRegister(id_, "Calibrate_Accel", 1);
-    calibrate_accel_ = false;
   }
-  if (reset_accel_calibration_) {
+  if (reset_accel_calibration_.exchange(false)) {
     RCLCPP_ERROR(nh_->get_logger(), "Disabled for normal users for safety reasons, uncomment code to use");
     // driver_->writeRegister(id_, "Reset_Accel_Calibration", 1);
-    reset_accel_calibration_ = false;
   }
-  if (set_accel_calib_threshold_) {
+  if (set_accel_calib_threshold_.exchange(false)) {
     uint32_t data;
     memcpy(&data, &accel_calib_threshold_, sizeof(data));
     driver_->writeRegister(id_, "Accel_Calibration_Threshold", data);
-    set_accel_calib_threshold_ = false;
+  }
+  if (read_accel_calibration_) {
+    std::lock_guard<std::mutex> lock(accel_calibration_mutex_);
+    read_accel_calibration_ = false;
+    bitbots_msgs::srv::AccelerometerCalibration::Response resp;
+    resp.biases.resize(3);
+    resp.scales.resize(3);
+    if (readAccelCalibrationData()) {
+      resp.threshold = accel_calib_threshold_read_;
+      resp.biases[0] = accel_calib_bias_[0];
+      resp.biases[1] = accel_calib_bias_[1];
+      resp.biases[2] = accel_calib_bias_[2];
+      resp.scales[0] = accel_calib_scale_[0];
+      resp.scales[1] = accel_calib_scale_[1];
+      resp.scales[2] = accel_calib_scale_[2];
+    }
+    for (const std::shared_ptr<rmw_request_id_t> &request_header : accel_calibration_requests_) {
+      read_accel_calibration_service_->send_response(*request_header, resp);
+    }
+    accel_calibration_requests_.clear();
   }
 }
 }  // namespace bitbots_ros_control
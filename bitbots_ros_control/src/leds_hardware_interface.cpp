@@ -1,3 +1,4 @@
+#include <algorithm>
 #include <bitbots_ros_control/leds_hardware_interface.hpp>
 #include <bitbots_ros_control/utils.hpp>
 
@@ -11,21 +12,48 @@ LedsHardwareInterface::LedsHardwareInterface(rclcpp::Node::SharedPtr nh, std::sh
   nh_ = nh;
   driver_ = driver;
   id_ = id;
-  leds_.resize(num_leds);
+  state_.leds.resize(num_leds);
   start_number_ = start_number;
+  register_values_.resize(num_leds, 0);
+  written_values_.resize(num_leds, 0);
+  written_valid_ = false;
+  contiguous_registers_ = false;
+  first_register_address_ = 0;
+  last_write_ns_ = 0;
   // we want to write the LEDs in the beginning to show that ros control started successfully. set LED 1 white
-  write_leds_ = true;
-  leds_[0] = std_msgs::msg::ColorRGBA();
-  leds_[0].r = 0.3;
-  leds_[0].g = 0.3;
-  leds_[0].b = 0.3;
-  leds_[0].a = 1.0;
+  state_.leds[0] = std_msgs::msg::ColorRGBA();
+  state_.leds[0].r = 0.3;
+  state_.leds[0].g = 0.3;
+  state_.leds[0].b = 0.3;
+  state_.leds[0].a = 1.0;
+  publishLeds();
 }
 
 bool LedsHardwareInterface::init() {
+  double min_write_period, blink_period;
+  nh_->get_parameter_or("leds.min_write_period", min_write_period, 0.02);
+  nh_->get_parameter_or("leds.blink_period", blink_period, 0.2);
+  min_write_period_ns_ = int64_t(min_write_period * 1e9);
+  blink_period_ns_ = std::max(int64_t(blink_period * 1e9), int64_t(1));
+
+  // the color registers follow each other in the control table of the boards, so they can be written in one packet
+  const ControlItem *first_item = driver_->getItemInfo(id_, "LED_0");
+  contiguous_registers_ = first_item != nullptr;
+  for (size_t i = 0; i < register_values_.size() && contiguous_registers_; i++) {
+    const ControlItem *item = driver_->getItemInfo(id_, ("LED_" + std::to_string(i)).c_str());
+    contiguous_registers_ = item != nullptr && item->data_length == 4 && item->address == first_item->address + 4 * i;
+  }
+  if (contiguous_registers_) {
+    first_register_address_ = first_item->address;
+  } else {
+    RCLCPP_WARN(nh_->get_logger(), "LED registers of ID %d are not contiguous, writing them one by one", id_);
+  }
+
   if (start_number_ == 0) {
     leds_service_ = nh_->create_service<bitbots_msgs::srv::Leds>(
         "/set_leds", std::bind(&LedsHardwareInterface::setLeds, this, _1, _2));
+    blink_sub_ = nh_->create_subscription<std_msgs::msg::ColorRGBA>(
+        "/led_blink", 1, std::bind(&LedsHardwareInterface::blinkCb, this, _1));
   }
   sub0_ = nh_->create_subscription<std_msgs::msg::ColorRGBA>("/led" + std::to_string(start_number_), 1,
                                                              std::bind(&LedsHardwareInterface::ledCb0, this, _1));
@@ -39,25 +67,39 @@ bool LedsHardwareInterface::init() {
 // todo this could be done more clever and for a general number of leds
 void LedsHardwareInterface::ledCb0(std_msgs::msg::ColorRGBA msg) {
   // only write to bus if there is actually a change
-  if (msg.r != leds_[0].r || msg.g != leds_[0].g || msg.b != leds_[0].b) {
-    leds_[0] = msg;
-    write_leds_ = true;
+  if (msg.r != state_.leds[0].r || msg.g != state_.leds[0].g || msg.b != state_.leds[0].b) {
+    state_.leds[0] = msg;
+    publishLeds();
   }
 }
 
 void LedsHardwareInterface::ledCb1(std_msgs::msg::ColorRGBA msg) {
   // only write to bus if there is actually a change
-  if (msg.r != leds_[1].r || msg.g != leds_[1].g || msg.b != leds_[1].b) {
-    leds_[1] = msg;
-    write_leds_ = true;
+  if (msg.r != state_.leds[1].r || msg.g != state_.leds[1].g || msg.b != state_.leds[1].b) {
+    state_.leds[1] = msg;
+    publishLeds();
   }
 }
 
 void LedsHardwareInterface::ledCb2(std_msgs::msg::ColorRGBA msg) {
   // only write to bus if there is actually a change
-  if (msg.r != leds_[2].r || msg.g != leds_[2].g || msg.b != leds_[2].b) {
-    leds_[2] = msg;
-    write_leds_ = true;
+  if (msg.r != state_.leds[2].r || msg.g != state_.leds[2].g || msg.b != state_.leds[2].b) {
+    state_.leds[2] = msg;
+    publishLeds();
+  }
+}
+
+void LedsHardwareInterface::blinkCb(std_msgs::msg::ColorRGBA msg) {
+  /**
+   * All LEDs blink in the given color until a color with an alpha of 0 is received.
+   * The blinking is done by the control loop, the colors set in the meantime are shown after it stopped.
+   */
+  bool blink = msg.a > 0;
+  if (blink != state_.blink || msg.r != state_.blink_color.r || msg.g != state_.blink_color.g ||
+      msg.b != state_.blink_color.b) {
+    state_.blink = blink;
+    state_.blink_color = msg;
+    publishLeds();
   }
 }
 
@@ -66,22 +108,30 @@ void LedsHardwareInterface::read(const rclcpp::Time &t, const rclcpp::Duration &
 void LedsHardwareInterface::setLeds(const std::shared_ptr<bitbots_msgs::srv::Leds::Request> req,
                                     std::shared_ptr<bitbots_msgs::srv::Leds::Response> resp) {
   RCLCPP_WARN_STREAM(nh_->get_logger(), "service");
-  if (req->leds.size() != leds_.size()) {
+  if (req->leds.size() != state_.leds.size()) {
     RCLCPP_WARN_STREAM(nh_->get_logger(), "You are trying to set " << req->leds.size() << " leds while the board has "
-                                                                   << leds_.size() << " leds.");
+                                                                   << state_.leds.size() << " leds.");
   }
 
-  for (size_t i = 0; i < leds_.size(); i++) {
+  for (size_t i = 0; i < state_.leds.size(); i++) {
     // return current state of LEDs
-    resp->previous_leds.push_back(leds_[i]);
+    resp->previous_leds.push_back(state_.leds[i]);
 
     if (req->leds[i].r > 1.0f || req->leds[i].r < 0.0f || req->leds[i].g > 1.0f || req->leds[i].g < 0.0f ||
         req->leds[i].b > 1.0f || req->leds[i].b < 0.0f) {
       RCLCPP_WARN_STREAM(nh_->get_logger(), "You tried to set LED_" << i << " to a value not between 0 and 1");
     }
-    leds_[i] = req->leds[i];
+    state_.leds[i] = req->leds[i];
   }
-  write_leds_ = true;
+  publishLeds();
+}
+
+void LedsHardwareInterface::publishLeds() {
+  /**
+   * Hands the colors over to the control loop, which writes them in the next cycle
+   */
+  leds_buffer_.writeBuffer() = state_;
+  leds_buffer_.publish();
 }
 
 uint32_t rgba_to_int32(std_msgs::msg::ColorRGBA rgba) {
@@ -93,13 +143,64 @@ uint32_t rgba_to_int32(std_msgs::msg::ColorRGBA rgba) {
 }
 
 void LedsHardwareInterface::write(const rclcpp::Time &t, const rclcpp::Duration &dt) {
-  if (write_leds_) {
+  /**
+   * Writes the LEDs whose color changed, at most once per min_write_period. Changes in between are combined in the
+   * buffer, so only the latest colors are written.
+   */
+  int64_t now = t.nanoseconds();
+  if (now - last_write_ns_ < min_write_period_ns_) {
+    return;
+  }
+  leds_buffer_.update();
+  const LedState &state = leds_buffer_.readBuffer();
+  if (state.leds.size() != register_values_.size()) {
+    // nothing was published yet
+    return;
+  }
+  bool blink_on = state.blink && (now / blink_period_ns_) % 2 == 0;
+  size_t count = register_values_.size();
+  for (size_t i = 0; i < count; i++) {
     // resort LEDs to go from left to right
-    driver_->writeRegister(id_, "LED_2", rgba_to_int32(leds_[0]));
-    driver_->writeRegister(id_, "LED_1", rgba_to_int32(leds_[1]));
-    driver_->writeRegister(id_, "LED_0", rgba_to_int32(leds_[2]));
+    register_values_[i] = rgba_to_int32(blink_on ? state.blink_color : state.leds[count - 1 - i]);
+  }
+
+  // only the registers from the first to the last changed one are written
+  size_t first = count;
+  size_t last = 0;
+  for (size_t i = 0; i < count; i++) {
+    if (!written_valid_ || register_values_[i] != written_values_[i]) {
+      first = std::min(first, i);
+      last = i;
+    }
+  }
+  if (first == count) {
+    return;
+  }
+  if (writeRegisters(first, last)) {
+    std::copy(register_values_.begin() + first, register_values_.begin() + last + 1, written_values_.begin() + first);
+    // all registers are written if the written values were not valid
+    written_valid_ = true;
+  } else {
+    written_valid_ = false;
+  }
+  last_write_ns_ = now;
+}
 
-    write_leds_ = false;
+bool LedsHardwareInterface::writeRegisters(size_t first, size_t last) {
+  if (!contiguous_registers_) {
+    bool success = true;
+    for (size_t i = first; i <= last; i++) {
+      success = driver_->writeRegister(id_, ("LED_" + std::to_string(i)).c_str(), register_values_[i]) && success;
+    }
+    return success;
+  }
+  write_data_.clear();
+  for (size_t i = first; i <= last; i++) {
+    // little endian like all registers
+    for (int byte = 0; byte < 4; byte++) {
+      write_data_.push_back(uint8_t(register_values_[i] >> (8 * byte)));
+    }
   }
+  return driver_->writeRegister(id_, first_register_address_ + 4 * first, write_data_.size(), write_data_.data());
 }
-}  // namespace bitbots_ros_control
\ No newline at end of file
+}  // namespace bitbots_ros_control
@@ -0,0 +1,96 @@
+#include <pthread.h>
+#include <sched.h>
+#include <time.h>
+
+#include <bitbots_ros_control/loop_timer.hpp>
+#include <cerrno>
+#include <cstring>
+
+namespace bitbots_ros_control {
+
+LoopTimer::LoopTimer(double control_loop_hz, std::chrono::nanoseconds spin_margin, OverrunPolicy policy)
+    : period_(int64_t(1e9 / control_loop_hz)),
+      spin_margin_(spin_margin.count()),
+      policy_(policy),
+      deadline_(0),
+      last_deadline_(0) {}
+
+int64_t LoopTimer::now() {
+  timespec time;
+  clock_gettime(CLOCK_MONOTONIC, &time);
+  return int64_t(time.tv_sec) * 1000000000 + time.tv_nsec;
+}
+
+void LoopTimer::sleepUntil(int64_t time) {
+  timespec deadline;
+  deadline.tv_sec = time / 1000000000;
+  deadline.tv_nsec = time % 1000000000;
+  // the sleep is interrupted by signals, e.g. the ctrl-c handler of the node
+  while (clock_nanosleep(CLOCK_MONOTONIC, TIMER_ABSTIME, &deadline, nullptr) == EINTR) {
+  }
+}
+
+void LoopTimer::start() { deadline_ = now() + period_; }
+
+uint64_t LoopTimer::wait() {
+  uint64_t skipped = 0;
+  int64_t time = now();
+  if (time >= deadline_) {
+    int64_t behind = (time - deadline_) / period_ + 1;
+    if (policy_ == OverrunPolicy::SKIP) {
+      // the next deadline on the grid of the previous ones
+      deadline_ += behind * period_;
+      skipped = behind;
+    } else if (behind > MAX_CATCH_UP) {
+      // too far behind to catch up, start again from now instead of running many cycles back to back
+      skipped = behind;
+      deadline_ = time;
+    }
+  }
+  if (deadline_ - time > spin_margin_) {
+    sleepUntil(deadline_ - spin_margin_);
+  }
+  while (now() < deadline_) {
+  }
+  last_deadline_ = deadline_;
+  deadline_ += period_;
+  return skipped;
+}
+
+bool LoopTimer::configureThread(int64_t cpu, int priority, std::string &error) {
+  bool success = true;
+  pthread_t handle = pthread_self();
+  if (cpu >= 0) {
+    cpu_set_t cpu_set;
+    CPU_ZERO(&cpu_set);
+    CPU_SET(cpu, &cpu_set);
+    int result = pthread_setaffinity_np(handle, sizeof(cpu_set_t), &cpu_set);
+    if (result != 0) {
+      error += "Could not pin control loop to cpu " + std::to_string(cpu) + ": " + strerror(result) + ". ";
+      success = false;
+    }
+  }
+  if (priority > 0) {
+    sched_param param{};
+    param.sched_priority = priority;
+    int result = pthread_setschedparam(handle, SCHED_FIFO, &param);
+    if (result != 0) {
+      error += "Could not set SCHED_FIFO priority " + std::to_string(priority) +
+               " for control loop: " + strerror(result) + ". ";
+      success = false;
+    }
+  }
+  return success;
+}
+
+bool LoopTimer::stringToOverrunPolicy(const std::string &name, OverrunPolicy &policy) {
+  if (name == "skip") {
+    policy = OverrunPolicy::SKIP;
+  } else if (name == "catch_up") {
+    policy = OverrunPolicy::CATCH_UP;
+  } else {
+    return false;
+  }
+  return true;
+}
+}  // namespace bitbots_ros_control
@@ -0,0 +1,218 @@
+#include <algorithm>
+#include <bitbots_ros_control/loop_timing.hpp>
+#include <cstdio>
+#include <cstdlib>
+#include <memory>
+#include <vector>
+
+namespace bitbots_ros_control {
+
+size_t LatencyHistogram::bucket(uint64_t ns) {
+  // small values get one bucket each, larger ones are split into SUB_BUCKETS buckets per power of two
+  if (ns < 2 * SUB_BUCKETS) {
+    return ns;
+  }
+  size_t exponent = 63 - __builtin_clzll(ns);
+  size_t mantissa = (ns >> (exponent - 3)) & (SUB_BUCKETS - 1);
+  return 2 * SUB_BUCKETS + (exponent - 4) * SUB_BUCKETS + mantissa;
+}
+
+uint64_t LatencyHistogram::upperBound(size_t bucket) {
+  if (bucket < 2 * SUB_BUCKETS) {
+    return bucket;
+  }
+  size_t exponent = (bucket - 2 * SUB_BUCKETS) / SUB_BUCKETS + 4;
+  size_t mantissa = (bucket - 2 * SUB_BUCKETS) % SUB_BUCKETS;
+  return ((SUB_BUCKETS + mantissa + 1) << (exponent - 3)) - 1;
+}
+
+void LatencyHistogram::record(uint64_t ns) {
+  buckets_[bucket(ns)].fetch_add(1, std::memory_order_relaxed);
+  uint64_t max = max_.load(std::memory_order_relaxed);
+  while (ns > max && !max_.compare_exchange_weak(max, ns, std::memory_order_relaxed)) {
+  }
+}
+
+LatencyHistogram::Summary LatencyHistogram::collect() {
+  std::array<uint32_t, NUM_BUCKETS> counts;
+  uint64_t count = 0;
+  for (size_t i = 0; i < NUM_BUCKETS; i++) {
+    counts[i] = buckets_[i].exchange(0, std::memory_order_relaxed);
+    count += counts[i];
+  }
+  Summary summary{count, 0, 0, max_.exchange(0, std::memory_order_relaxed)};
+  uint64_t seen = 0;
+  for (size_t i = 0; i < NUM_BUCKETS && seen < count; i++) {
+    seen += counts[i];
+    if (summary.p50 == 0 && seen * 2 >= count) {
+      summary.p50 = upperBound(i);
+    }
+    if (seen * 100 >= count * 99) {
+      summary.p99 = upperBound(i);
+    }
+  }
+  // the bucket bounds can be larger than the actual maximum
+  summary.p50 = std::min(summary.p50, summary.max);
+  summary.p99 = std::min(summary.p99, summary.max);
+  return summary;
+}
+
+LoopTiming::LoopTiming(double control_loop_hz)
+    : target_period_(int64_t(1e9 / control_loop_hz)),
+      overruns_(0),
+      missed_deadlines_(0),
+      total_overruns_(0),
+      total_missed_deadlines_(0),
+      skipped_(0),
+      total_skipped_(0),
+      diagnostics_(nullptr),
+      diagnostic_status_(-1) {
+  period_phase_ = addPhase("period");
+  jitter_phase_ = addPhase("jitter");
+  work_phase_ = addPhase("work");
+}
+
+size_t LoopTiming::addPhase(const std::string &name) {
+  phases_.emplace_back();
+  phases_.back().name = name;
+  return phases_.size() - 1;
+}
+
+void LoopTiming::endCycle(Clock::time_point cycle_start, Clock::time_point work_end) {
+  record(work_phase_, cycle_start, work_end);
+  if (work_end - cycle_start > target_period_) {
+    overruns_++;
+  }
+  if (last_cycle_start_ != Clock::time_point()) {
+    record(period_phase_, last_cycle_start_, cycle_start);
+    std::chrono::nanoseconds jitter = cycle_start - last_cycle_start_ - target_period_;
+    phases_[jitter_phase_].histogram.record(std::abs(jitter.count()));
+    if (cycle_start - last_cycle_start_ > target_period_ * 3 / 2) {
+      missed_deadlines_++;
+    }
+  }
+  last_cycle_start_ = cycle_start;
+}
+
+// p50, p99 and max of each phase, followed by the counters and their totals
+static const size_t PHASE_VALUES = 3;
+static const size_t COUNTER_VALUES = 6;
+
+static void formatStatus(const std::vector<double> &values, size_t phase_count,
+                         diagnostic_msgs::msg::DiagnosticStatus &status) {
+  for (size_t i = 0; i < phase_count; i++) {
+    char value[64];
+    snprintf(value, sizeof(value), "p50 %.1f us, p99 %.1f us, max %.1f us", values[PHASE_VALUES * i] / 1e3,
+             values[PHASE_VALUES * i + 1] / 1e3, values[PHASE_VALUES * i + 2] / 1e3);
+    status.values[i].value = value;
+  }
+  const double *counters = values.data() + PHASE_VALUES * phase_count;
+  for (size_t i = 0; i < COUNTER_VALUES / 2; i++) {
+    char value[64];
+    snprintf(value, sizeof(value), "%.0f (%.0f total)", counters[2 * i], counters[2 * i + 1]);
+    status.values[phase_count + i].value = value;
+  }
+  double overruns = counters[0];
+  double missed_deadlines = counters[2];
+
+  // check if we are staying the correct cycle time
+  if (missed_deadlines > 0) {
+    status.level = diagnostic_msgs::msg::DiagnosticStatus::WARN;
+    status.message = "Bus runs not at specified frequency";
+  } else if (overruns > 0) {
+    status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
+    status.message = std::to_string(int64_t(overruns)) + " cycles took longer than the period";
+  } else {
+    status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
+    status.message = "";
+  }
+}
+
+void LoopTiming::addDiagnostics(DiagnosticsPublisher *diagnostics, const std::string &name,
+                                const std::string &hardware_id, StatusCallback formatted) {
+  std::vector<std::string> keys;
+  for (const Phase &phase : phases_) {
+    keys.push_back(phase.name);
+  }
+  keys.push_back("overruns");
+  keys.push_back("missed deadlines");
+  keys.push_back("skipped periods");
+  size_t phase_count = phases_.size();
+  // the values do not fit into one record. the diagnostics thread collects the records of one push, which all have its
+  // stamp, and only formats the status when all of them arrived. if one was dropped, the incomplete set is discarded
+  struct Chunks {
+    std::vector<double> values;
+    size_t count;
+    int64_t stamp;
+    size_t received;
+  };
+  auto chunks = std::make_shared<Chunks>();
+  chunks->values.assign(PHASE_VALUES * phase_count + COUNTER_VALUES, 0);
+  chunks->count = (chunks->values.size() + DiagnosticRecord::MAX_VALUES - 2) / (DiagnosticRecord::MAX_VALUES - 1);
+  chunks->stamp = -1;
+  chunks->received = 0;
+  diagnostics_ = diagnostics;
+  diagnostic_status_ = diagnostics->addPartialStatus(
+      name, hardware_id, keys,
+      [chunks, phase_count, formatted](const DiagnosticRecord &record, diagnostic_msgs::msg::DiagnosticStatus &status) {
+        if (record.stamp != chunks->stamp) {
+          chunks->stamp = record.stamp;
+          chunks->received = 0;
+        }
+        // the first value of each record is the index of its values
+        size_t offset = size_t(record.values[0]);
+        for (size_t i = 1; i < DiagnosticRecord::MAX_VALUES && offset + i - 1 < chunks->values.size(); i++) {
+          chunks->values[offset + i - 1] = record.values[i];
+        }
+        chunks->received++;
+        if (chunks->received < chunks->count) {
+          return false;
+        }
+        formatStatus(chunks->values, phase_count, status);
+        if (formatted) {
+          formatted(status);
+        }
+        return true;
+      });
+}
+
+void LoopTiming::push(int64_t stamp) {
+  total_overruns_ += overruns_;
+  total_missed_deadlines_ += missed_deadlines_;
+  total_skipped_ += skipped_;
+  if (diagnostics_) {
+    DiagnosticRecord record;
+    record.status = diagnostic_status_;
+    record.success = true;
+    record.stamp = stamp;
+    size_t offset = 0;
+    size_t index = 1;
+    auto add = [&](double value) {
+      record.values[index++] = value;
+      if (index == DiagnosticRecord::MAX_VALUES) {
+        record.values[0] = double(offset);
+        diagnostics_->push(record);
+        offset += DiagnosticRecord::MAX_VALUES - 1;
+        index = 1;
+      }
+    };
+    for (Phase &phase : phases_) {
+      LatencyHistogram::Summary summary = phase.histogram.collect();
+      add(double(summary.p50));
+      add(double(summary.p99));
+      add(double(summary.max));
+    }
+    for (uint64_t counter :
+         {overruns_, total_overruns_, missed_deadlines_, total_missed_deadlines_, skipped_, total_skipped_}) {
+      add(double(counter));
+    }
+    if (index > 1) {
+      record.values[0] = double(offset);
+      diagnostics_->push(record);
+    }
+  }
+  overruns_ = 0;
+  missed_deadlines_ = 0;
+  skipped_ = 0;
+}
+}  // namespace bitbots_ros_control
@@ -1,5 +1,8 @@
 #include <signal.h>
 
+#include <algorithm>
+#include <bitbots_ros_control/diagnostics_publisher.hpp>
+#include <bitbots_ros_control/loop_timer.hpp>
 #include <bitbots_ros_control/wolfgang_hardware_interface.hpp>
 #include <controller_manager/controller_manager.hpp>
 #include <rclcpp/experimental/executors/events_executor/events_executor.hpp>
@@ -19,8 +22,14 @@ int main(int argc, char *argv[]) {
 
   // initialize ros
   rclcpp::init(argc, argv);
-  rclcpp::NodeOptions options =
-      rclcpp::NodeOptions().automatically_declare_parameters_from_overrides(true).allow_undeclared_parameters(true);
+  std::chrono::steady_clock::time_point startup_time = std::chrono::steady_clock::now();
+  // subscribers in the same process get the messages of the control loop without serialization
+  std::vector<std::string> args = rclcpp::remove_ros_arguments(argc, argv);
+  bool intra_process = std::find(args.begin(), args.end(), "--intra-process") != args.end();
+  rclcpp::NodeOptions options = rclcpp::NodeOptions()
+                                    .automatically_declare_parameters_from_overrides(true)
+                                    .allow_undeclared_parameters(true)
+                                    .use_intra_process_comms(intra_process);
   rclcpp::Node::SharedPtr nh = rclcpp::Node::make_shared("wolfgang_hardware_interface", options);
 
   // create hardware interfaces
@@ -30,33 +39,81 @@ int main(int argc, char *argv[]) {
     return 1;
   }
 
-  // diagnostics
-  int diag_counter = 0;
-  rclcpp::Publisher<diagnostic_msgs::msg::DiagnosticArray>::SharedPtr diagnostic_pub =
-      nh->create_publisher<diagnostic_msgs::msg::DiagnosticArray>("/diagnostics", 10);
-  diagnostic_msgs::msg::DiagnosticArray array_msg = diagnostic_msgs::msg::DiagnosticArray();
-  diagnostic_msgs::msg::DiagnosticStatus status = diagnostic_msgs::msg::DiagnosticStatus();
-  // add prefix PS for pressure sensor to sort in diagnostic analyser
-  status.name = "BUSBus";
-  status.hardware_id = "Bus";
-
   // Start control loop
   rclcpp::Time current_time = nh->get_clock()->now();
   rclcpp::Duration period = nh->get_clock()->now() - current_time;
   bool first_update = true;
   float control_loop_hz = 500.0;
   nh->get_parameter("control_loop_hz", control_loop_hz);
-  rclcpp::Rate rate(control_loop_hz);
+  // the loop sleeps until shortly before each deadline and spins the rest, so it wakes up close to the deadline
+  int64_t spin_margin_us = 100;
+  nh->get_parameter("loop_timer.spin_margin_us", spin_margin_us);
+  std::string overrun_policy_name = "skip";
+  nh->get_parameter("loop_timer.overrun_policy", overrun_policy_name);
+  bitbots_ros_control::LoopTimer::OverrunPolicy overrun_policy;
+  if (!bitbots_ros_control::LoopTimer::stringToOverrunPolicy(overrun_policy_name, overrun_policy)) {
+    RCLCPP_ERROR(nh->get_logger(), "Unknown overrun policy '%s', using skip", overrun_policy_name.c_str());
+    overrun_policy = bitbots_ros_control::LoopTimer::OverrunPolicy::SKIP;
+  }
+  bitbots_ros_control::LoopTimer timer(control_loop_hz, std::chrono::microseconds(spin_margin_us), overrun_policy);
   rclcpp::Time stop_time;
   bool shut_down_started = false;
   rclcpp::experimental::executors::EventsExecutor exec;
   exec.add_node(nh);
+  // with a separate callback thread, the control loop only reads and writes and the callbacks can not delay it
+  // the interfaces get the commands of the callbacks through lock free buffers and flags
+  bool separate_callback_thread = false;
+  nh->get_parameter("separate_callback_thread", separate_callback_thread);
+  std::thread callback_thread;
+  if (separate_callback_thread) {
+    callback_thread = std::thread([&exec]() { exec.spin(); });
+  }
+
+  // timing of the control loop, published once per second on the diagnostics and a separate topic
+  using Clock = bitbots_ros_control::LoopTiming::Clock;
+  bitbots_ros_control::LoopTiming timing(control_loop_hz);
+  size_t read_phase = timing.addPhase("read");
+  size_t write_phase = timing.addPhase("write");
+  size_t spin_phase = timing.addPhase("spin_some");
+  size_t sleep_phase = timing.addPhase("sleep");
+  // time between the deadline and the start of the next cycle
+  size_t wakeup_phase = timing.addPhase("wakeup");
+  hw.setTiming(&timing);
+  int diag_counter = 0;
+  int diag_rate = std::max(int(control_loop_hz), 1);
+  rclcpp::Publisher<diagnostic_msgs::msg::DiagnosticArray>::SharedPtr timing_pub =
+      nh->create_publisher<diagnostic_msgs::msg::DiagnosticArray>("/ros_control/loop_timing", 10);
+  // the phases of the ports are only known after the initialization of the hardware, so the timing gets its own
+  // publisher, the status messages are built in its thread and not in the control loop
+  bitbots_ros_control::DiagnosticsPublisher timing_diagnostics(nh);
+  timing.addDiagnostics(&timing_diagnostics, "BUSBus", "Bus",
+                        [nh, timing_pub](const diagnostic_msgs::msg::DiagnosticStatus &status) {
+                          diagnostic_msgs::msg::DiagnosticArray array_msg;
+                          array_msg.header.stamp = nh->get_clock()->now();
+                          array_msg.status = {status};
+                          timing_pub->publish(array_msg);
+                        });
+  timing_diagnostics.start(10);
+
+  // the main thread is only configured after the callback and diagnostics threads were started, new threads inherit
+  // the affinity and scheduler of the thread that creates them
+  int64_t loop_cpu = -1;
+  nh->get_parameter("loop_timer.cpu", loop_cpu);
+  int64_t loop_priority = 0;
+  nh->get_parameter("loop_timer.priority", loop_priority);
+  std::string thread_error;
+  if (!bitbots_ros_control::LoopTimer::configureThread(loop_cpu, int(loop_priority), thread_error)) {
+    RCLCPP_WARN(nh->get_logger(), "%s", thread_error.c_str());
+  }
 
+  timer.start();
   while (!request_shutdown || nh->get_clock()->now().seconds() - stop_time.seconds() < 5) {
     //
     // read
     //
+    Clock::time_point cycle_start = Clock::now();
     hw.read(current_time, period);
+    Clock::time_point read_end = Clock::now();
     period = nh->get_clock()->now() - current_time;
     current_time = nh->get_clock()->now();
 
@@ -64,6 +121,9 @@ int main(int argc, char *argv[]) {
     // therefore, the controller manager is only updated starting with the second iteration
     if (first_update) {
       first_update = false;
+      // mostly the time to find all devices, e.g. after switching on the power
+      RCLCPP_INFO(nh->get_logger(), "First control cycle %.3f s after start",
+                  std::chrono::duration<double>(Clock::now() - startup_time).count());
     } else {
       // todo replaced controller part, if necessary
     }
@@ -71,28 +131,28 @@ int main(int argc, char *argv[]) {
     //
     // Write
     //
+    Clock::time_point write_start = Clock::now();
     hw.write(current_time, period);
-    exec.spin_some();
-    rate.sleep();
+    Clock::time_point write_end = Clock::now();
+    if (!separate_callback_thread) {
+      exec.spin_some();
+    }
+    Clock::time_point spin_end = Clock::now();
+    timing.addSkipped(timer.wait());
+    Clock::time_point sleep_end = Clock::now();
+    timing.record(wakeup_phase, timer.lastDeadline(), sleep_end);
+    timing.record(read_phase, cycle_start, read_end);
+    timing.record(write_phase, write_start, write_end);
+    timing.record(spin_phase, write_end, spin_end);
+    timing.record(sleep_phase, spin_end, sleep_end);
+    timing.endCycle(cycle_start, spin_end);
 
     //
     // Diagnostics
     //
-    // publish diagnostic messages each 100 frames
-    if (diag_counter % 100 == 0) {
-      // check if we are staying the correct cycle time. warning if we only get half
-      array_msg.header.stamp = nh->get_clock()->now();
-      if (rate.period() < std::chrono::nanoseconds(int(1e9 * (1 / control_loop_hz) * 2))) {
-        status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
-        status.message = "";
-      } else {
-        status.level = diagnostic_msgs::msg::DiagnosticStatus::WARN;
-        status.message = "Bus runs not at specified frequency";
-      }
-      std::vector array = std::vector<diagnostic_msgs::msg::DiagnosticStatus>();
-      array.push_back(status);
-      array_msg.status = array;
-      diagnostic_pub->publish(array_msg);
+    // publish the loop timing once per second
+    if (diag_counter % diag_rate == 0) {
+      timing.push(nh->get_clock()->now().nanoseconds());
     }
     diag_counter++;
 
@@ -102,5 +162,9 @@ int main(int argc, char *argv[]) {
       RCLCPP_INFO(nh->get_logger(), "Shutting down in 5 seconds");
     }
   }
+  if (callback_thread.joinable()) {
+    exec.cancel();
+    callback_thread.join();
+  }
   return 0;
 }
@@ -0,0 +1,145 @@
+#include <pthread.h>
+#include <sched.h>
+
+#include <algorithm>
+#include <bitbots_ros_control/port_worker_pool.hpp>
+#include <cstring>
+
+namespace bitbots_ros_control {
+
+PortWorkerPool::PortWorkerPool() : generation_(0), phase_(0), pending_(0), handoff_pending_(0), shutdown_(false) {}
+
+PortWorkerPool::~PortWorkerPool() { stop(); }
+
+bool PortWorkerPool::start(size_t num_ports, Work work, const std::vector<int64_t> &cpu_affinity, int priority) {
+  stop();
+  work_ = std::move(work);
+  errors_.clear();
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    shutdown_ = false;
+    pending_ = 0;
+    handoff_pending_ = 0;
+    handoff_signaled_.assign(num_ports, false);
+  }
+  bool success = true;
+  for (size_t port = 0; port < num_ports; port++) {
+    // the start generation is passed directly, a phase requested before the thread is scheduled is therefore not lost
+    threads_.emplace_back(&PortWorkerPool::workerLoop, this, port, generation_);
+    success &= configureThread(port, cpu_affinity, priority);
+  }
+  return success;
+}
+
+bool PortWorkerPool::configureThread(size_t port, const std::vector<int64_t> &cpu_affinity, int priority) {
+  /**
+   * Pins the worker of the given port to its cpu core and sets the real time priority, if requested
+   */
+  bool success = true;
+  pthread_t handle = threads_[port].native_handle();
+  if (port < cpu_affinity.size() && cpu_affinity[port] >= 0) {
+    cpu_set_t cpu_set;
+    CPU_ZERO(&cpu_set);
+    CPU_SET(cpu_affinity[port], &cpu_set);
+    int result = pthread_setaffinity_np(handle, sizeof(cpu_set_t), &cpu_set);
+    if (result != 0) {
+      errors_.push_back("Could not pin worker of port " + std::to_string(port) + " to cpu " +
+                        std::to_string(cpu_affinity[port]) + ": " + strerror(result));
+      success = false;
+    }
+  }
+  if (priority > 0) {
+    sched_param param{};
+    param.sched_priority = priority;
+    int result = pthread_setschedparam(handle, SCHED_FIFO, &param);
+    if (result != 0) {
+      errors_.push_back("Could not set SCHED_FIFO priority " + std::to_string(priority) + " for worker of port " +
+                        std::to_string(port) + ": " + strerror(result));
+      success = false;
+    }
+  }
+  return success;
+}
+
+void PortWorkerPool::stop() {
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    shutdown_ = true;
+  }
+  start_cv_.notify_all();
+  for (std::thread &thread : threads_) {
+    if (thread.joinable()) {
+      thread.join();
+    }
+  }
+  threads_.clear();
+}
+
+void PortWorkerPool::run(int phase) {
+  dispatch(phase);
+  wait();
+}
+
+void PortWorkerPool::dispatch(int phase) {
+  if (threads_.empty()) {
+    return;
+  }
+  {
+    std::lock_guard<std::mutex> lock(mutex_);
+    phase_ = phase;
+    pending_ = threads_.size();
+    handoff_pending_ = threads_.size();
+    std::fill(handoff_signaled_.begin(), handoff_signaled_.end(), false);
+    generation_++;
+  }
+  start_cv_.notify_all();
+}
+
+void PortWorkerPool::wait() {
+  std::unique_lock<std::mutex> lock(mutex_);
+  // wait till all workers are finished with this phase
+  done_cv_.wait(lock, [this] { return pending_ == 0; });
+}
+
+void PortWorkerPool::signalHandoff(size_t port) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  if (!handoff_signaled_[port]) {
+    handoff_signaled_[port] = true;
+    handoff_pending_--;
+    if (handoff_pending_ == 0) {
+      done_cv_.notify_all();
+    }
+  }
+}
+
+void PortWorkerPool::waitHandoff() {
+  std::unique_lock<std::mutex> lock(mutex_);
+  done_cv_.wait(lock, [this] { return handoff_pending_ == 0 || pending_ == 0; });
+}
+
+void PortWorkerPool::workerLoop(size_t port, uint64_t start_generation) {
+  uint64_t last_generation = start_generation;
+  while (true) {
+    int phase;
+    {
+      std::unique_lock<std::mutex> lock(mutex_);
+      start_cv_.wait(lock, [this, last_generation] { return shutdown_ || generation_ != last_generation; });
+      if (shutdown_) {
+        return;
+      }
+      last_generation = generation_;
+      phase = phase_;
+    }
+
+    work_(port, phase);
+
+    {
+      std::lock_guard<std::mutex> lock(mutex_);
+      pending_--;
+      if (pending_ == 0) {
+        done_cv_.notify_all();
+      }
+    }
+  }
+}
+}  // namespace bitbots_ros_control
@@ -2,8 +2,30 @@
 using std::placeholders::_1;
 using std::placeholders::_2;
 
-PressureConverter::PressureConverter(rclcpp::Node::SharedPtr nh, char side) {
+CopTfBatcher::CopTfBatcher(rclcpp::Node::SharedPtr nh) : transforms_(2), pending_({false, false}) {
+  tf_broadcaster_ = std::make_unique<tf2_ros::TransformBroadcaster>(*nh);
+}
+
+void CopTfBatcher::add(const geometry_msgs::msg::TransformStamped &transform, char side) {
+  std::lock_guard<std::mutex> lock(mutex_);
+  size_t index = side == 'l' ? 0 : 1;
+  if (pending_[index]) {
+    // the other foot did not send anything since the last message of this foot, don't wait for it
+    std::vector<geometry_msgs::msg::TransformStamped> single = {transforms_[index]};
+    tf_broadcaster_->sendTransform(single);
+    pending_[index] = false;
+  }
+  transforms_[index] = transform;
+  pending_[index] = true;
+  if (pending_[0] && pending_[1]) {
+    tf_broadcaster_->sendTransform(transforms_);
+    pending_ = {false, false};
+  }
+}
+
+PressureConverter::PressureConverter(rclcpp::Node::SharedPtr nh, char side, std::shared_ptr<CopTfBatcher> tf_batcher) {
   nh_ = nh;
+  tf_batcher_ = tf_batcher;
   std::string topic;
   rclcpp::CallbackGroup::SharedPtr sub_cbg_ = nh_->create_callback_group(rclcpp::CallbackGroupType::MutuallyExclusive);
 
@@ -50,18 +72,17 @@ PressureConverter::PressureConverter(rclcpp::Node::SharedPtr nh, char side) {
   if (!nh_->has_parameter("cop_threshold"))
     RCLCPP_ERROR_STREAM(nh_->get_logger(), nh_->get_name() << ": cop_threshold not specified");
   cop_threshold_ = nh_->get_parameter("cop_threshold").as_double();
+  nh_->get_parameter_or("wrench_decimation", wrench_decimation_, 1);
+  wrench_decimation_ = std::max(wrench_decimation_, 1);
+  wrench_counter_ = 0;
 
   side_ = side;
 
-  // initialize vector for previous values for average calculations
-  for (int i = 0; i < 4; i++) {
-    std::vector<double> x;
-    for (int j = 0; j < average_; j++) {
-      x.push_back(0.0);
-    }
-    previous_values_.push_back(x);
-  }
+  // initialize ring buffer of previous values for average calculations
+  previous_values_.assign(average_, Channels{0, 0, 0, 0});
+  sums_ = {0, 0, 0, 0};
   current_index_ = 0;
+  setZeroAndScale();
 
   save_zero_and_scale_values_ = false;
   resetZeroAndScaleValues();
@@ -74,12 +95,15 @@ PressureConverter::PressureConverter(rclcpp::Node::SharedPtr nh, char side) {
     single_wrench_topic << topic << "/wrench/" << wrench_topics[i];
     wrench_pubs_.push_back(nh_->create_publisher<geometry_msgs::msg::WrenchStamped>(single_wrench_topic.str(), 1));
   }
+  // the wrench messages are reused, only force and stamp change
+  wrench_msgs_.resize(5);
   for (int i = 0; i < 4; i++) {
     std::stringstream single_wrench_frame;
     single_wrench_frame << side << "_"
                         << "cleat_" << wrench_topics[i];
-    wrench_frames_.push_back(single_wrench_frame.str());
+    wrench_msgs_[i].header.frame_id = single_wrench_frame.str();
   }
+  wrench_msgs_[4].header.frame_id = cop_lr_;
 
   scale_service_ = nh_->create_service<bitbots_msgs::srv::FootScale>(
       topic + "/set_foot_scale", std::bind(&PressureConverter::scaleCallback, this, _1, _2));
@@ -90,41 +114,59 @@ PressureConverter::PressureConverter(rclcpp::Node::SharedPtr nh, char side) {
   options.callback_group = sub_cbg_;
   sub_ = nh_->create_subscription<bitbots_msgs::msg::FootPressure>(
       topic + "/raw", qos, std::bind(&PressureConverter::pressureCallback, this, _1), options);
-  tf_broadcaster_ = std::make_unique<tf2_ros::TransformBroadcaster>(*nh_);
+  if (!tf_batcher_) {
+    tf_broadcaster_ = std::make_unique<tf2_ros::TransformBroadcaster>(*nh_);
+  }
 
   sub_executor_.add_callback_group(sub_cbg_, nh_->get_node_base_interface());
   sub_executor_thread_ = new std::thread([this]() { sub_executor_.spin(); });
 }
 
+void PressureConverter::setZeroAndScale() {
+  std::copy_n(zero_.begin(), 4, zero_channels_.begin());
+  std::copy_n(scale_.begin(), 4, scale_channels_.begin());
+}
+
 void PressureConverter::pressureCallback(bitbots_msgs::msg::FootPressure pressure_raw) {
   bitbots_msgs::msg::FootPressure filtered_msg;
 
   filtered_msg.header = pressure_raw.header;
 
-  previous_values_[0][current_index_] = ((pressure_raw.left_front) - zero_[0]) * scale_[0];
-  previous_values_[1][current_index_] = ((pressure_raw.left_back) - zero_[1]) * scale_[1],
-  previous_values_[2][current_index_] = ((pressure_raw.right_front) - zero_[2]) * scale_[2],
-  previous_values_[3][current_index_] = ((pressure_raw.right_back) - zero_[3]) * scale_[3];
-
-  filtered_msg.left_front = std::accumulate(previous_values_[0].begin(), previous_values_[0].end(), 0.0) / average_;
-  filtered_msg.left_back = std::accumulate(previous_values_[1].begin(), previous_values_[1].end(), 0.0) / average_;
-  filtered_msg.right_front = std::accumulate(previous_values_[2].begin(), previous_values_[2].end(), 0.0) / average_;
-  filtered_msg.right_back = std::accumulate(previous_values_[3].begin(), previous_values_[3].end(), 0.0) / average_;
+  // zero, scale and update the moving average of all channels at once
+  alignas(32) Channels raw = {pressure_raw.left_front, pressure_raw.left_back, pressure_raw.right_front,
+                              pressure_raw.right_back};
+  alignas(32) Channels filtered;
+  Channels &oldest = previous_values_[current_index_];
+  for (size_t i = 0; i < 4; i++) {
+    double value = (raw[i] - zero_channels_[i]) * scale_channels_[i];
+    sums_[i] += value - oldest[i];
+    oldest[i] = value;
+    filtered[i] = std::max(sums_[i] / average_, 0.0);
+  }
   current_index_ = (current_index_ + 1) % average_;
+  if (current_index_ == 0) {
+    // the running sums accumulate rounding errors, recompute them once per pass through the buffer
+    sums_ = {0, 0, 0, 0};
+    for (const Channels &values : previous_values_) {
+      for (size_t i = 0; i < 4; i++) {
+        sums_[i] += values[i];
+      }
+    }
+  }
 
-  filtered_msg.left_front = std::max(filtered_msg.left_front, 0.0);
-  filtered_msg.left_back = std::max(filtered_msg.left_back, 0.0);
-  filtered_msg.right_front = std::max(filtered_msg.right_front, 0.0);
-  filtered_msg.right_back = std::max(filtered_msg.right_back, 0.0);
-
-  std::vector<double> forces_list = {filtered_msg.left_front, filtered_msg.left_back, filtered_msg.right_front,
-                                     filtered_msg.right_back};
-  for (int i = 0; i < 4; i++) {
-    geometry_msgs::msg::WrenchStamped w;
-    w.header.frame_id = wrench_frames_[i];
-    w.header.stamp = pressure_raw.header.stamp;
-    w.wrench.force.z = forces_list[i];
-    wrench_pubs_[i]->publish(w);
+  filtered_msg.left_front = filtered[0];
+  filtered_msg.left_back = filtered[1];
+  filtered_msg.right_front = filtered[2];
+  filtered_msg.right_back = filtered[3];
+
+  bool publish_wrenches = wrench_counter_ == 0;
+  wrench_counter_ = (wrench_counter_ + 1) % wrench_decimation_;
+  if (publish_wrenches) {
+    for (int i = 0; i < 4; i++) {
+      wrench_msgs_[i].header.stamp = pressure_raw.header.stamp;
+      wrench_msgs_[i].wrench.force.z = filtered[i];
+      wrench_pubs_[i]->publish(wrench_msgs_[i]);
+    }
   }
   filtered_pub_->publish(filtered_msg);
   if (save_zero_and_scale_values_) {
@@ -157,19 +199,24 @@ void PressureConverter::pressureCallback(bitbots_msgs::msg::FootPressure pressur
   }
   cop_pub_->publish(cop);
 
+  if (!publish_wrenches) {
+    return;
+  }
   geometry_msgs::msg::TransformStamped cop_tf;
   cop_tf.header = cop.header;
   cop_tf.child_frame_id = cop_lr_;
   cop_tf.transform.translation.x = cop.point.x;
   cop_tf.transform.translation.y = cop.point.y;
   cop_tf.transform.rotation.w = 1;
-  tf_broadcaster_->sendTransform(cop_tf);
+  if (tf_batcher_) {
+    tf_batcher_->add(cop_tf, side_);
+  } else {
+    tf_broadcaster_->sendTransform(cop_tf);
+  }
 
-  geometry_msgs::msg::WrenchStamped w_cop;
-  w_cop.header.frame_id = cop_lr_;
-  w_cop.header.stamp = pressure_raw.header.stamp;
-  w_cop.wrench.force.z = sum_of_forces;
-  wrench_pubs_[4]->publish(w_cop);
+  wrench_msgs_[4].header.stamp = pressure_raw.header.stamp;
+  wrench_msgs_[4].wrench.force.z = sum_of_forces;
+  wrench_pubs_[4]->publish(wrench_msgs_[4]);
 }
 
 void PressureConverter::resetZeroAndScaleValues() {
@@ -239,6 +286,7 @@ bool PressureConverter::scaleCallback(const std::shared_ptr<bitbots_msgs::srv::F
   RCLCPP_WARN_STREAM(nh_->get_logger(), "avg_after: " << average);
 
   scale_[req->sensor] = req->weight / average;
+  setZeroAndScale();
   resetZeroAndScaleValues();
   nh_->set_parameter(rclcpp::Parameter(scale_lr_, rclcpp::ParameterValue(scale_)));
   saveYAML();
@@ -252,6 +300,7 @@ bool PressureConverter::zeroCallback(const std::shared_ptr<std_srvs::srv::Empty:
     zero_[i] = std::accumulate(zero_and_scale_values_[i].begin(), zero_and_scale_values_[i].end(), 0.0) /
                zero_and_scale_values_[i].size();
   }
+  setZeroAndScale();
   resetZeroAndScaleValues();
   nh_->set_parameter(rclcpp::Parameter(zero_lr_, rclcpp::ParameterValue(zero_)));
   saveYAML();
@@ -267,8 +316,13 @@ int main(int argc, char *argv[]) {
   rclcpp::executors::StaticSingleThreadedExecutor executor;
   executor.add_node(nh);
 
-  PressureConverter r(nh, 'r');
-  PressureConverter l(nh, 'l');
+  // optionally send the center of pressure of both feet in one tf message
+  bool batch_cop_tf;
+  nh->get_parameter_or("batch_cop_tf", batch_cop_tf, false);
+  std::shared_ptr<CopTfBatcher> tf_batcher = batch_cop_tf ? std::make_shared<CopTfBatcher>(nh) : nullptr;
+
+  PressureConverter r(nh, 'r', tf_batcher);
+  PressureConverter l(nh, 'l', tf_batcher);
 
   executor.spin();
 
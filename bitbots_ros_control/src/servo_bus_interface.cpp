@@ -1,31 +1,72 @@
+#include <algorithm>
 #include <bitbots_ros_control/servo_bus_interface.hpp>
 #include <bitbots_ros_control/utils.hpp>
+#include <numeric>
 
 namespace bitbots_ros_control {
 
+// control table of the present values, sorted by address
+const std::vector<std::pair<uint16_t, uint16_t>> PRESENT_REGISTER_TABLE = {
+    {124, 2},  // Present_PWM
+    {126, 2},  // Present_Current
+    {128, 4},  // Present_Velocity
+    {132, 4},  // Present_Position
+};
+
+// control table of the ROM and RAM values that can be read back, same for the MX (protocol 2.0) and X series
+// registers which are not in this table are always written
+const std::map<std::string, std::pair<uint16_t, uint16_t>> ROM_RAM_REGISTER_TABLE = {
+    {"Return_Delay_Time", {9, 1}},      {"Temperature_Limit", {31, 1}},  {"Max_Voltage_Limit", {32, 2}},
+    {"Min_Voltage_Limit", {34, 2}},     {"PWM_Limit", {36, 2}},          {"Current_Limit", {38, 2}},
+    {"Velocity_Limit", {44, 4}},        {"Max_Position_Limit", {48, 4}}, {"Min_Position_Limit", {52, 4}},
+    {"Status_Return_Level", {68, 1}},   {"Velocity_I_Gain", {76, 2}},    {"Velocity_P_Gain", {78, 2}},
+    {"Position_D_Gain", {80, 2}},       {"Position_I_Gain", {82, 2}},    {"Position_P_Gain", {84, 2}},
+    {"Profile_Acceleration", {108, 4}}, {"Profile_Velocity", {112, 4}},
+};
+
 ServoBusInterface::ServoBusInterface(rclcpp::Node::SharedPtr nh, std::shared_ptr<DynamixelDriver> &driver,
                                      std::vector<std::tuple<int, std::string, float, float, std::string>> servos)
-    : first_cycle_(true), read_position_(true), read_velocity_(false), read_effort_(true) {
+    : first_cycle_(true),
+      read_position_(true),
+      read_velocity_(false),
+      read_effort_(true),
+      diagnostics_(nullptr),
+      recorder_(nullptr),
+      parameters_(nullptr) {
   nh_ = nh;
+  device_reads_ = nullptr;
   driver_ = driver;
   servos_ = std::move(servos);
+  // the read registers are needed before init, when the device reads of the port are planned
+  read_position_ = nh_->get_parameter("servos.read_position").as_bool();
+  read_velocity_ = nh_->get_parameter("servos.read_velocity").as_bool();
+  read_effort_ = nh_->get_parameter("servos.read_effort").as_bool();
+  read_pwm_ = nh_->get_parameter("servos.read_pwm").as_bool();
+  planPresentRead();
 }
 
 bool ServoBusInterface::init() {
-  diagnostic_pub_ = nh_->create_publisher<diagnostic_msgs::msg::DiagnosticArray>("/diagnostics", 10);
   speak_pub_ = nh_->create_publisher<bitbots_msgs::msg::Audio>("/speak", 1);
 
-  lost_servo_connection_ = false;
-  read_vt_counter_ = 0;
+  failed_servos_ = 0;
+  read_counter_ = 0;
   switch_individual_torque_ = false;
-  reading_successes_ = 0;
-  reading_errors_ = 0;
+  setup_step_ = SETUP_IDLE;
+  control_mode_switch_requested_ = false;
+  rom_ram_requested_ = false;
+  setup_success_ = true;
+  rom_ram_index_ = 0;
+  rom_ram_written_ = 0;
+  rom_ram_read_address_ = 0;
+  rom_ram_read_length_ = 0;
+  setup_diag_task_.rate = 100;
 
   torqueless_mode_ = nh_->get_parameter("torqueless_mode").as_bool();
   read_volt_temp_ = nh_->get_parameter("servos.read_volt_temp").as_bool();
-  vt_update_rate_ = nh_->get_parameter("servos.VT_update_rate").as_int();
+  vte_task_.rate = std::max(int(nh_->get_parameter("servos.VT_update_rate").as_int()), 1);
   warn_volt_ = nh_->get_parameter("servos.warn_volt").as_double();
   warn_temp_ = nh_->get_parameter("servos.warn_temp").as_double();
+  nh_->get_parameter_or("servos.write_deadband", write_deadband_, 0);
 
   // Load dynamixel config from parameter server
   if (!loadDynamixels()) {
@@ -43,66 +84,69 @@ bool ServoBusInterface::init() {
   driver_->addSyncWrite("Goal_Current");
   driver_->addSyncWrite("Goal_PWM");
   driver_->addSyncWrite("Operating_Mode");
-  driver_->addSyncRead("Present_Current");
-  driver_->addSyncRead("Present_Velocity");
-  driver_->addSyncRead("Present_Position");
-  driver_->addSyncRead("Present_PWM");
   driver_->addSyncRead("Hardware_Error_Status");
 
-  // Switch dynamixels to correct control mode (position, velocity, effort)
-  switchDynamixelControlMode();
-
   // allocate correct memory for number of used joints
   joint_count_ = joint_names_.size();
-  current_position_.resize(joint_count_, 0);
-  current_velocity_.resize(joint_count_, 0);
-  current_effort_.resize(joint_count_, 0);
-  current_pwm_.resize(joint_count_, 0);
   current_input_voltage_.resize(joint_count_, 0);
   current_temperature_.resize(joint_count_, 0);
   current_error_.resize(joint_count_, 0);
-  goal_position_.resize(joint_count_, 0);
-  goal_velocity_.resize(joint_count_, 0);
-  goal_acceleration_.resize(joint_count_, 0);
-  goal_effort_.resize(joint_count_, 0);
-  goal_torque_individual_.resize(joint_count_, 1);
 
   // malloc memory only once for later reads and writes to improve performance
-  data_sync_read_positions_ = new int32_t;
-  data_sync_read_velocities_ = new int32_t;
-  data_sync_read_efforts_ = new int32_t;
-  data_sync_read_pwms_ = new int32_t;
-  data_sync_read_error_ = new int32_t;
-  sync_write_goal_position_ = new int32_t;
-  sync_write_goal_velocity_ = new int32_t;
-  sync_write_profile_velocity_ = new int32_t;
-  sync_write_profile_acceleration_ = new int32_t;
-  sync_write_goal_current_ = new int32_t;
-  sync_write_goal_pwm_ = new int32_t;
+  data_sync_read_error_ = new int32_t[joint_count_];
+  initGoalRegister(goal_position_register_, "Goal_Position");
+  initGoalRegister(goal_velocity_register_, "Goal_Velocity");
+  initGoalRegister(profile_velocity_register_, "Profile_Velocity");
+  initGoalRegister(profile_acceleration_register_, "Profile_Acceleration");
+  initGoalRegister(goal_current_register_, "Goal_Current");
+  initGoalRegister(goal_pwm_register_, "Goal_PWM");
+  changed_joints_.reserve(joint_count_);
+  present_data_.assign(joint_count_ * present_read_length_, 0);
+  single_read_present_data_.resize(present_read_length_);
+  sync_read_ids_.reserve(joint_count_);
+  sync_read_joints_.reserve(joint_count_);
+  for (std::vector<int32_t> &values : present_values_) {
+    values.resize(joint_count_, 0);
+  }
+  links_.assign(joint_count_, ServoLink{false, 0, 0, false, 0, 0, 0.0});
+  present_source_ = -1;
+  goal_source_ = -1;
+  if (recorder_) {
+    // the layout of the sync read is needed to decode the recorded data
+    black_box::ServoInfo info = {};
+    info.stride = present_read_length_;
+    info.joint_count = uint8_t(std::min(joint_count_, int(sizeof(info.ids))));
+    info.register_count = uint8_t(present_registers_.size());
+    for (size_t i = 0; i < present_registers_.size(); i++) {
+      info.registers[i][0] = uint8_t(present_registers_[i].value);
+      info.registers[i][1] = uint8_t(present_registers_[i].address);
+      info.registers[i][2] = uint8_t(present_registers_[i].length);
+    }
+    std::copy(joint_ids_.begin(), joint_ids_.begin() + info.joint_count, info.ids);
+    std::string ids = std::to_string(joint_ids_.empty() ? 0 : joint_ids_.front()) + "-" +
+                      std::to_string(joint_ids_.empty() ? 0 : joint_ids_.back());
+    present_source_ = recorder_->addSource("servo present " + ids, &info, sizeof(info));
+    goal_source_ = recorder_->addSource("servo goals " + ids, &info, sizeof(info));
+    recorded_goals_.resize(4 * joint_count_);
+  }
 
+  // Switch dynamixels to correct control mode (position, velocity, effort)
+  requestControlModeSwitch();
+  // the ROM and RAM values are always loaded, since servos.set_ROM_RAM can be switched on while the node is running
+  if (!loadROMRAM()) {
+    RCLCPP_WARN(nh_->get_logger(), "ROM and RAM values are not the same for all servo groups.");
+  }
   // write ROM and RAM values if wanted
   if (nh_->get_parameter("servos.set_ROM_RAM").as_bool()) {
-    if (!writeROMRAM(true)) {
-      RCLCPP_WARN(nh_->get_logger(), "Couldn't write ROM and RAM values to all servos.");
-    }
+    requestROMRAM();
   }
-  writeTorque(nh_->get_parameter("servos.auto_torque").as_bool());
+  // the torque is written by the first cycle after the control mode switch
+  current_torque_ = false;
+  goal_torque_ = nh_->get_parameter("servos.auto_torque").as_bool();
   return true;
 }
 
-ServoBusInterface::~ServoBusInterface() {
-  delete data_sync_read_positions_;
-  delete data_sync_read_velocities_;
-  delete data_sync_read_efforts_;
-  delete data_sync_read_pwms_;
-  delete data_sync_read_error_;
-  delete sync_write_goal_position_;
-  delete sync_write_goal_velocity_;
-  delete sync_write_profile_velocity_;
-  delete sync_write_profile_acceleration_;
-  delete sync_write_goal_current_;
-  delete sync_write_goal_pwm_;
-}
+ServoBusInterface::~ServoBusInterface() { delete[] data_sync_read_error_; }
 
 bool ServoBusInterface::loadDynamixels() {
   /**
@@ -111,11 +155,6 @@ bool ServoBusInterface::loadDynamixels() {
    */
   bool success = true;
 
-  // prepare diagnostic msg
-  diagnostic_msgs::msg::DiagnosticArray array_msg = diagnostic_msgs::msg::DiagnosticArray();
-  std::vector<diagnostic_msgs::msg::DiagnosticStatus> array = std::vector<diagnostic_msgs::msg::DiagnosticStatus>();
-  array_msg.header.stamp = nh_->get_clock()->now();
-
   // get control mode
   std::string control_mode;
   control_mode = nh_->get_parameter("servos.control_mode").as_string();
@@ -124,12 +163,6 @@ bool ServoBusInterface::loadDynamixels() {
     return false;
   }
 
-  // get values to read
-  read_position_ = nh_->get_parameter("servos.read_position").as_bool();
-  read_velocity_ = nh_->get_parameter("servos.read_velocity").as_bool();
-  read_effort_ = nh_->get_parameter("servos.read_effort").as_bool();
-  read_pwm_ = nh_->get_parameter("servos.read_pwm").as_bool();
-
   // iterate over all servos and save the information
   // the wolfgang hardware interface already loaded them into the driver by pinging
   for (std::tuple<int, std::string, float, float, std::string> &servo : servos_) {
@@ -143,20 +176,46 @@ bool ServoBusInterface::loadDynamixels() {
     joint_offsets_.push_back(joint_offset);
     std::string group = std::get<4>(servo);
     joint_groups_.push_back(group);
+    if (diagnostics_) {
+      // add prefix DS for dynamixel servo to sort in diagnostic analyser
+      diagnostic_statuses_.push_back(diagnostics_->addStatus(
+          "DS" + joint_name, std::to_string(motor_id),
+          {"Error Byte", "Input Voltage", "Temperature", "Read Error Rate"},
+          std::bind(&ServoBusInterface::formatServoDiagnostics, this, std::placeholders::_1, std::placeholders::_2)));
+    }
+  }
+  if (diagnostics_ && !joint_ids_.empty()) {
+    std::string ids;
+    for (uint8_t id : joint_ids_) {
+      ids += (ids.empty() ? "" : ",") + std::to_string(id);
+    }
+    setup_diagnostic_status_ = diagnostics_->addStatus(
+        "BUSServo setup " + ids, ids, {"Step", "ROM and RAM registers", "Changed ROM and RAM registers"},
+        std::bind(&ServoBusInterface::formatSetupDiagnostics, this, std::placeholders::_1, std::placeholders::_2));
   }
 
-  // generate a diagnostic message
-  array_msg.status = array;
-  diagnostic_pub_->publish(array_msg);
+  // the offsets are already included in the conversion of the positions
+  std::vector<double> position_offsets(joint_ids_.size());
+  for (size_t i = 0; i < joint_ids_.size(); i++) {
+    position_offsets[i] = joint_mounting_offsets_[i] + joint_offsets_[i];
+  }
+  conversion_.init(*driver_, joint_ids_, position_offsets);
+  for (size_t i = 0; i < joint_ids_.size(); i++) {
+    if (conversion_.getMaxCurrent(i) < 0) {
+      RCLCPP_WARN(nh_->get_logger(), "Maximal current for the dynamixel model of %s is not defined",
+                  joint_names_[i].c_str());
+    }
+  }
 
   return success;
 }
 
-bool ServoBusInterface::writeROMRAM(bool first_time) {
+bool ServoBusInterface::loadROMRAM() {
   /**
-   * This method writes the ROM and RAM values specified in the config to all servos.
+   * This method loads the ROM and RAM values specified in the config for all servos.
+   * They are written by requestROMRAM().
    */
-  RCLCPP_DEBUG(nh_->get_logger(), "Writing ROM and RAM values");
+  RCLCPP_DEBUG(nh_->get_logger(), "Loading ROM and RAM values");
   // Iterate over all groups
   bool sucess = true;
   // Initilize datastructure to hold the parameters temporarily before we write them all at once
@@ -211,82 +270,128 @@ bool ServoBusInterface::writeROMRAM(bool first_time) {
     }
   }
 
-  // Allocate memory for the values in the driver
-  int *values = (int *)malloc(joint_names_.size() * sizeof(int));
   // Iterate over parameter names
+  rom_ram_registers_.clear();
+  int read_start = -1;
+  int read_end = -1;
   for (auto register_name : parameter_names) {
+    RomRamRegister rom_ram_register;
+    GoalRegister &reg = rom_ram_register.reg;
+    initGoalRegister(reg, register_name);
+    // the configured value is always written
+    reg.use_deadband = false;
     // Get the value for each joint
     for (size_t num = 0; num < joint_names_.size(); num++) {
       // Get the value from the cache
       int register_value = joint_register_value_map[num][register_name];
       RCLCPP_DEBUG(nh_->get_logger(), "Setting %s on servo %s to %d", register_name.c_str(), joint_names_[num].c_str(),
                    register_value);
-      // Set the value in the driver
-      values[num] = register_value;
+      reg.values[num] = register_value;
     }
-    if (first_time) {
-      driver_->addSyncWrite(register_name.c_str());
+    auto table_entry = ROM_RAM_REGISTER_TABLE.find(register_name);
+    if (table_entry != ROM_RAM_REGISTER_TABLE.end()) {
+      rom_ram_register.address = table_entry->second.first;
+      rom_ram_register.length = table_entry->second.second;
+      int end = rom_ram_register.address + rom_ram_register.length;
+      read_start = read_start < 0 ? rom_ram_register.address : std::min(read_start, int(rom_ram_register.address));
+      read_end = std::max(read_end, end);
+    } else {
+      rom_ram_register.address = 0;
+      rom_ram_register.length = 0;
+    }
+    driver_->addSyncWrite(register_name.c_str());
+    rom_ram_registers_.push_back(rom_ram_register);
+  }
+  // all values are read back with one sync read, the addresses are made relative to its start
+  rom_ram_read_address_ = read_start < 0 ? 0 : read_start;
+  rom_ram_read_length_ = read_start < 0 ? 0 : read_end - read_start;
+  for (RomRamRegister &rom_ram_register : rom_ram_registers_) {
+    if (rom_ram_register.length > 0) {
+      rom_ram_register.address -= rom_ram_read_address_;
     }
-    sucess = sucess && driver_->syncWrite(register_name.c_str(), values);
   }
-  // Free the memory
-  free(values);
   return sucess;
 }
 
+void ServoBusInterface::addDeviceReads(DeviceReadScheduler *scheduler) {
+  /**
+   * Without a bulk read, one sync read of all servos is faster than reading them one after another
+   */
+  if (!scheduler->isBulkReadEnabled() || present_read_length_ == 0) {
+    return;
+  }
+  device_reads_ = scheduler;
+  present_read_handles_.clear();
+  for (const std::tuple<int, std::string, float, float, std::string> &servo : servos_) {
+    present_read_handles_.push_back(
+        scheduler->addWindow(uint8_t(std::get<0>(servo)), present_read_address_, present_read_length_));
+  }
+}
+
+void ServoBusInterface::addScheduledTasks(CycleScheduler *scheduler, size_t port) {
+  if (read_volt_temp_) {
+    // sync read of voltage and temperature plus sync read of the error byte
+    scheduler->addTask(port, "read servo voltage, temperature and error", joint_count_ * (3 + 11 + 1 + 11) + 2 * 14,
+                       &vte_task_);
+  }
+  // only CPU time, the writes of the setup take the place of the goals
+  scheduler->addTask(port, "servo setup diagnostics", 10, &setup_diag_task_);
+}
+
+void ServoBusInterface::setDiagnostics(DiagnosticsPublisher *diagnostics) { diagnostics_ = diagnostics; }
+
+void ServoBusInterface::setRecorder(BlackBoxRecorder *recorder) { recorder_ = recorder; }
+
+void ServoBusInterface::setParameters(const ControlParameterCache *parameters) { parameters_ = parameters; }
+
+void ServoBusInterface::setCurrentValues(sensor_msgs::msg::JointState &joint_state, sensor_msgs::msg::JointState &pwm,
+                                         size_t first_joint) {
+  /**
+   * The read values are written directly into the messages of all joints, which have to be resized before
+   */
+  current_position_ = JointView<double>(joint_state.position, first_joint, joint_count_);
+  current_velocity_ = JointView<double>(joint_state.velocity, first_joint, joint_count_);
+  current_effort_ = JointView<double>(joint_state.effort, first_joint, joint_count_);
+  current_pwm_ = JointView<double>(pwm.effort, first_joint, joint_count_);
+}
+
+void ServoBusInterface::setGoals(ServoCommand &command, size_t first_joint) {
+  /**
+   * The goals are taken directly from the command of all joints, until the next command is set
+   */
+  goal_position_ = JointView<double>(command.position, first_joint, joint_count_);
+  goal_velocity_ = JointView<double>(command.velocity, first_joint, joint_count_);
+  goal_acceleration_ = JointView<double>(command.acceleration, first_joint, joint_count_);
+  goal_effort_ = JointView<double>(command.effort, first_joint, joint_count_);
+  goal_torque_individual_ = JointView<int32_t>(command.torque_individual, first_joint, joint_count_);
+}
+
 void ServoBusInterface::read(const rclcpp::Time &t, const rclcpp::Duration &dt) {
   /**
    * This is part of the main loop and handles reading of all connected devices
    */
-  bool read_successful = true;
-  // either read all values or a single one, depending on config
-  if (read_position_ && read_velocity_ && read_effort_) {
-    if (syncReadAll()) {
-      for (size_t num = 0; num < joint_names_.size(); num++) {
-        current_position_[num] += joint_mounting_offsets_[num] + joint_offsets_[num];
-      }
+  // all present values are read together in one sync read or in the bulk read of the port
+  // the sync read fails if a single servo does not answer
+  if (!present_registers_.empty()) {
+    bool success;
+    if (device_reads_) {
+      // the present values were already read together with the other devices on the port
+      success = takeScheduledPresent();
+    } else if (syncReadPresent()) {
+      // the servos that did not answer before are not part of the sync read
+      success = failed_servos_ == 0 || readPresentIndividually(true);
     } else {
-      RCLCPP_ERROR_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 1000, "Couldn't read all current joint values!");
-      read_successful = false;
+      // find the servos that do not answer, so they are left out of the next sync reads
+      success = readPresentIndividually(false);
     }
-  } else {
-    if (read_position_) {
-      if (syncReadPositions()) {
-        for (size_t num = 0; num < joint_names_.size(); num++) {
-          current_position_[num] += joint_mounting_offsets_[num] + joint_offsets_[num];
-        }
-      } else {
-        RCLCPP_ERROR_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 1000, "Couldn't read current joint position!");
-        driver_->reinitSyncReadHandler("Present_Position");
-        read_successful = false;
-      }
-    }
-    if (read_velocity_) {
-      if (!syncReadVelocities()) {
-        RCLCPP_ERROR_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 1000, "Couldn't read current joint velocity!");
-        driver_->reinitSyncReadHandler("Present_Velocity");
-        read_successful = false;
-      }
-    }
-    if (read_effort_) {
-      if (!syncReadEfforts()) {
-        RCLCPP_ERROR_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 1000, "Couldn't read current joint effort!");
-        driver_->reinitSyncReadHandler("Present_Current");
-        read_successful = false;
-      }
-    }
-  }
-
-  if (read_pwm_) {
-    if (!syncReadPWMs()) {
-      driver_->reinitSyncReadHandler("Present_PWM");
-      RCLCPP_ERROR_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 1000, "Couldn't read current PWM!");
-      read_successful = false;
+    decodePresent();
+    if (!success) {
+      RCLCPP_ERROR_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 1000, "Couldn't read current joint values!");
     }
   }
 
   if (read_volt_temp_) {
-    if (read_vt_counter_ + 1 == vt_update_rate_) {
+    if (vte_task_.isDue()) {
       bool success = true;
       if (!syncReadVoltageAndTemp()) {
         RCLCPP_ERROR_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 1000,
@@ -300,8 +405,8 @@ void ServoBusInterface::read(const rclcpp::Time &t, const rclcpp::Duration &dt)
       }
       processVte(success);
     }
-    read_vt_counter_ = (read_vt_counter_ + 1) % vt_update_rate_;
   }
+  read_counter_++;
 
   if (first_cycle_) {
     // when the servos have a goal position which is not the current position on startup
@@ -312,25 +417,64 @@ void ServoBusInterface::read(const rclcpp::Time &t, const rclcpp::Duration &dt)
     }
     first_cycle_ = false;
   }
+}
 
-  // remember
-  if (!read_successful) {
-    lost_servo_connection_ = true;
-    reading_errors_ += 1;
+void ServoBusInterface::updateLink(int joint, bool success) {
+  /**
+   * Counts the read of one servo and handles the start and end of a failure
+   */
+  ServoLink &link = links_[joint];
+  link.reads++;
+  if (success) {
+    if (link.failed) {
+      RCLCPP_DEBUG(nh_->get_logger(), "Servo %s answers again", joint_names_[joint].c_str());
+      link.failed = false;
+      link.failures = 0;
+      link.reinit = true;
+      failed_servos_--;
+    }
   } else {
-    reading_successes_ += 1;
+    link.errors++;
+    link.failures++;
+    if (!link.failed) {
+      RCLCPP_WARN_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 1000, "Servo %s does not answer",
+                           joint_names_[joint].c_str());
+      link.failed = true;
+      failed_servos_++;
+    }
+    // retry after 1, 2, 4, ... 64 cycles
+    link.retry_cycle = read_counter_ + (uint64_t(1) << std::min(link.failures - 1, 6));
   }
 
-  if (reading_errors_ + reading_successes_ > 200 &&
-      (float)reading_errors_ / (float)(reading_successes_ + reading_errors_) > 0.05f) {
-    speakError(speak_pub_, "Multiple servo reading errors!");
-    reading_errors_ = 0;
-    reading_successes_ = 0;
+  if (link.reads > 200 && float(link.errors) / float(link.reads) > 0.05f) {
+    speakError(speak_pub_, "Multiple reading errors on " + joint_names_[joint]);
+    link.error_rate = double(link.errors) / link.reads;
+    link.reads = 0;
+    link.errors = 0;
+  }
+  if (link.reads > 2000) {
+    link.error_rate = double(link.errors) / link.reads;
+    link.reads = 0;
+    link.errors = 0;
   }
+}
 
-  if (reading_errors_ + reading_successes_ > 2000) {
-    reading_errors_ = 0;
-    reading_successes_ = 0;
+void ServoBusInterface::reinitServos() {
+  /**
+   * Writes the torque and all goals again to the servos that answer again after a failure
+   */
+  for (int i = 0; i < joint_count_; i++) {
+    if (!links_[i].reinit) {
+      continue;
+    }
+    links_[i].reinit = false;
+    if (!torqueless_mode_) {
+      driver_->writeRegister(joint_ids_[i], "Torque_Enable", current_torque_ ? goal_torque_individual_[i] : 0);
+    }
+    for (GoalRegister *reg : {&goal_position_register_, &goal_velocity_register_, &profile_velocity_register_,
+                              &profile_acceleration_register_, &goal_current_register_, &goal_pwm_register_}) {
+      reg->stale[i] = true;
+    }
   }
 }
 
@@ -338,81 +482,57 @@ void ServoBusInterface::write(const rclcpp::Time &t, const rclcpp::Duration &dt)
   /**
    * This is part of the mainloop and handles all the writing to the connected devices
    */
+  // the goals are written when the servos are set up
+  bool setup_running = stepSetup();
+  if (diagnostics_ && setup_diag_task_.isDue()) {
+    pushSetupDiagnostics();
+  }
+  if (setup_running) {
+    return;
+  }
+  if (parameters_) {
+    write_deadband_ = parameters_->get().write_deadband;
+  }
+  if (recorder_) {
+    std::copy(goal_position_.begin(), goal_position_.end(), recorded_goals_.begin());
+    std::copy(goal_velocity_.begin(), goal_velocity_.end(), recorded_goals_.begin() + joint_count_);
+    std::copy(goal_acceleration_.begin(), goal_acceleration_.end(), recorded_goals_.begin() + 2 * joint_count_);
+    std::copy(goal_effort_.begin(), goal_effort_.end(), recorded_goals_.begin() + 3 * joint_count_);
+    recorder_->record(goal_source_, recorded_goals_.data(), recorded_goals_.size() * sizeof(double));
+  }
   // check if we have to switch the torque
   if (current_torque_ != goal_torque_) {
     writeTorque(goal_torque_);
   }
   if (switch_individual_torque_) {
-    writeTorqueForServos(goal_torque_individual_);
+    writeTorqueForServos(goal_torque_individual_.data());
     switch_individual_torque_ = false;
   }
 
-  // reset torques if we lost connection to them
-  if (lost_servo_connection_) {
-    RCLCPP_INFO_THROTTLE(nh_->get_logger(), *nh_->get_clock(), 5, "resetting torque after lost connection");
-    writeTorqueForServos(goal_torque_individual_);
-  }
+  // reset the torque and goals of servos which answer again, they may have lost power
+  reinitServos();
+  // only the servos whose goal changed are written
   if (control_mode_ == POSITION_CONTROL) {
-    if (goal_effort_ != last_goal_effort_ || lost_servo_connection_) {
-      syncWritePWM();
-      last_goal_effort_ = goal_effort_;
-    }
-
-    if (goal_velocity_ != last_goal_velocity_ || lost_servo_connection_) {
-      syncWriteProfileVelocity();
-      last_goal_velocity_ = goal_velocity_;
-    }
-
-    if (goal_acceleration_ != last_goal_acceleration_ || lost_servo_connection_) {
-      syncWriteProfileAcceleration();
-      last_goal_acceleration_ = goal_acceleration_;
-    }
-
-    if (goal_position_ != last_goal_position_ || lost_servo_connection_) {
-      syncWritePosition();
-      last_goal_position_ = goal_position_;
-    }
+    syncWritePWM();
+    syncWriteProfileVelocity();
+    syncWriteProfileAcceleration();
+    syncWritePosition();
   } else if (control_mode_ == VELOCITY_CONTROL) {
     syncWriteVelocity();
   } else if (control_mode_ == EFFORT_CONTROL) {
     syncWriteCurrent();
   } else if (control_mode_ == CURRENT_BASED_POSITION_CONTROL) {
-    // only write things if it is necessary
-    if (goal_effort_ != last_goal_effort_ || lost_servo_connection_) {
-      syncWriteCurrent();
-      last_goal_effort_ = goal_effort_;
-    }
-
-    if (goal_velocity_ != last_goal_velocity_ || lost_servo_connection_) {
-      syncWriteProfileVelocity();
-      last_goal_velocity_ = goal_velocity_;
-    }
-
-    if (goal_acceleration_ != last_goal_acceleration_ || lost_servo_connection_) {
-      syncWriteProfileAcceleration();
-      last_goal_acceleration_ = goal_acceleration_;
-    }
-
-    if (goal_position_ != last_goal_position_ || lost_servo_connection_) {
-      syncWritePosition();
-      last_goal_position_ = goal_position_;
-    }
+    syncWriteCurrent();
+    syncWriteProfileVelocity();
+    syncWriteProfileAcceleration();
+    syncWritePosition();
   }
-  lost_servo_connection_ = false;
 }
 
-void ServoBusInterface::switchDynamixelControlMode() {
+void ServoBusInterface::requestControlModeSwitch() {
   /**
-   * This method switches the control mode of all servos
+   * Lets write() switch the control mode of all servos during the next cycles
    */
-
-  // Torque on dynamixels has to be disabled to change operating mode
-  // save last torque state for later
-  bool torque_before_switch = current_torque_;
-  writeTorque(false);
-  // magic sleep to make sure that dynamixel have internally processed the request
-  nh_->get_clock()->sleep_for(rclcpp::Duration::from_nanoseconds(1e9 * 0.1));
-
   int32_t value = 3;
   if (control_mode_ == POSITION_CONTROL) {
     value = 3;
@@ -425,109 +545,228 @@ void ServoBusInterface::switchDynamixelControlMode() {
   } else {
     RCLCPP_WARN(nh_->get_logger(), "control_mode is wrong, will use position control");
   }
+  operating_mode_.assign(joint_names_.size(), value);
+  control_mode_switch_requested_ = true;
+}
 
-  std::vector<int32_t> operating_mode(joint_names_.size(), value);
-  int32_t *o = &operating_mode[0];
-  driver_->syncWrite("Operating_Mode", o);
+void ServoBusInterface::requestROMRAM() {
+  /**
+   * Lets write() write the ROM and RAM values from loadROMRAM() during the next cycles, one register per cycle
+   */
+  rom_ram_requested_ = true;
+}
 
-  nh_->get_clock()->sleep_for(rclcpp::Duration::from_nanoseconds(1e9 * 0.5));
-  // reenable torque if it was previously enabled
-  writeTorque(torque_before_switch);
+bool ServoBusInterface::stepSetup() {
+  /**
+   * Does the next step of the requested setup, if its waiting time is over.
+   * Returns false if no setup is running, then the goals can be written.
+   */
+  std::chrono::steady_clock::time_point now = std::chrono::steady_clock::now();
+  if (setup_step_ == SETUP_IDLE) {
+    if (control_mode_switch_requested_) {
+      control_mode_switch_requested_ = false;
+      setup_step_ = SETUP_TORQUE_OFF;
+    } else if (rom_ram_requested_) {
+      rom_ram_requested_ = false;
+      rom_ram_index_ = 0;
+      rom_ram_written_ = 0;
+      setup_step_ = SETUP_ROM_RAM_READ;
+    } else {
+      return false;
+    }
+    setup_success_ = true;
+    setup_wait_until_ = now;
+    pushSetupDiagnostics();
+  }
+  if (now < setup_wait_until_) {
+    return true;
+  }
+
+  switch (setup_step_) {
+    case SETUP_TORQUE_OFF: {
+      // Torque on dynamixels has to be disabled to change operating mode
+      // the goal is kept, so the torque is enabled again afterwards if it was enabled
+      bool goal_torque = goal_torque_;
+      writeTorque(false);
+      goal_torque_ = goal_torque;
+      // magic wait to make sure that dynamixel have internally processed the request
+      setup_wait_until_ = now + std::chrono::milliseconds(100);
+      setup_step_ = SETUP_OPERATING_MODE;
+      break;
+    }
+    case SETUP_OPERATING_MODE:
+      setup_success_ = driver_->syncWrite("Operating_Mode", operating_mode_.data()) && setup_success_;
+      setup_wait_until_ = now + std::chrono::milliseconds(500);
+      setup_step_ = SETUP_FINISH;
+      break;
+    case SETUP_ROM_RAM_READ:
+      // after switching on the power, most servos usually have the right values already
+      if (!syncReadROMRAM()) {
+        RCLCPP_WARN(nh_->get_logger(), "Couldn't read ROM and RAM values, writing all of them.");
+      }
+      setup_step_ = SETUP_ROM_RAM;
+      break;
+    case SETUP_ROM_RAM:
+      // registers without differences are skipped, at most one is written per cycle
+      while (rom_ram_index_ < rom_ram_registers_.size()) {
+        GoalRegister &reg = rom_ram_registers_[rom_ram_index_].reg;
+        setup_success_ = syncWriteChanged(reg) && setup_success_;
+        rom_ram_index_++;
+        if (!changed_joints_.empty()) {
+          rom_ram_written_++;
+          break;
+        }
+      }
+      if (rom_ram_index_ >= rom_ram_registers_.size()) {
+        if (!setup_success_) {
+          RCLCPP_WARN(nh_->get_logger(), "Couldn't write ROM and RAM values to all servos.");
+        }
+        setup_step_ = SETUP_FINISH;
+      }
+      break;
+    case SETUP_FINISH:
+      // the written registers may overlap with the goal registers, write them completely in the next cycle
+      invalidateGoalRegisters();
+      setup_step_ = SETUP_IDLE;
+      pushSetupDiagnostics();
+      // start the next requested setup right away
+      return stepSetup();
+    case SETUP_IDLE:
+      break;
+  }
+  return true;
 }
 
-diagnostic_msgs::msg::DiagnosticStatus ServoBusInterface::createServoDiagMsg(int id, char level, std::string message,
-                                                                             std::map<std::string, std::string> map,
-                                                                             std::string name) {
+void ServoBusInterface::pushSetupDiagnostics() {
   /**
-   * Create a single Diagnostic message for one servo. This is used to build the array message which is then published.
+   * Hands the progress of the setup to the diagnostics thread
    */
-  diagnostic_msgs::msg::DiagnosticStatus servo_status = diagnostic_msgs::msg::DiagnosticStatus();
-  servo_status.level = level;
-  // add prefix DS for dynamixel servo to sort in diagnostic analyser
-  servo_status.name = "DS" + name;
-  servo_status.message = message;
-  servo_status.hardware_id = std::to_string(id);
-  std::vector<diagnostic_msgs::msg::KeyValue> keyValues = std::vector<diagnostic_msgs::msg::KeyValue>();
-  // itarate through map and save it into values
-  for (auto const &ent1 : map) {
-    diagnostic_msgs::msg::KeyValue key_value = diagnostic_msgs::msg::KeyValue();
-    key_value.key = ent1.first;
-    key_value.value = ent1.second;
-    keyValues.push_back(key_value);
+  if (!diagnostics_) {
+    return;
   }
-  servo_status.values = keyValues;
-  return servo_status;
+  DiagnosticRecord record;
+  record.status = setup_diagnostic_status_;
+  record.success = setup_success_;
+  record.stamp = nh_->get_clock()->now().nanoseconds();
+  record.values[0] = setup_step_;
+  record.values[1] = rom_ram_index_;
+  record.values[2] = rom_ram_registers_.size();
+  record.values[3] = rom_ram_written_;
+  diagnostics_->push(record);
 }
 
-void ServoBusInterface::processVte(bool success) {
+void ServoBusInterface::formatSetupDiagnostics(const DiagnosticRecord &record,
+                                               diagnostic_msgs::msg::DiagnosticStatus &status) {
   /**
-   *  This processes the data for voltage, temperature and error of the servos. It is mainly used as diagnostic message.
+   * Fills the diagnostic message of the setup of the bus. Called by the diagnostics thread.
    */
+  static const char *STEP_NAMES[] = {"Idle",
+                                     "Disabling torque",
+                                     "Writing operating mode",
+                                     "Reading ROM and RAM",
+                                     "Writing ROM and RAM",
+                                     "Waiting for servos"};
+  SetupStep step = SetupStep(record.values[0]);
+  status.values[0].value = STEP_NAMES[step];
+  status.values[1].value = std::to_string(int(record.values[1])) + "/" + std::to_string(int(record.values[2]));
+  status.values[2].value = std::to_string(int(record.values[3]));
+  if (!record.success) {
+    status.level = diagnostic_msgs::msg::DiagnosticStatus::WARN;
+    status.message = "Writing failed";
+  } else {
+    status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
+    status.message = step == SETUP_IDLE ? "OK" : "Setting up servos";
+  }
+}
 
-  // prepare diagnostic msg
-  diagnostic_msgs::msg::DiagnosticArray array_msg = diagnostic_msgs::msg::DiagnosticArray();
-  std::vector<diagnostic_msgs::msg::DiagnosticStatus> array = std::vector<diagnostic_msgs::msg::DiagnosticStatus>();
-  array_msg.header.stamp = nh_->get_clock()->now();
+void ServoBusInterface::formatServoDiagnostics(const DiagnosticRecord &record,
+                                               diagnostic_msgs::msg::DiagnosticStatus &status) {
+  /**
+   * Fills the diagnostic message of one servo from the values read in processVte. Called by the diagnostics thread.
+   */
+  if (!record.success) {
+    // the read of VT or error failed, we will publish this and not the values
+    status.level = diagnostic_msgs::msg::DiagnosticStatus::STALE;
+    status.message = "No response";
+    for (diagnostic_msgs::msg::KeyValue &key_value : status.values) {
+      key_value.value.clear();
+    }
+    return;
+  }
+  uint8_t error = uint8_t(record.values[0]);
+  double input_voltage = record.values[1];
+  double temperature = record.values[2];
+  status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
+  status.message = "OK";
+  DiagnosticsPublisher::setValue(status, 0, int(error));
+  DiagnosticsPublisher::setValue(status, 1, input_voltage);
+  if (input_voltage < warn_volt_) {
+    status.message = "Power getting low";
+    status.level = diagnostic_msgs::msg::DiagnosticStatus::WARN;
+  }
+  DiagnosticsPublisher::setValue(status, 2, temperature);
+  DiagnosticsPublisher::setValue(status, 3, record.values[3]);
+  if (temperature > warn_temp_) {
+    status.message = "Getting hot";
+    status.level = diagnostic_msgs::msg::DiagnosticStatus::WARN;
+  }
+  if (error != 0) {
+    // some error is detected
+    status.level = diagnostic_msgs::msg::DiagnosticStatus::ERROR;
+    status.message = "Error(s): ";
+    // check which one. Values taken from dynamixel documentation
+    char voltage_error = 0x1;
+    char overheat_error = 0x4;
+    char encoder_error = 0x8;
+    char shock_error = 0x10;
+    char overload_error = 0x20;
+    if ((error & voltage_error) != 0) {
+      status.message += "Voltage ";
+    }
+    if ((error & overheat_error) != 0) {
+      status.message += "Overheat ";
+    }
+    if ((error & encoder_error) != 0) {
+      status.message += "Encoder ";
+    }
+    if ((error & shock_error) != 0) {
+      status.message += "Shock ";
+    }
+    if ((error & overload_error) != 0) {
+      status.message += "Overload";
+    }
+  }
+}
 
+void ServoBusInterface::processVte(bool success) {
+  /**
+   *  This processes the data for voltage, temperature and error of the servos. It is mainly used as diagnostic message.
+   *  Only the raw values are handed to the diagnostics thread, which builds the messages.
+   */
+  int64_t stamp = nh_->get_clock()->now().nanoseconds();
   for (size_t i = 0; i < joint_names_.size(); i++) {
-    char level = diagnostic_msgs::msg::DiagnosticStatus::OK;
-    std::string message = "OK";
-    std::map<std::string, std::string> map;
-    if (!success) {
-      // the read of VT or error failed, we will publish this and not the values
-      message = "No response";
-      level = diagnostic_msgs::msg::DiagnosticStatus::STALE;
-      array.push_back(createServoDiagMsg(joint_ids_[i], level, message, map, joint_names_[i]));
-      continue;
+    char overload_error = 0x20;
+    if (success && (current_error_[i] & overload_error) != 0) {
+      // turn off torque on all motors
+      // todo should also turn off power, but is not possible yet
+      goal_torque_ = false;
+      RCLCPP_ERROR(nh_->get_logger(), "OVERLOAD ERROR!!! OVERLOAD ERROR!!! OVERLOAD ERROR!!! In Motor %s",
+                   joint_names_[i].c_str());
+      speakError(speak_pub_, "Overload Error!");
     }
-    map.insert(std::make_pair("Input Voltage", std::to_string(current_input_voltage_[i])));
-    if (current_input_voltage_[i] < warn_volt_) {
-      message = "Power getting low";
-      level = diagnostic_msgs::msg::DiagnosticStatus::WARN;
-    }
-    map.insert(std::make_pair("Temperature", std::to_string(current_temperature_[i])));
-    if (current_temperature_[i] > warn_temp_) {
-      message = "Getting hot";
-      level = diagnostic_msgs::msg::DiagnosticStatus::WARN;
-    }
-    map.insert(std::make_pair("Error Byte", std::to_string(current_error_[i])));
-    if (current_error_[i] != 0) {
-      // some error is detected
-      level = diagnostic_msgs::msg::DiagnosticStatus::ERROR;
-      message = "Error(s): ";
-      // check which one. Values taken from dynamixel documentation
-      char voltage_error = 0x1;
-      char overheat_error = 0x4;
-      char encoder_error = 0x8;
-      char shock_error = 0x10;
-      char overload_error = 0x20;
-      if ((current_error_[i] & voltage_error) != 0) {
-        message = message + "Voltage ";
-      }
-      if ((current_error_[i] & overheat_error) != 0) {
-        message = message + "Overheat ";
-      }
-      if ((current_error_[i] & encoder_error) != 0) {
-        message = message + "Encoder ";
-      }
-      if ((current_error_[i] & shock_error) != 0) {
-        message = message + "Shock ";
-      }
-      if ((current_error_[i] & overload_error) != 0) {
-        message = message + "Overload";
-        // turn off torque on all motors
-        // todo should also turn off power, but is not possible yet
-        goal_torque_ = false;
-        RCLCPP_ERROR(nh_->get_logger(), "OVERLOAD ERROR!!! OVERLOAD ERROR!!! OVERLOAD ERROR!!! In Motor %s",
-                     joint_names_[i].c_str());
-        speakError(speak_pub_, "Overload Error!");
-      }
+    if (diagnostics_) {
+      DiagnosticRecord record;
+      record.status = diagnostic_statuses_[i];
+      record.success = success;
+      record.stamp = stamp;
+      record.values[0] = current_error_[i];
+      record.values[1] = current_input_voltage_[i];
+      record.values[2] = current_temperature_[i];
+      // of the reads since the last reset of the counters, there may only be a few directly after the reset
+      record.values[3] = links_[i].reads >= 100 ? double(links_[i].errors) / links_[i].reads : links_[i].error_rate;
+      diagnostics_->push(record);
     }
-
-    array.push_back(createServoDiagMsg(joint_ids_[i], level, message, map, joint_names_[i]));
   }
-  array_msg.status = array;
-  diagnostic_pub_->publish(array_msg);
 }
 
 void ServoBusInterface::writeTorque(bool enabled) {
@@ -544,180 +783,315 @@ void ServoBusInterface::writeTorque(bool enabled) {
   }
 }
 
-void ServoBusInterface::writeTorqueForServos(std::vector<int32_t> torque) {
+void ServoBusInterface::writeTorqueForServos(int32_t *torque) {
   /**
-   * This writes the torque off all servos individually depended on the give vector.
+   * This writes the torque off all servos individually depended on the given values of all joints.
    */
 
   // only set values if we're not in torqueless mode
   if (!torqueless_mode_) {
-    // this actually writes each value in the torque vector
-    // but the dynamixel_toolbox requires a reference to the first element
-    int32_t *t = &torque[0];
-    driver_->syncWrite("Torque_Enable", t);
+    driver_->syncWrite("Torque_Enable", torque);
   }
 }
 
-bool ServoBusInterface::syncReadPositions() {
+bool ServoBusInterface::syncReadError() {
   /**
-   * Reads all position information with a single sync read
+   * Reads all error bytes with a single sync read
    */
-  bool success = driver_->syncRead("Present_Position", data_sync_read_positions_);
+  bool success = driver_->syncRead("Hardware_Error_Status", data_sync_read_error_);
   if (success) {
     for (int i = 0; i < joint_count_; i++) {
-      // TODO test if this is required
-      if (data_sync_read_positions_[i] == 0) {
-        // a value of 0 is often a reading error, therefore we discard it
-        // this should not cause issues when a motor is actually close to 0
-        // since 1 bit only corresponds to + or - 0.1 deg
-        continue;
-      }
-      double current_pos = driver_->convertValue2Radian(joint_ids_[i], data_sync_read_positions_[i]);
-      if (current_pos < 3.15 && current_pos > -3.15) {
-        // only write values which are possible
-        current_position_[i] = current_pos;
-      }
+      current_error_[i] = data_sync_read_error_[i];
     }
   }
   return success;
 }
 
-bool ServoBusInterface::syncReadVelocities() {
+bool ServoBusInterface::syncReadVoltageAndTemp() {
   /**
-   * Reads all velocity information with a single sync read
+   * Reads all voltages and temperature information with a single sync read
    */
-  bool success = driver_->syncRead("Present_Velocity", data_sync_read_velocities_);
-  if (success) {
+  std::vector<uint8_t> data;
+  if (driver_->syncReadMultipleRegisters(144, 3, &data)) {
     for (int i = 0; i < joint_count_; i++) {
-      current_velocity_[i] = driver_->convertValue2Velocity(joint_ids_[i], data_sync_read_velocities_[i]);
+      uint16_t volt = dxlMakeword(data[i * 3], data[i * 3 + 1]);
+      uint8_t temp = data[i * 3 + 2];
+      // convert value to voltage
+      current_input_voltage_[i] = volt * 0.1;
+      // is already in °C
+      current_temperature_[i] = temp;
     }
+    return true;
+  } else {
+    return false;
   }
-  return success;
 }
 
-bool ServoBusInterface::syncReadEfforts() {
+void ServoBusInterface::planPresentRead() {
   /**
-   * Reads all effort information with a single sync read
+   * Computes the smallest contiguous register span which covers all present values that should be read
    */
-  bool success = driver_->syncRead("Present_Current", data_sync_read_efforts_);
-  if (success) {
-    for (int i = 0; i < joint_count_; i++) {
-      current_effort_[i] = driver_->convertValue2Torque(joint_ids_[i], data_sync_read_efforts_[i]);
+  bool enabled[] = {read_pwm_, read_effort_, read_velocity_, read_position_};
+  present_registers_.clear();
+  for (size_t i = 0; i < PRESENT_REGISTER_TABLE.size(); i++) {
+    if (enabled[i]) {
+      present_registers_.push_back(
+          {PresentValue(i), PRESENT_REGISTER_TABLE[i].first, PRESENT_REGISTER_TABLE[i].second});
     }
   }
-  return success;
+  if (present_registers_.empty()) {
+    present_read_address_ = 0;
+    present_read_length_ = 0;
+    return;
+  }
+  // the table is sorted, so the span goes from the first to the end of the last enabled register
+  present_read_address_ = present_registers_.front().address;
+  present_read_length_ = present_registers_.back().address + present_registers_.back().length - present_read_address_;
+  for (PresentRegister &reg : present_registers_) {
+    reg.address -= present_read_address_;
+  }
 }
 
-bool ServoBusInterface::syncReadPWMs() {
+bool ServoBusInterface::syncReadPresent() {
   /**
-   * Reads all PWM information with a single sync read
+   * Reads all enabled present values of the servos that answer with a single sync read.
+   * Returns false if one of them did not answer.
    */
-  bool success = driver_->syncRead("Present_PWM", data_sync_read_pwms_);
-  if (success) {
-    for (int i = 0; i < joint_count_; i++) {
-      // the data is in int16
-      // 100% is a value of 885
-      // convert to range -1 to 1
-      current_pwm_[i] = ((int16_t)data_sync_read_pwms_[i]) / 885.0;
+  sync_read_ids_.clear();
+  sync_read_joints_.clear();
+  for (int i = 0; i < joint_count_; i++) {
+    if (!links_[i].failed) {
+      sync_read_ids_.push_back(joint_ids_[i]);
+      sync_read_joints_.push_back(i);
     }
   }
+  if (sync_read_ids_.empty()) {
+    return true;
+  }
+  bool success;
+  if (failed_servos_ == 0) {
+    success = driver_->syncReadMultipleRegisters(present_read_address_, present_read_length_, &sync_read_present_data_);
+  } else {
+    success = driver_->syncReadMultipleRegisters(sync_read_ids_.data(), uint8_t(sync_read_ids_.size()),
+                                                 present_read_address_, present_read_length_, &sync_read_present_data_);
+  }
+  if (!success || sync_read_present_data_.size() < sync_read_ids_.size() * present_read_length_) {
+    return false;
+  }
+  for (size_t k = 0; k < sync_read_joints_.size(); k++) {
+    int joint = sync_read_joints_[k];
+    std::copy_n(sync_read_present_data_.begin() + k * present_read_length_, present_read_length_,
+                present_data_.begin() + joint * present_read_length_);
+    updateLink(joint, true);
+  }
+  return true;
+}
+
+bool ServoBusInterface::readPresentIndividually(bool only_failed) {
+  /**
+   * Reads the present values of each servo on its own, the servos that did not answer before only when their retry is
+   * due. With only_failed, only those are read, the others were already sync read.
+   * Returns false if a servo did not answer.
+   */
+  bool success = true;
+  for (int i = 0; i < joint_count_; i++) {
+    if (links_[i].failed) {
+      if (read_counter_ < links_[i].retry_cycle) {
+        success = false;
+        continue;
+      }
+    } else if (only_failed) {
+      continue;
+    }
+    bool answered = driver_->readMultipleRegisters(joint_ids_[i], present_read_address_, present_read_length_,
+                                                   single_read_present_data_.data());
+    // the servos that do not answer keep their last values
+    if (answered) {
+      std::copy(single_read_present_data_.begin(), single_read_present_data_.end(),
+                present_data_.begin() + i * present_read_length_);
+    }
+    updateLink(i, answered);
+    success &= answered;
+  }
   return success;
 }
 
-bool ServoBusInterface::syncReadError() {
+bool ServoBusInterface::takeScheduledPresent() {
   /**
-   * Reads all error bytes with a single sync read
+   * Copies the present values of each servo from the bulk read of the port.
+   * The servos that do not answer keep their last values, the scheduler decides when they are retried.
+   * Returns false if a servo did not answer.
    */
-  bool success = driver_->syncRead("Hardware_Error_Status", data_sync_read_error_);
-  if (success) {
-    for (int i = 0; i < joint_count_; i++) {
-      current_error_[i] = data_sync_read_error_[i];
+  bool success = true;
+  for (int i = 0; i < joint_count_; i++) {
+    if (!device_reads_->wasRead(present_read_handles_[i])) {
+      success = false;
+      continue;
     }
+    bool answered = device_reads_->getData(present_read_handles_[i], present_data_.data() + i * present_read_length_);
+    updateLink(i, answered);
+    success &= answered;
   }
   return success;
 }
 
-bool ServoBusInterface::syncReadVoltageAndTemp() {
+void ServoBusInterface::decodePresent() {
   /**
-   * Reads all voltages and temperature information with a single sync read
+   * Converts the read present values of all servos
    */
-  std::vector<uint8_t> data;
-  if (driver_->syncReadMultipleRegisters(144, 3, &data)) {
-    for (int i = 0; i < joint_count_; i++) {
-      uint16_t volt = dxlMakeword(data[i * 3], data[i * 3 + 1]);
-      uint8_t temp = data[i * 3 + 2];
-      // convert value to voltage
-      current_input_voltage_[i] = volt * 0.1;
-      // is already in °C
-      current_temperature_[i] = temp;
+  if (recorder_) {
+    recorder_->record(present_source_, present_data_.data(), joint_count_ * present_read_length_);
+  }
+  for (const PresentRegister &reg : present_registers_) {
+    std::vector<int32_t> &values = present_values_[reg.value];
+    decodeRegister(present_data_.data(), present_read_length_, reg.address, reg.length, joint_count_, values.data());
+    switch (reg.value) {
+      case PRESENT_PWM:
+        for (int i = 0; i < joint_count_; i++) {
+          // 100% is a value of 885, convert to range -1 to 1
+          current_pwm_[i] = values[i] / 885.0;
+        }
+        break;
+      case PRESENT_CURRENT:
+        conversion_.valueToTorque(values.data(), current_effort_.data());
+        break;
+      case PRESENT_VELOCITY:
+        conversion_.valueToVelocity(values.data(), current_velocity_.data());
+        break;
+      case PRESENT_POSITION:
+        conversion_.valueToPosition(values.data(), current_position_.data());
+        break;
     }
-    return true;
-  } else {
-    return false;
   }
 }
 
-bool ServoBusInterface::syncReadAll() {
+void ServoBusInterface::initGoalRegister(GoalRegister &reg, const std::string &name) {
+  reg.name = name;
+  // all servos of a bus have the same control table
+  const ControlItem *item = joint_ids_.empty() ? nullptr : driver_->getItemInfo(joint_ids_[0], name.c_str());
+  reg.data_length = item ? item->data_length : 4;
+  reg.values.assign(joint_count_, 0);
+  reg.written.assign(joint_count_, 0);
+  reg.valid = false;
+  reg.use_deadband = true;
+  reg.stale.assign(joint_count_, false);
+}
+
+void ServoBusInterface::invalidateGoalRegisters() {
+  for (GoalRegister *reg : {&goal_position_register_, &goal_velocity_register_, &profile_velocity_register_,
+                            &profile_acceleration_register_, &goal_current_register_, &goal_pwm_register_}) {
+    reg->valid = false;
+  }
+}
+
+bool ServoBusInterface::syncReadROMRAM() {
   /**
-   * Reads all positions, velocities and efforts with a single sync read
+   * Reads the current ROM and RAM values of all servos with a single sync read.
+   * The read values are taken as the written values, so that only the differing ones are written.
    */
-  if (driver_->syncReadMultipleRegisters(126, 10, &sync_read_all_data_)) {
+  for (RomRamRegister &rom_ram_register : rom_ram_registers_) {
+    rom_ram_register.reg.valid = false;
+  }
+  if (rom_ram_read_length_ == 0) {
+    return true;
+  }
+  if (!driver_->syncReadMultipleRegisters(rom_ram_read_address_, rom_ram_read_length_, &rom_ram_read_data_)) {
+    return false;
+  }
+  if (rom_ram_read_data_.size() < size_t(joint_count_ * rom_ram_read_length_)) {
+    return false;
+  }
+  for (RomRamRegister &rom_ram_register : rom_ram_registers_) {
+    if (rom_ram_register.length == 0) {
+      continue;
+    }
+    GoalRegister &reg = rom_ram_register.reg;
     for (int i = 0; i < joint_count_; i++) {
-      int16_t eff = dxlMakeword(sync_read_all_data_[i * 10], sync_read_all_data_[i * 10 + 1]);
-      uint32_t vel = dxlMakedword(dxlMakeword(sync_read_all_data_[i * 10 + 2], sync_read_all_data_[i * 10 + 3]),
-                                  dxlMakeword(sync_read_all_data_[i * 10 + 4], sync_read_all_data_[i * 10 + 5]));
-      uint32_t pos = dxlMakedword(dxlMakeword(sync_read_all_data_[i * 10 + 6], sync_read_all_data_[i * 10 + 7]),
-                                  dxlMakeword(sync_read_all_data_[i * 10 + 8], sync_read_all_data_[i * 10 + 9]));
-      current_effort_[i] = driver_->convertValue2Torque(joint_ids_[i], eff);
-      current_velocity_[i] = driver_->convertValue2Velocity(joint_ids_[i], vel);
-      double current_pos = driver_->convertValue2Radian(joint_ids_[i], pos);
-      if (current_pos < 3.15 && current_pos > -3.15) {
-        // only write values which are possible
-        current_position_[i] = current_pos;
+      const uint8_t *value = &rom_ram_read_data_[i * rom_ram_read_length_ + rom_ram_register.address];
+      if (rom_ram_register.length == 1) {
+        reg.written[i] = value[0];
+      } else if (rom_ram_register.length == 2) {
+        reg.written[i] = dxlMakeword(value[0], value[1]);
+      } else {
+        reg.written[i] = int32_t(dxlMakedword(dxlMakeword(value[0], value[1]), dxlMakeword(value[2], value[3])));
       }
     }
+    reg.valid = true;
+  }
+  return true;
+}
+
+bool ServoBusInterface::syncWriteChanged(GoalRegister &reg) {
+  /**
+   * Writes the values of all servos whose goal changed since the last write.
+   * For a register of n bytes, a sync write transfers 4 bytes plus 1 + n bytes for each servo of the bus, a bulk write
+   * 5 + n bytes for each changed servo. The shorter one is used.
+   * Returns false if the write failed.
+   */
+  bool write_all = !reg.valid;
+  int deadband = reg.use_deadband ? write_deadband_ : 0;
+  changed_joints_.clear();
+  for (int num = 0; num < joint_count_; num++) {
+    if (write_all || reg.stale[num] || std::abs(reg.values[num] - reg.written[num]) > deadband) {
+      changed_joints_.push_back(num);
+    }
+  }
+  if (changed_joints_.empty()) {
     return true;
+  }
+  bool success;
+  if (!write_all && changed_joints_.size() * (5 + reg.data_length) < size_t(joint_count_) * (1 + reg.data_length) + 4) {
+    driver_->initBulkWrite();
+    for (uint8_t num : changed_joints_) {
+      driver_->addBulkWriteParam(joint_ids_[num], reg.name.c_str(), reg.values[num]);
+    }
+    success = driver_->bulkWrite();
   } else {
-    return false;
+    // all values are sent, so the written values of the unchanged servos are updated as well
+    changed_joints_.resize(joint_count_);
+    std::iota(changed_joints_.begin(), changed_joints_.end(), 0);
+    success = driver_->syncWrite(reg.name.c_str(), reg.values.data());
   }
+  if (success) {
+    for (uint8_t num : changed_joints_) {
+      reg.written[num] = reg.values[num];
+      reg.stale[num] = false;
+    }
+    reg.valid = true;
+  } else {
+    reg.valid = false;
+  }
+  return success;
 }
 
 void ServoBusInterface::syncWritePosition() {
   /**
    * Writes all goal positions with a single sync write
    */
-  for (size_t num = 0; num < joint_names_.size(); num++) {
-    float radian = goal_position_[num] - joint_mounting_offsets_[num] - joint_offsets_[num];
-    sync_write_goal_position_[num] = driver_->convertRadian2Value(joint_ids_[num], radian);
-  }
-  driver_->syncWrite("Goal_Position", sync_write_goal_position_);
+  conversion_.positionToValue(goal_position_.data(), goal_position_register_.values.data());
+  syncWriteChanged(goal_position_register_);
 }
 
 void ServoBusInterface::syncWriteVelocity() {
   /**
    * Writes all goal velocities with a single sync write
    */
-  for (size_t num = 0; num < joint_names_.size(); num++) {
-    sync_write_goal_velocity_[num] = driver_->convertVelocity2Value(joint_ids_[num], goal_velocity_[num]);
-  }
-  driver_->syncWrite("Goal_Velocity", sync_write_goal_velocity_);
+  conversion_.velocityToValue(goal_velocity_.data(), goal_velocity_register_.values.data());
+  syncWriteChanged(goal_velocity_register_);
 }
 
 void ServoBusInterface::syncWriteProfileVelocity() {
   /**
    * Writes all profile velocities with a single sync write
    */
-  for (size_t num = 0; num < joint_names_.size(); num++) {
-    if (goal_velocity_[num] < 0) {
-      // we want to set to maximum, which is 0
-      sync_write_profile_velocity_[num] = 0;
-    } else {
-      // use max to prevent accidentially setting 0
-      sync_write_profile_velocity_[num] =
-          std::max(driver_->convertVelocity2Value(joint_ids_[num], goal_velocity_[num]), 1);
-    }
+  std::vector<int32_t> &values = profile_velocity_register_.values;
+  conversion_.velocityToValue(goal_velocity_.data(), values.data());
+  for (int num = 0; num < joint_count_; num++) {
+    // a negative velocity sets the maximum, which is 0
+    // otherwise use max to prevent accidentially setting 0
+    values[num] = goal_velocity_[num] < 0 ? 0 : std::max(values[num], 1);
   }
-  driver_->syncWrite("Profile_Velocity", sync_write_profile_velocity_);
+  syncWriteChanged(profile_velocity_register_);
 }
 
 void ServoBusInterface::syncWriteProfileAcceleration() {
@@ -727,47 +1101,41 @@ void ServoBusInterface::syncWriteProfileAcceleration() {
   for (size_t num = 0; num < joint_names_.size(); num++) {
     if (goal_acceleration_[num] < 0) {
       // we want to set to maximum, which is 0
-      sync_write_profile_acceleration_[num] = 0;
+      profile_acceleration_register_.values[num] = 0;
     } else {
       // 572.9577952 for change of units, 214.577 rev/min^2 per LSB
-      sync_write_profile_acceleration_[num] =
+      profile_acceleration_register_.values[num] =
           std::max(static_cast<int>(goal_acceleration_[num] * 572.9577952 / 214.577), 1);
     }
   }
-  driver_->syncWrite("Profile_Acceleration", sync_write_profile_acceleration_);
+  syncWriteChanged(profile_acceleration_register_);
 }
 
 void ServoBusInterface::syncWriteCurrent() {
   /**
    * Writes all goal currents with a single sync write
    */
-  for (size_t num = 0; num < joint_names_.size(); num++) {
-    if (goal_effort_[num] < 0) {
-      // we want to set to maximum, which is different for MX-64 and MX-106
-      if (driver_->getModelNum(joint_ids_[num]) == 311) {
-        sync_write_goal_current_[num] = 1941;
-      } else if (driver_->getModelNum(joint_ids_[num]) == 321) {
-        sync_write_goal_current_[num] = 2047;
-      } else {
-        RCLCPP_WARN(nh_->get_logger(), "Maximal current for this dynamixel model is not defined");
-      }
-    } else {
-      sync_write_goal_current_[num] = driver_->convertTorque2Value(joint_ids_[num], goal_effort_[num]);
+  std::vector<int32_t> &values = goal_current_register_.values;
+  conversion_.torqueToValue(goal_effort_.data(), values.data());
+  for (int num = 0; num < joint_count_; num++) {
+    // a negative effort sets the maximum, if it is known for the model
+    if (goal_effort_[num] < 0 && conversion_.getMaxCurrent(num) >= 0) {
+      values[num] = conversion_.getMaxCurrent(num);
     }
   }
-  driver_->syncWrite("Goal_Current", sync_write_goal_current_);
+  syncWriteChanged(goal_current_register_);
 }
 
 void ServoBusInterface::syncWritePWM() {
   for (size_t num = 0; num < joint_names_.size(); num++) {
     if (goal_effort_[num] < 0) {
       // we want to set to maximum
-      sync_write_goal_pwm_[num] = 855;
+      goal_pwm_register_.values[num] = 855;
     } else {
-      sync_write_goal_pwm_[num] = goal_effort_[num] / 100.0 * 855.0;
+      goal_pwm_register_.values[num] = goal_effort_[num] / 100.0 * 855.0;
     }
   }
-  driver_->syncWrite("Goal_PWM", sync_write_goal_pwm_);
+  syncWriteChanged(goal_pwm_register_);
 }
 
 }  // namespace bitbots_ros_control
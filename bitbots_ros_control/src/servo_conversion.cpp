@@ -0,0 +1,115 @@
+#include <algorithm>
+#include <bitbots_ros_control/servo_conversion.hpp>
+
+namespace bitbots_ros_control {
+
+// distance from the zero value at which the resolution is measured, large enough to not lose precision
+const int32_t PROBE_VALUE = 1000;
+
+static double inverse(double value) { return value == 0 ? 0 : 1 / value; }
+
+void ServoConversion::init(DynamixelDriver &driver, const std::vector<uint8_t> &ids,
+                           const std::vector<double> &position_offsets) {
+  /**
+   * The conversions of the driver are linear (for positions on each side of the zero value), so the factors can be
+   * measured by converting one value.
+   */
+  joint_count_ = ids.size();
+  position_offset_ = position_offsets;
+  zero_value_.resize(joint_count_);
+  radian_per_value_positive_.resize(joint_count_);
+  radian_per_value_negative_.resize(joint_count_);
+  value_per_radian_positive_.resize(joint_count_);
+  value_per_radian_negative_.resize(joint_count_);
+  velocity_per_value_.resize(joint_count_);
+  value_per_velocity_.resize(joint_count_);
+  torque_per_value_.resize(joint_count_);
+  value_per_torque_.resize(joint_count_);
+  max_current_.resize(joint_count_);
+  for (size_t i = 0; i < joint_count_; i++) {
+    uint8_t id = ids[i];
+    zero_value_[i] = driver.convertRadian2Value(id, 0);
+    radian_per_value_positive_[i] = driver.convertValue2Radian(id, zero_value_[i] + PROBE_VALUE) / PROBE_VALUE;
+    radian_per_value_negative_[i] = driver.convertValue2Radian(id, zero_value_[i] - PROBE_VALUE) / -PROBE_VALUE;
+    value_per_radian_positive_[i] = inverse(radian_per_value_positive_[i]);
+    value_per_radian_negative_[i] = inverse(radian_per_value_negative_[i]);
+    velocity_per_value_[i] = driver.convertValue2Velocity(id, PROBE_VALUE) / PROBE_VALUE;
+    value_per_velocity_[i] = inverse(velocity_per_value_[i]);
+    torque_per_value_[i] = driver.convertValue2Torque(id, PROBE_VALUE) / PROBE_VALUE;
+    value_per_torque_[i] = inverse(torque_per_value_[i]);
+    // the maximal current is different for MX-64 and MX-106
+    switch (driver.getModelNum(id)) {
+      case 311:
+        max_current_[i] = 1941;
+        break;
+      case 321:
+        max_current_[i] = 2047;
+        break;
+      default:
+        max_current_[i] = -1;
+    }
+  }
+}
+
+void ServoConversion::valueToPosition(const int32_t *values, double *positions) const {
+  for (size_t i = 0; i < joint_count_; i++) {
+    int32_t value = values[i];
+    double scale = value > zero_value_[i] ? radian_per_value_positive_[i] : radian_per_value_negative_[i];
+    double radian = (value - zero_value_[i]) * scale;
+    // a value of 0 is often a reading error, therefore we discard it
+    // this should not cause issues when a motor is actually close to 0
+    // since 1 bit only corresponds to + or - 0.1 deg
+    // also only write values which are possible
+    bool valid = value != 0 && radian < 3.15 && radian > -3.15;
+    positions[i] = valid ? radian + position_offset_[i] : positions[i];
+  }
+}
+
+void ServoConversion::positionToValue(const double *positions, int32_t *values) const {
+  for (size_t i = 0; i < joint_count_; i++) {
+    double radian = positions[i] - position_offset_[i];
+    double scale = radian > 0 ? value_per_radian_positive_[i] : value_per_radian_negative_[i];
+    // truncated like in the driver
+    values[i] = int32_t(radian * scale + zero_value_[i]);
+  }
+}
+
+void ServoConversion::valueToVelocity(const int32_t *values, double *velocities) const {
+  for (size_t i = 0; i < joint_count_; i++) {
+    velocities[i] = values[i] * velocity_per_value_[i];
+  }
+}
+
+void ServoConversion::velocityToValue(const double *velocities, int32_t *values) const {
+  for (size_t i = 0; i < joint_count_; i++) {
+    values[i] = int32_t(velocities[i] * value_per_velocity_[i]);
+  }
+}
+
+void ServoConversion::valueToTorque(const int32_t *values, double *torques) const {
+  for (size_t i = 0; i < joint_count_; i++) {
+    torques[i] = values[i] * torque_per_value_[i];
+  }
+}
+
+void ServoConversion::torqueToValue(const double *torques, int32_t *values) const {
+  for (size_t i = 0; i < joint_count_; i++) {
+    // the current register has 16 bits
+    values[i] = int32_t(std::clamp(torques[i] * value_per_torque_[i], -32768.0, 32767.0));
+  }
+}
+
+void decodeRegister(const uint8_t *data, size_t stride, uint16_t address, uint16_t length, size_t joint_count,
+                    int32_t *values) {
+  // the values are little endian
+  for (size_t i = 0; i < joint_count; i++) {
+    const uint8_t *value = data + i * stride + address;
+    if (length == 2) {
+      values[i] = int16_t(uint16_t(value[0] | value[1] << 8));
+    } else {
+      values[i] =
+          int32_t(uint32_t(value[0]) | uint32_t(value[1]) << 8 | uint32_t(value[2]) << 16 | uint32_t(value[3]) << 24);
+    }
+  }
+}
+}  // namespace bitbots_ros_control
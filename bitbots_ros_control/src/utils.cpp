@@ -1,4 +1,5 @@
 #include <bitbots_ros_control/utils.hpp>
+#include <cstdlib>
 
 namespace bitbots_ros_control {
 
@@ -34,6 +35,16 @@ void speakError(const rclcpp::Publisher<bitbots_msgs::msg::Audio>::SharedPtr spe
   speak_pub->publish(msg);
 }
 
+std::string defaultRosHomePath(const std::string& filename) {
+  /**
+   * Path of a file in the ROS home directory, which is $ROS_HOME or ~/.ros
+   */
+  const char* ros_home = std::getenv("ROS_HOME");
+  const char* home = std::getenv("HOME");
+  std::string directory = ros_home ? std::string(ros_home) : std::string(home ? home : "/tmp") + "/.ros";
+  return directory + "/" + filename;
+}
+
 uint16_t dxlMakeword(uint64_t a, uint64_t b) { return uint16_t(uint8_t(a & 0xff) | uint16_t(uint8_t(b & 0xff)) << 8); }
 
 uint32_t dxlMakedword(uint64_t a, uint64_t b) {
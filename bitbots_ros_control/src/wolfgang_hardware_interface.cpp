@@ -1,23 +1,69 @@
+#include <yaml-cpp/yaml.h>
+
 #include <bitbots_ros_control/wolfgang_hardware_interface.hpp>
+#include <fstream>
 
 namespace bitbots_ros_control {
+using std::placeholders::_1;
+using std::placeholders::_2;
 
 /**
  * This class provides a combination of multiple hardware interfaces to construct a complete Wolfgang robot.
  * It is similar to a CombinedRobotHw class as specified in ros_control, but it is changed a bit to make sharing of
  * a common bus driver over multiple hardware interfaces possible.
  */
-WolfgangHardwareInterface::WolfgangHardwareInterface(rclcpp::Node::SharedPtr nh) : servo_interface_(nh) {
+WolfgangHardwareInterface::WolfgangHardwareInterface(rclcpp::Node::SharedPtr nh)
+    : servo_interface_(nh), cycle_period_(0, 0) {
   nh_ = nh;
   first_ping_error_ = true;
   core_present_ = false;
   last_power_status_ = false;
   current_power_status_ = false;
+  reads_in_flight_ = false;
+  timing_ = nullptr;
   speak_pub_ = nh->create_publisher<bitbots_msgs::msg::Audio>("/speak", 1);
+  // the plan only changes on startup, late subscribers should get it as well
+  // intra process communication does not support transient local publishers
+  rclcpp::PublisherOptions schedule_options;
+  schedule_options.use_intra_process_comm = rclcpp::IntraProcessSetting::Disable;
+  schedule_pub_ = nh->create_publisher<diagnostic_msgs::msg::DiagnosticArray>(
+      "/ros_control/read_schedule", rclcpp::QoS(1).transient_local(), schedule_options);
+  diagnostics_ = std::make_shared<DiagnosticsPublisher>(nh);
+  parameters_ = std::make_shared<ControlParameterCache>(nh);
 
   // load parameters
   nh_->get_parameter("only_imu", only_imu_);
   nh_->get_parameter("only_pressure", only_pressure_);
+  nh_->get_parameter_or("pipelined", pipelined_, false);
+  nh_->get_parameter_or("device_cache.enabled", use_device_cache_, true);
+  nh_->get_parameter_or("device_cache.file", device_cache_file_, std::string(""));
+  if (device_cache_file_.empty()) {
+    device_cache_file_ = defaultRosHomePath("bitbots_ros_control_devices.yaml");
+  }
+  if (use_device_cache_) {
+    loadDeviceCache();
+  }
+  bool black_box_enabled;
+  nh_->get_parameter_or("black_box.enabled", black_box_enabled, false);
+  cycle_source_ = -1;
+  cycle_read_ns_ = 0;
+  if (black_box_enabled) {
+    std::string black_box_file;
+    int black_box_size_mb;
+    nh_->get_parameter_or("black_box.file", black_box_file, std::string(""));
+    nh_->get_parameter_or("black_box.size_mb", black_box_size_mb, 64);
+    if (black_box_file.empty()) {
+      black_box_file = defaultRosHomePath("bitbots_ros_control_black_box.bin");
+    }
+    recorder_ = std::make_shared<BlackBoxRecorder>();
+    if (recorder_->open(black_box_file, size_t(black_box_size_mb) * 1024 * 1024)) {
+      RCLCPP_INFO(nh_->get_logger(), "Recording the bus data to %s", black_box_file.c_str());
+      cycle_source_ = recorder_->addSource("cycle");
+    } else {
+      RCLCPP_WARN(nh_->get_logger(), "Could not open black box file %s", black_box_file.c_str());
+      recorder_.reset();
+    }
+  }
   if (only_imu_) RCLCPP_WARN(nh_->get_logger(), "Starting in only IMU mode");
   if (only_pressure_) RCLCPP_WARN(nh_->get_logger(), "starting in only pressure sensor mode");
 
@@ -47,9 +93,6 @@ WolfgangHardwareInterface::WolfgangHardwareInterface(rclcpp::Node::SharedPtr nh)
       dxl_devices.begin(), dxl_devices.end(),
       [](const std::pair<std::string, int> &a, const std::pair<std::string, int> &b) { return a.second < b.second; });
 
-  // create overall servo interface since we need a single interface for the controllers
-  servo_interface_ = DynamixelServoHardwareInterface(nh);
-
   // try to ping all devices on the list, add them to the driver and create corresponding hardware interfaces
   // try until interruption to enable the user to turn on the power
   while (rclcpp::ok()) {
@@ -62,8 +105,13 @@ WolfgangHardwareInterface::WolfgangHardwareInterface(rclcpp::Node::SharedPtr nh)
 
 bool WolfgangHardwareInterface::create_interfaces(std::vector<std::pair<std::string, int>> dxl_devices) {
   interfaces_ = std::vector<std::vector<bitbots_ros_control::HardwareInterface *>>();
+  device_reads_ = std::vector<std::shared_ptr<DeviceReadScheduler>>();
+  port_names_ = std::vector<std::string>();
   // init bus drivers
-  std::vector<std::string> pinged;
+  std::vector<std::shared_ptr<DynamixelDriver>> drivers;
+  std::vector<std::string> device_files;
+  std::vector<int> baudrates;
+  std::vector<int> protocol_versions;
   rcl_interfaces::msg::ListParametersResult port_list = nh_->list_parameters({"port_info"}, 3);
   for (const std::string &parameter_name : port_list.names) {
     // we get directly the parameters and not the groups. use id parameter to identify them
@@ -84,113 +132,156 @@ bool WolfgangHardwareInterface::create_interfaces(std::vector<std::pair<std::str
       // uncomment the following line if you are using such an interface
       // sleep(1);
       driver->setPacketHandler(protocol_version);
-      std::vector<bitbots_ros_control::HardwareInterface *> interfaces_on_port;
-      // iterate over all devices and ping them to see what is connected to this bus
-      std::vector<std::tuple<int, std::string, float, float, std::string>> servos_on_port;
-      for (std::pair<std::string, int> &device : dxl_devices) {
-        // RCLCPP_INFO_STREAM(nh_->get_logger(), device.first);
-        std::string name = device.first;
-        int id = device.second;
-        if (std::find(pinged.begin(), pinged.end(), device.first) != pinged.end()) {
-          // we already found this and don't have to search again
-        } else {
-          int model_number_specified;
-          nh_->get_parameter("device_info." + name + ".model_number", model_number_specified);
-          // some devices provide more than one type of interface, e.g. the IMU provides additionally buttons and LEDs
-          std::string interface_type;
-          nh_->get_parameter("device_info." + name + ".interface_type", interface_type);
-          uint16_t model_number_specified_16 = uint16_t(model_number_specified);
-          uint16_t *model_number_returned_16 = new uint16_t;
-          if (driver->ping(uint8_t(id), model_number_returned_16)) {
-            // check if the specified model number matches the actual model number of the device
-            if (model_number_specified_16 != *model_number_returned_16) {
-              RCLCPP_WARN(nh_->get_logger(), "Model number of id %d does not match", id);
-            }
-            // ping was successful, add device correspondingly
-            // only add them if the mode is set correspondingly
-            // TODO maybe move more of the parameter stuff in the init of the modules instead of doing everything here
-            if (model_number_specified == 0xABBA && interface_type == "CORE") {
-              // CORE
-              int read_rate;
-              nh_->get_parameter("device_info." + name + ".read_rate", read_rate);
-              driver->setTools(model_number_specified_16, id);
-              core_interface_ = new CoreHardwareInterface(nh_, driver, id, read_rate);
-              // turn on power, just to be sure
-              core_interface_->write(nh_->get_clock()->now(), rclcpp::Duration::from_nanoseconds(1e9 * 0));
-              interfaces_on_port.push_back(core_interface_);
-              core_present_ = true;
-            } else if (model_number_specified == 0 && !only_imu_) {  // model number is currently 0 on foot sensors
-              // bitfoot
-              std::string topic;
-              if (!nh_->get_parameter("device_info." + name + ".topic", topic)) {
-                RCLCPP_WARN(nh_->get_logger(), "Bitfoot topic not specified");
-              }
-              BitFootHardwareInterface *interface = new BitFootHardwareInterface(nh_, driver, id, topic, name);
-              interfaces_on_port.push_back(interface);
-            } else if (model_number_specified == 0xBAFF && interface_type == "IMU" && !only_pressure_) {
-              // IMU
-              std::string topic;
-              if (!nh_->get_parameter("device_info." + name + ".topic", topic)) {
-                RCLCPP_WARN(nh_->get_logger(), "IMU topic not specified");
-              }
-              std::string frame;
-              if (!nh_->get_parameter("device_info." + name + ".frame", frame)) {
-                RCLCPP_WARN(nh_->get_logger(), "IMU frame not specified");
-              }
-              driver->setTools(model_number_specified_16, id);
-              ImuHardwareInterface *interface = new ImuHardwareInterface(nh_, driver, id, topic, frame, name);
-              /* Hardware interfaces must be registered at the main RobotHW class.
-               * Therefore, a pointer to this class is passed down to the RobotHW classes
-               * registering further interfaces */
-              interfaces_on_port.push_back(interface);
-            } else if (model_number_specified == 0xBAFF && interface_type == "Button" && !only_pressure_) {
-              // Buttons
-              std::string topic;
-              if (!nh_->get_parameter("device_info." + name + ".topic", topic)) {
-                RCLCPP_WARN(nh_->get_logger(), "Button topic not specified");
-              }
-              int read_rate;
-              nh_->get_parameter("device_info." + name + ".read_rate", read_rate);
-              interfaces_on_port.push_back(new ButtonHardwareInterface(nh_, driver, id, topic, read_rate));
-            } else if ((model_number_specified == 0xBAFF || model_number_specified == 0xABBA) &&
-                       interface_type == "LED" && !only_pressure_) {
-              // LEDs
-              int number_of_LEDs, start_number;
-              nh_->get_parameter("device_info." + name + ".number_of_LEDs", number_of_LEDs);
-              nh_->get_parameter("device_info." + name + ".start_number", start_number);
-              interfaces_on_port.push_back(new LedsHardwareInterface(nh_, driver, id, number_of_LEDs, start_number));
-            } else if ((model_number_specified == 311 || model_number_specified == 321 ||
-                        model_number_specified == 1100) &&
-                       !only_pressure_ && !only_imu_) {
-              // Servos
-              // We need to add the tool to the driver for later reading and writing
-              driver->setTools(model_number_specified_16, id);
-              float mounting_offset;
-              nh_->get_parameter_or("device_info." + name + ".mounting_offset", mounting_offset, 0.0f);
-              float joint_offset;
-              nh_->get_parameter_or("device_info." + name + ".joint_offset", joint_offset, 0.0f);
-              std::string group;
-              nh_->get_parameter_or("device_info." + name + ".group", group, std::string("DEFAULT"));
-              servos_on_port.push_back(std::make_tuple(id, name, mounting_offset, joint_offset, group));
-            } else {
-              if (!only_pressure_ && !only_imu_) {
-                RCLCPP_WARN(nh_->get_logger(), "Could not identify device for ID %d", id);
-              }
-            }
-            pinged.push_back(name);
-          }
-          delete model_number_returned_16;
-        }
+      drivers.push_back(driver);
+      device_files.push_back(device_file);
+      baudrates.push_back(baudrate);
+      protocol_versions.push_back(protocol_version);
+      port_names_.push_back(port_name);
+    }
+  }
+
+  // ping the devices on all ports in parallel
+  // if we know where the devices were at the last start, only these are verified instead of pinging all on every port
+  LoopTiming::Clock::time_point discovery_start = LoopTiming::Clock::now();
+  std::vector<std::vector<FoundDevice>> devices_on_ports;
+  bool cache_verified = false;
+  if (use_device_cache_ && !device_cache_.empty()) {
+    devices_on_ports = discoverDevices(drivers, dxl_devices, true);
+    size_t found = 0;
+    for (const std::vector<FoundDevice> &devices : devices_on_ports) {
+      found += devices.size();
+    }
+    cache_verified = found == dxl_devices.size();
+    if (!cache_verified) {
+      RCLCPP_INFO(nh_->get_logger(), "Devices do not match the cached ones, searching on all ports");
+    }
+  }
+  if (!cache_verified) {
+    devices_on_ports = discoverDevices(drivers, dxl_devices, false);
+  }
+  RCLCPP_INFO(nh_->get_logger(), "Pinging the devices took %.3f s (%s)",
+              std::chrono::duration<double>(LoopTiming::Clock::now() - discovery_start).count(),
+              cache_verified ? "cached devices verified" : "all ports searched");
+
+  // add the found devices to the driver and create corresponding hardware interfaces
+  bool bulk_read;
+  nh_->get_parameter_or("read_schedule.bulk_read", bulk_read, true);
+  std::vector<std::string> pinged;
+  for (size_t port = 0; port < drivers.size(); port++) {
+    std::shared_ptr<DynamixelDriver> &driver = drivers[port];
+    const std::string &device_file = device_files[port];
+    std::vector<bitbots_ros_control::HardwareInterface *> interfaces_on_port;
+    std::vector<std::tuple<int, std::string, float, float, std::string>> servos_on_port;
+    for (const FoundDevice &device : devices_on_ports[port]) {
+      std::string name = device.name;
+      int id = device.id;
+      int model_number_specified;
+      nh_->get_parameter("device_info." + name + ".model_number", model_number_specified);
+      // some devices provide more than one type of interface, e.g. the IMU provides additionally buttons and LEDs
+      std::string interface_type;
+      nh_->get_parameter("device_info." + name + ".interface_type", interface_type);
+      uint16_t model_number_specified_16 = uint16_t(model_number_specified);
+      // check if the specified model number matches the actual model number of the device
+      if (model_number_specified_16 != device.model_number) {
+        RCLCPP_WARN(nh_->get_logger(), "Model number of id %d does not match", id);
       }
-      // create a servo bus interface if there were servos found on this bus
-      if (servos_on_port.size() > 0) {
-        ServoBusInterface *interface = new ServoBusInterface(nh_, driver, servos_on_port);
+      // ping was successful, add device correspondingly
+      // only add them if the mode is set correspondingly
+      // TODO maybe move more of the parameter stuff in the init of the modules instead of doing everything here
+      if (model_number_specified == 0xABBA && interface_type == "CORE") {
+        // CORE
+        int read_rate;
+        nh_->get_parameter("device_info." + name + ".read_rate", read_rate);
+        driver->setTools(model_number_specified_16, id);
+        core_interface_ = new CoreHardwareInterface(nh_, driver, id, read_rate);
+        // turn on power, just to be sure
+        core_interface_->write(nh_->get_clock()->now(), rclcpp::Duration::from_nanoseconds(1e9 * 0));
+        interfaces_on_port.push_back(core_interface_);
+        core_present_ = true;
+      } else if (model_number_specified == 0 && !only_imu_) {  // model number is currently 0 on foot sensors
+        // bitfoot
+        std::string topic;
+        if (!nh_->get_parameter("device_info." + name + ".topic", topic)) {
+          RCLCPP_WARN(nh_->get_logger(), "Bitfoot topic not specified");
+        }
+        BitFootHardwareInterface *interface = new BitFootHardwareInterface(nh_, driver, id, topic, name);
+        interfaces_on_port.push_back(interface);
+      } else if (model_number_specified == 0xBAFF && interface_type == "IMU" && !only_pressure_) {
+        // IMU
+        std::string topic;
+        if (!nh_->get_parameter("device_info." + name + ".topic", topic)) {
+          RCLCPP_WARN(nh_->get_logger(), "IMU topic not specified");
+        }
+        std::string frame;
+        if (!nh_->get_parameter("device_info." + name + ".frame", frame)) {
+          RCLCPP_WARN(nh_->get_logger(), "IMU frame not specified");
+        }
+        driver->setTools(model_number_specified_16, id);
+        ImuHardwareInterface *interface = new ImuHardwareInterface(nh_, driver, id, topic, frame, name);
+        /* Hardware interfaces must be registered at the main RobotHW class.
+         * Therefore, a pointer to this class is passed down to the RobotHW classes
+         * registering further interfaces */
         interfaces_on_port.push_back(interface);
-        servo_interface_.addBusInterface(interface);
+      } else if (model_number_specified == 0xBAFF && interface_type == "Button" && !only_pressure_) {
+        // Buttons
+        std::string topic;
+        if (!nh_->get_parameter("device_info." + name + ".topic", topic)) {
+          RCLCPP_WARN(nh_->get_logger(), "Button topic not specified");
+        }
+        int read_rate;
+        nh_->get_parameter("device_info." + name + ".read_rate", read_rate);
+        interfaces_on_port.push_back(new ButtonHardwareInterface(nh_, driver, id, topic, read_rate));
+      } else if ((model_number_specified == 0xBAFF || model_number_specified == 0xABBA) && interface_type == "LED" &&
+                 !only_pressure_) {
+        // LEDs
+        int number_of_LEDs, start_number;
+        nh_->get_parameter("device_info." + name + ".number_of_LEDs", number_of_LEDs);
+        nh_->get_parameter("device_info." + name + ".start_number", start_number);
+        interfaces_on_port.push_back(new LedsHardwareInterface(nh_, driver, id, number_of_LEDs, start_number));
+      } else if ((model_number_specified == 311 || model_number_specified == 321 || model_number_specified == 1100) &&
+                 !only_pressure_ && !only_imu_) {
+        // Servos
+        // We need to add the tool to the driver for later reading and writing
+        driver->setTools(model_number_specified_16, id);
+        float mounting_offset;
+        nh_->get_parameter_or("device_info." + name + ".mounting_offset", mounting_offset, 0.0f);
+        float joint_offset;
+        nh_->get_parameter_or("device_info." + name + ".joint_offset", joint_offset, 0.0f);
+        std::string group;
+        nh_->get_parameter_or("device_info." + name + ".group", group, std::string("DEFAULT"));
+        servos_on_port.push_back(std::make_tuple(id, name, mounting_offset, joint_offset, group));
+      } else {
+        if (!only_pressure_ && !only_imu_) {
+          RCLCPP_WARN(nh_->get_logger(), "Could not identify device for ID %d", id);
+        }
       }
-      // add vector of interfaces on this port to overall collection of interfaces
-      interfaces_.push_back(interfaces_on_port);
+      pinged.push_back(name);
+    }
+    // create a servo bus interface if there were servos found on this bus
+    if (servos_on_port.size() > 0) {
+      ServoBusInterface *interface = new ServoBusInterface(nh_, driver, servos_on_port);
+      interfaces_on_port.push_back(interface);
+      servo_interface_.addBusInterface(interface);
+    }
+    // merge the register windows of each device on this port into as few reads as possible
+    auto device_reads = std::make_shared<DeviceReadScheduler>(driver, nh_->get_logger());
+    // has to be enabled before the interfaces add their windows, the servos are only part of a bulk read
+    if (bulk_read && protocol_versions[port] == 2 && !device_reads->enableBulkRead(device_file, baudrates[port])) {
+      RCLCPP_WARN(nh_->get_logger(), "Could not open %s for bulk reads, reading each device on its own",
+                  device_file.c_str());
     }
+    for (HardwareInterface *interface : interfaces_on_port) {
+      interface->addDeviceReads(device_reads.get());
+      interface->setDiagnostics(diagnostics_.get());
+      interface->setRecorder(recorder_.get());
+      interface->setParameters(parameters_.get());
+    }
+    device_reads->plan();
+    RCLCPP_DEBUG(nh_->get_logger(), "Port %s is read with %zu register reads%s", device_file.c_str(),
+                 device_reads->getTransactionCount(), device_reads->isBulkReadEnabled() ? " in one bulk read" : "");
+    device_reads_.push_back(device_reads);
+    // add vector of interfaces on this port to overall collection of interfaces
+    interfaces_.push_back(interfaces_on_port);
   }
 
   if (pinged.size() != dxl_devices.size()) {
@@ -215,11 +306,118 @@ bool WolfgangHardwareInterface::create_interfaces(std::vector<std::pair<std::str
     }
     return false;
   } else {
+    if (use_device_cache_ && !cache_verified) {
+      saveDeviceCache(devices_on_ports);
+    }
+    if (recorder_) {
+      // the model numbers are needed to convert the recorded servo values
+      std::vector<black_box::DeviceInfo> devices;
+      for (const std::vector<FoundDevice> &devices_on_port : devices_on_ports) {
+        for (const FoundDevice &device : devices_on_port) {
+          if (devices.size() < black_box::MAX_SOURCE_INFO / sizeof(black_box::DeviceInfo)) {
+            devices.push_back({device.model_number, uint8_t(device.id), 0});
+          }
+        }
+      }
+      recorder_->addSource("devices", devices.data(), devices.size() * sizeof(black_box::DeviceInfo));
+    }
     speakError(speak_pub_, "ross control startup successful");
     return true;
   }
 }
 
+void threaded_ping(std::shared_ptr<DynamixelDriver> driver, const std::vector<int> &ids,
+                   std::map<int, uint16_t> &found) {
+  for (int id : ids) {
+    uint16_t model_number;
+    if (driver->ping(uint8_t(id), &model_number)) {
+      found[id] = model_number;
+    }
+  }
+}
+
+std::vector<std::vector<WolfgangHardwareInterface::FoundDevice>> WolfgangHardwareInterface::discoverDevices(
+    const std::vector<std::shared_ptr<DynamixelDriver>> &drivers,
+    const std::vector<std::pair<std::string, int>> &dxl_devices, bool only_cached) {
+  /**
+   * Pings the devices on all ports at the same time, each id only once per port.
+   * If only_cached is set, only the devices which are in the cache for a port are pinged on it.
+   * A device is assigned to the first port on which its id answered, like when pinging the ports one after another.
+   */
+  auto is_cached = [this](size_t port, const std::string &name) {
+    auto cached = device_cache_.find(port_names_[port]);
+    return cached != device_cache_.end() &&
+           std::find(cached->second.begin(), cached->second.end(), name) != cached->second.end();
+  };
+  std::vector<std::vector<int>> ids_to_ping(drivers.size());
+  for (size_t port = 0; port < drivers.size(); port++) {
+    for (const std::pair<std::string, int> &device : dxl_devices) {
+      // some devices share an id, e.g. the IMU and its LEDs
+      if ((!only_cached || is_cached(port, device.first)) &&
+          std::find(ids_to_ping[port].begin(), ids_to_ping[port].end(), device.second) == ids_to_ping[port].end()) {
+        ids_to_ping[port].push_back(device.second);
+      }
+    }
+  }
+  std::vector<std::map<int, uint16_t>> found(drivers.size());
+  std::vector<std::thread> threads;
+  for (size_t port = 0; port < drivers.size(); port++) {
+    threads.push_back(std::thread(threaded_ping, drivers[port], std::cref(ids_to_ping[port]), std::ref(found[port])));
+  }
+  for (std::thread &thread : threads) {
+    thread.join();
+  }
+
+  std::vector<std::vector<FoundDevice>> devices_on_ports(drivers.size());
+  for (const std::pair<std::string, int> &device : dxl_devices) {
+    for (size_t port = 0; port < drivers.size(); port++) {
+      auto answer = found[port].find(device.second);
+      if ((!only_cached || is_cached(port, device.first)) && answer != found[port].end()) {
+        devices_on_ports[port].push_back({device.first, device.second, answer->second});
+        break;
+      }
+    }
+  }
+  return devices_on_ports;
+}
+
+void WolfgangHardwareInterface::loadDeviceCache() {
+  device_cache_.clear();
+  try {
+    YAML::Node cache = YAML::LoadFile(device_cache_file_);
+    for (const auto &port : cache) {
+      device_cache_[port.first.as<std::string>()] = port.second.as<std::vector<std::string>>();
+    }
+  } catch (const YAML::Exception &) {
+    // there is no cache on the first start
+    RCLCPP_INFO(nh_->get_logger(), "No device cache loaded from %s, searching on all ports",
+                device_cache_file_.c_str());
+    device_cache_.clear();
+  }
+}
+
+void WolfgangHardwareInterface::saveDeviceCache(const std::vector<std::vector<FoundDevice>> &devices_on_ports) {
+  device_cache_.clear();
+  YAML::Emitter e;
+  e << YAML::BeginMap;
+  for (size_t port = 0; port < devices_on_ports.size(); port++) {
+    std::vector<std::string> names;
+    for (const FoundDevice &device : devices_on_ports[port]) {
+      names.push_back(device.name);
+    }
+    e << YAML::Key << port_names_[port];
+    e << YAML::Value << YAML::Flow << names;
+    device_cache_[port_names_[port]] = names;
+  }
+  e << YAML::EndMap;
+
+  std::ofstream cache_file(device_cache_file_);
+  cache_file << e.c_str() << std::endl;
+  if (!cache_file) {
+    RCLCPP_WARN(nh_->get_logger(), "Could not write the device cache to %s", device_cache_file_.c_str());
+  }
+}
+
 void threaded_init(const std::vector<HardwareInterface *> &port_interfaces, rclcpp::Node::SharedPtr &nh, int &success) {
   success = std::all_of(port_interfaces.begin(), port_interfaces.end(),
                         [](HardwareInterface *interface) -> bool { return interface->init(); });
@@ -246,13 +444,121 @@ bool WolfgangHardwareInterface::init() {
   bool success = std::all_of(successes.begin(), successes.end(), [](int *s) { return *s; });
   // init servo interface last after all servo busses are there
   success &= servo_interface_.init();
+
+  // distribute the low rate tasks of all interfaces over the cycles, the rates are known after the init
+  cycle_scheduler_.clear();
+  for (size_t port = 0; port < interfaces_.size(); port++) {
+    device_reads_[port]->addScheduledTasks(&cycle_scheduler_, port);
+    for (HardwareInterface *interface : interfaces_[port]) {
+      interface->addScheduledTasks(&cycle_scheduler_, port);
+    }
+  }
+  bool stagger;
+  nh_->get_parameter_or("read_schedule.stagger", stagger, true);
+  cycle_scheduler_.plan(stagger);
+  publishSchedule();
+
+  // all status messages are registered by the interfaces now
+  diagnostics_->start();
+
+  // start one persistent worker per port which will do the reading and writing in the control loop
+  std::vector<int64_t> cpu_affinity;
+  int priority;
+  nh_->get_parameter_or("port_workers.cpu_affinity", cpu_affinity, std::vector<int64_t>());
+  nh_->get_parameter_or("port_workers.priority", priority, 0);
+  if (!port_workers_.start(interfaces_.size(), std::bind(&WolfgangHardwareInterface::runPortPhase, this, _1, _2),
+                           cpu_affinity, priority)) {
+    for (const std::string &error : port_workers_.getErrors()) {
+      RCLCPP_WARN(nh_->get_logger(), "%s", error.c_str());
+    }
+  }
   return success;
 }
 
-void threaded_read(const std::vector<HardwareInterface *> &port_interfaces, const rclcpp::Time &t,
-                   const rclcpp::Duration &dt) {
-  for (HardwareInterface *interface : port_interfaces) {
-    interface->read(t, dt);
+void WolfgangHardwareInterface::publishSchedule() {
+  /**
+   * Publishes the plan of the cycle scheduler with one status per port
+   */
+  diagnostic_msgs::msg::DiagnosticArray array_msg;
+  array_msg.header.stamp = nh_->get_clock()->now();
+  for (size_t port = 0; port < interfaces_.size(); port++) {
+    diagnostic_msgs::msg::DiagnosticStatus status;
+    status.name = port_names_[port];
+    status.hardware_id = port_names_[port];
+    status.level = diagnostic_msgs::msg::DiagnosticStatus::OK;
+    for (const CycleScheduler::Entry &entry : cycle_scheduler_.getEntries()) {
+      if (entry.port != port) {
+        continue;
+      }
+      diagnostic_msgs::msg::KeyValue key_value;
+      key_value.key = entry.name;
+      key_value.value = "rate " + std::to_string(entry.task->rate) + ", offset " + std::to_string(entry.task->offset) +
+                        ", cost " + std::to_string(entry.cost) + " bytes";
+      status.values.push_back(key_value);
+    }
+    std::vector<int> load = cycle_scheduler_.getLoad(port);
+    int peak = *std::max_element(load.begin(), load.end());
+    int sum = std::accumulate(load.begin(), load.end(), 0);
+    status.message =
+        "peak " + std::to_string(peak) + " bytes, mean " + std::to_string(sum / int(load.size())) + " bytes per cycle";
+    diagnostic_msgs::msg::KeyValue load_value;
+    load_value.key = "load per cycle";
+    for (size_t cycle = 0; cycle < load.size(); cycle++) {
+      load_value.value += (cycle == 0 ? "" : " ") + std::to_string(load[cycle]);
+    }
+    status.values.push_back(load_value);
+    array_msg.status.push_back(status);
+  }
+  schedule_pub_->publish(array_msg);
+}
+
+void WolfgangHardwareInterface::setTiming(LoopTiming *timing) {
+  timing_ = timing;
+  port_read_phases_.clear();
+  port_write_phases_.clear();
+  for (const std::string &port_name : port_names_) {
+    port_read_phases_.push_back(timing_->addPhase("read " + port_name));
+    port_write_phases_.push_back(timing_->addPhase("write " + port_name));
+  }
+  servo_read_phase_ = timing_->addPhase("servo aggregation");
+  servo_write_phase_ = timing_->addPhase("servo write preparation");
+  core_read_phase_ = timing_->addPhase("read CORE (power off)");
+}
+
+void WolfgangHardwareInterface::readPort(size_t port) {
+  LoopTiming::Clock::time_point start = LoopTiming::Clock::now();
+  device_reads_[port]->read();
+  for (HardwareInterface *interface : interfaces_[port]) {
+    interface->read(cycle_time_, cycle_period_);
+  }
+  if (timing_) {
+    timing_->record(port_read_phases_[port], start, LoopTiming::Clock::now());
+  }
+}
+
+void WolfgangHardwareInterface::writePort(size_t port) {
+  LoopTiming::Clock::time_point start = LoopTiming::Clock::now();
+  for (HardwareInterface *interface : interfaces_[port]) {
+    interface->write(cycle_time_, cycle_period_);
+  }
+  if (timing_) {
+    timing_->record(port_write_phases_[port], start, LoopTiming::Clock::now());
+  }
+}
+
+void WolfgangHardwareInterface::runPortPhase(size_t port, int phase) {
+  /**
+   * This is executed by the worker thread of each port
+   */
+  if (phase == PORT_READ) {
+    readPort(port);
+  } else if (phase == PORT_WRITE) {
+    writePort(port);
+  } else if (phase == PORT_WRITE_READ) {
+    writePort(port);
+    // the control loop can continue as soon as all ports are written, the reads run in the background
+    port_workers_.signalHandoff(port);
+    readPort(port);
   }
 }
 
@@ -265,60 +571,96 @@ void WolfgangHardwareInterface::read(const rclcpp::Time &t, const rclcpp::Durati
       speakError(speak_pub_, "Power switched off!");
     }
   }
+  // in pipelined mode the reads were already started after the last write, we only have to wait for them
+  // the bus interfaces write the read values into the joint state messages, which are only published after this
+  bool prefetched = false;
+  if (reads_in_flight_) {
+    port_workers_.wait();
+    reads_in_flight_ = false;
+    prefetched = true;
+  }
+  // the next cycle of the black box only starts when no port worker records anymore, so that all records of the
+  // prefetched reads have the number of the cycle in which they were started
+  if (recorder_) {
+    recorder_->nextCycle();
+    cycle_start_ = LoopTiming::Clock::now();
+  }
+  // the cycle of the scheduled tasks advances when the reads of a cycle are started, the prefetched reads were started
+  // with it in write()
+  if (!prefetched) {
+    cycle_scheduler_.nextCycle();
+  }
   if (!core_present_ || current_power_status_) {
     // only read all hardware if power is on
-    std::vector<std::thread> threads;
-    // start all reads
-    for (std::vector<HardwareInterface *> &port_interfaces : interfaces_) {
-      threads.push_back(std::thread(threaded_read, std::ref(port_interfaces), std::ref(t), std::ref(dt)));
-    }
-    // wait for all reads to finish
-    for (std::thread &thread : threads) {
-      thread.join();
+    // the port workers read all ports in parallel, this returns after all reads are finished
+    if (!prefetched) {
+      cycle_time_ = t;
+      cycle_period_ = dt;
+      port_workers_.run(PORT_READ);
     }
     // aggregate all servo values for controller
+    LoopTiming::Clock::time_point start = LoopTiming::Clock::now();
     servo_interface_.read(t, dt);
+    if (timing_) {
+      timing_->record(servo_read_phase_, start, LoopTiming::Clock::now());
+    }
     if (core_present_) {
       last_power_status_ = current_power_status_;
       current_power_status_ = core_interface_->get_power_status();
     }
   } else {
     // read core to see if power is back on
+    LoopTiming::Clock::time_point start = LoopTiming::Clock::now();
     core_interface_->read(t, dt);
+    if (timing_) {
+      timing_->record(core_read_phase_, start, LoopTiming::Clock::now());
+    }
     last_power_status_ = current_power_status_;
     current_power_status_ = core_interface_->get_power_status();
     servo_interface_.read(t, dt);
   }
-}
-
-void threaded_write(const std::vector<HardwareInterface *> &port_interfaces, const rclcpp::Time &t,
-                    const rclcpp::Duration &dt) {
-  for (HardwareInterface *interface : port_interfaces) {
-    interface->write(t, dt);
+  if (recorder_) {
+    cycle_read_ns_ = std::chrono::nanoseconds(LoopTiming::Clock::now() - cycle_start_).count();
   }
 }
 
 void WolfgangHardwareInterface::write(const rclcpp::Time &t, const rclcpp::Duration &dt) {
-  if (core_present_ && !last_power_status_ && current_power_status_ &&
-      nh_->get_parameter("servos.set_ROM_RAM").as_bool()) {
+  LoopTiming::Clock::time_point write_start = LoopTiming::Clock::now();
+  // the reads are finished and the port workers wait, so they do not use the parameters while they change
+  parameters_->update();
+  if (core_present_ && !last_power_status_ && current_power_status_ && parameters_->get().set_rom_ram) {
     // when we can read the power and see that it was just switched on, we write the ROM RAM again
-    servo_interface_.writeROMRAM(false);
-  } else if (core_present_ && !current_power_status_) {
+    // this is spread over the next cycles by the bus interfaces, so the other devices are still written
+    servo_interface_.requestROMRAM();
+  }
+  if (core_present_ && !current_power_status_) {
     // if power is off only write CORE
     core_interface_->write(t, dt);
   } else {
     // write all controller values to interfaces
+    LoopTiming::Clock::time_point start = LoopTiming::Clock::now();
     servo_interface_.write(t, dt);
-    std::vector<std::thread> threads;
-    // start all writes
-    for (std::vector<HardwareInterface *> &port_interfaces : interfaces_) {
-      threads.push_back(std::thread(threaded_write, std::ref(port_interfaces), std::ref(t), std::ref(dt)));
+    if (timing_) {
+      timing_->record(servo_write_phase_, start, LoopTiming::Clock::now());
     }
-
-    // wait for all writes to finish
-    for (std::thread &thread : threads) {
-      thread.join();
+    // write all ports in parallel and wait till all writes are finished
+    cycle_time_ = t;
+    cycle_period_ = dt;
+    if (pipelined_) {
+      // each port directly continues with the read of the next cycle after its write,
+      // so the buses are busy while the ROS callbacks run and the loop sleeps
+      cycle_scheduler_.nextCycle();
+      port_workers_.dispatch(PORT_WRITE_READ);
+      port_workers_.waitHandoff();
+      reads_in_flight_ = true;
+    } else {
+      port_workers_.run(PORT_WRITE);
     }
   }
+  if (recorder_) {
+    black_box::CycleTiming timing = {dt.nanoseconds(), cycle_read_ns_,
+                                     std::chrono::nanoseconds(LoopTiming::Clock::now() - write_start).count()};
+    recorder_->record(cycle_source_, &timing, sizeof(timing));
+  }
 }
 }  // namespace bitbots_ros_control